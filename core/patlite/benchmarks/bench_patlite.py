@@ -0,0 +1,130 @@
+'''
+Benchmark the Patlite actions and status route against simulated devices.
+Every mode is run by several threads for a few seconds, and reports the
+number of operations per second and the latency percentiles.
+- direct: one connection per action (no pool, no scheduler)
+- action: the action plugin (connection pool and write scheduler)
+- status: the status route (status cache)
+Usage: python3 benchmarks/bench_patlite.py [--devices 4] [--threads 16] [--latency 0.005] ...
+'''
+
+import argparse
+import random
+import threading
+import time
+
+from patlite.utils.fanout import fan_out, resolve_targets
+from patlite.utils.patlite import Patlite, State
+from patlite.utils.pool import PatlitePool
+from patlite.utils.scheduler import WriteScheduler
+from patlite.utils.simulator import PatliteSimulator
+from patlite.utils.status import StatusCache
+
+def random_state(rand):
+    return State(**{rand.choice(['red', 'yellow', 'green']): rand.choice(['on', 'blink1']), 'sound': 'short'})
+
+def action_sender(scheduler):
+    '''Return a function running the Patlite action for one device'''
+    try:
+        from patlite.plugin import Patlite as PatlitePlugin
+        import patlite.utils.fanout as fanout
+        fanout.SCHEDULER = scheduler
+        plugin = object.__new__(PatlitePlugin)
+        def send(host, port, state):
+            options = {'host': host, 'port': port, 'lights': dict(state.mystate), 'sound': None}
+            _, failed = plugin.send([{}], options)
+            if failed:
+                raise RuntimeError("Action failed")
+    except ImportError:
+        # snooze server is not installed: run the same code as the action
+        print("(snooze is not installed, running the action code without the plugin class)")
+        def send(host, port, state):
+            results = fan_out(resolve_targets({'host': host, 'port': port}), state, scheduler=scheduler)
+            errors = [err for err in results.values() if err]
+            if errors:
+                raise errors[0]
+    return send
+
+def run(name, operation, devices, threads, duration):
+    '''Run `operation(host, port, rand)` from many threads, and print the results'''
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    def worker(index):
+        rand = random.Random(index)
+        mine = []
+        while time.monotonic() < deadline:
+            host, port = rand.choice(devices).server_address
+            start = time.perf_counter()
+            try:
+                operation(host, port, rand)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    latencies.sort()
+    def percentile(value):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(len(latencies) * value))] * 1000
+    print("{:<8} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.2f} {:>8}".format(
+        name, len(latencies) / duration, percentile(0.5), percentile(0.99), percentile(1) if latencies else 0, errors[0]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Patlite benchmark")
+    parser.add_argument('--devices', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--latency', type=float, default=0.005, help="Latency of the simulated devices")
+    parser.add_argument('--nak-rate', type=float, default=0.0)
+    parser.add_argument('--max-connections', type=int, default=None)
+    parser.add_argument('--modes', default='direct,action,status')
+    args = parser.parse_args()
+
+    devices = [
+        PatliteSimulator(latency=args.latency, nak_rate=args.nak_rate, max_connections=args.max_connections).start()
+        for _ in range(args.devices)
+    ]
+    pool = PatlitePool(timeout=5)
+    scheduler = WriteScheduler(pool)
+    status = StatusCache(pool)
+
+    def direct(host, port, rand):
+        with Patlite(host, port, timeout=5) as patlite:
+            patlite.set_full_state(random_state(rand))
+
+    send = action_sender(scheduler)
+    def action(host, port, rand):
+        send(host, port, random_state(rand))
+
+    def get_status(host, port, rand):
+        status.get(host, port)
+
+    modes = {'direct': direct, 'action': action, 'status': get_status}
+    print("{} device(s), {} thread(s), {}ms device latency".format(args.devices, args.threads, args.latency * 1000))
+    print("{:<8} {:>10} {:>10} {:>10} {:>10} {:>8}".format('mode', 'ops/s', 'p50 (ms)', 'p99 (ms)', 'max (ms)', 'errors'))
+    try:
+        for name in args.modes.split(','):
+            run(name, modes[name], devices, args.threads, args.duration)
+    finally:
+        status.stop()
+        pool.close()
+        for device in devices:
+            device.stop()
+    stats = scheduler.stats()
+    print("\nScheduler: {} requests, {} writes ({} saved), {} errors".format(
+        stats['requests'], stats['writes'], stats['writes_saved'], stats['errors']))
+    for device in devices:
+        print("Device {}:{}: {}".format(*device.server_address, device.stats))
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,8 @@ import falcon
 from snooze.plugins.core.basic.falcon.route import Route
 from snooze.utils.functions import authorize
 
-from patlite.utils.patlite import Patlite, PatliteError
+from patlite.utils.scheduler import SCHEDULER
+from patlite.utils.status import STATUS
 
 from logging import getLogger
 log = getLogger('snooze.patlite')
@@ -13,13 +14,19 @@ log = getLogger('snooze.patlite')
 class PatliteStatusRoute(Route):
     @authorize
     def on_get(self, req, resp):
+        '''
+        Return the cached state of a Patlite, with its age in seconds in the `Age` header.
+        The state is read from the device when `refresh=true` is given.
+        '''
         host = req.params.get('host')
         port = req.params.get('port')
+        refresh = req.get_param_as_bool('refresh') or False
         try:
-            with Patlite(host, int(port)) as api:
-                resp.media = api.get_state().mystate
-                resp.status = falcon.HTTP_OK
-                return
+            state, age = STATUS.get(host, int(port), refresh=refresh)
+            resp.media = state.mystate
+            resp.set_header('Age', str(int(age)))
+            resp.status = falcon.HTTP_OK
+            return
         except Exception as err:
             raise falcon.HTTPInternalServerError(
                 title="Error querying Patlite",
@@ -29,14 +36,23 @@ class PatliteStatusRoute(Route):
 class PatliteResetRoute(Route):
     @authorize
     def on_post(self, req, resp):
+        '''
+        Reset a Patlite. The reset goes through the scheduler, so that it is written
+        after the write in progress to the device, and replaces the writes still pending.
+        '''
         host = req.params.get('host')
         port = req.params.get('port')
         try:
-            with Patlite(host, int(port)) as api:
-                api.reset()
+            SCHEDULER.reset(host, int(port)).result(30)
         except Exception as err:
             log.exception(err)
             raise falcon.HTTPInternalServerError(
                 title="Error querying Patlite",
                 description=str(err),
             )
+
+class PatliteMetricsRoute(Route):
+    @authorize
+    def on_get(self, req, resp):
+        resp.media = SCHEDULER.stats()
+        resp.status = falcon.HTTP_OK
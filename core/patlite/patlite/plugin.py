@@ -1,6 +1,7 @@
 '''Action plugin to send alerts to a Patlite'''
 
-from patlite.utils.patlite import Patlite as PatliteAPI, State
+from patlite.utils.fanout import fan_out, resolve_targets
+from patlite.utils.patlite import State
 from snooze.plugins.core import Plugin
 from logging import getLogger, DEBUG
 log = getLogger('snooze.action.patlite')
@@ -13,9 +14,16 @@ class Patlite(Plugin):
         This is how the information will be printed on the web interface
         to represent this action.
         '''
-        host = options.get('host')
-        port = options.get('port')
-        output = host + ':' + str(port)
+        targets = []
+        if options.get('host'):
+            targets.append(options['host'] + ':' + str(options.get('port')))
+        if isinstance(options.get('targets'), list):
+            targets += [str(target) for target in options['targets']]
+        elif options.get('targets'):
+            targets.append(options['targets'])
+        if options.get('group'):
+            targets.append('group ' + options['group'])
+        output = ', '.join(targets)
         sound = options.get('sound')
         state = [k+': '+v for k, v in options.get('lights', {}).items() if v != 'off']
         if sound:
@@ -27,21 +35,27 @@ class Patlite(Plugin):
     def send(self, records, options):
         '''
         Determine the action that will be taken when this action is invoked.
-        It will set the lights and alarm of the Patlite.
+        It will set the lights and alarm of every Patlite targeted, concurrently.
+        The records are failed if any of the Patlite could not be set, or if the
+        action targets no Patlite.
         '''
         lights = options.get('lights')
         sound = options.get('sound')
         state = lights.copy()
         if sound:
             state['sound'] = sound
-        host = options.get('host')
-        port = int(options.get('port'))
-        log.debug("Will execute action patlite `%s:%s` state=%s", host, port, state)
         succeeded = records
         failed = []
         try:
-            with PatliteAPI(host, port=port) as patlite:
-                patlite.set_full_state(State(**state))
+            targets = resolve_targets(options)
+            log.debug("Will execute action patlite on %d device(s) state=%s", len(targets), state)
+            results = fan_out(targets, State(**state))
+            errors = {target: err for target, err in results.items() if err is not None}
+            if errors:
+                log.error("Patlite action failed on %d/%d device(s): %s", len(errors), len(targets),
+                    ', '.join('{}:{} ({})'.format(host, port, err) for (host, port), err in errors.items()))
+                succeeded = []
+                failed = records
         except Exception as err:
             log.exception(err)
             succeeded = []
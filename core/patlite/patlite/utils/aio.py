@@ -0,0 +1,93 @@
+'''Asyncio client for Patlite devices'''
+
+import asyncio
+from logging import getLogger
+
+from patlite.utils.patlite import State, PatliteError, READ, WRITE_HEADER, ACK, NAK, STATE_SIZE
+
+log = getLogger('snooze.action.patlite')
+
+class AsyncPatlite:
+    '''
+    Asyncio version of the Patlite client.
+    Every reply is read with its exact length, and every step (connection,
+    sending, reading) is limited by `timeout` seconds, so that many devices
+    can be driven from one event loop without blocking.
+    '''
+    def __init__(self, host, port=10000, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def connect(self):
+        '''Open the connection to the Patlite'''
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def close(self):
+        '''Close the connection to the Patlite'''
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+    async def request(self, data, size):
+        '''Send a command, and return the reply of exactly `size` bytes'''
+        self.writer.write(data)
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        try:
+            return await asyncio.wait_for(self.reader.readexactly(size), self.timeout)
+        except asyncio.IncompleteReadError as err:
+            raise ConnectionError("Connection closed by the Patlite after {} byte(s)".format(len(err.partial)))
+
+    async def read(self):
+        '''Read the raw data for the state'''
+        return await self.request(READ, STATE_SIZE)
+
+    async def get_state(self):
+        '''Get current status from Patlite'''
+        data = await self.read()
+        log.debug("Received state data: %s", data)
+        return State.unpack(data)
+
+    async def set_full_state(self, state):
+        '''Set the full state of the Patlite'''
+        data = state.pack()
+        log.debug("Sending data to Patlite: %s", data)
+        ret = await self.request(WRITE_HEADER + data, len(ACK))
+        if ret == ACK:
+            pass
+        elif ret == NAK:
+            raise PatliteError("Received NAK")
+        else:
+            raise PatliteError("Unknown return code from Patlite: {}".format(ret))
+
+    async def reset(self):
+        '''Reset the Patlite state'''
+        await self.set_full_state(State())
+
+async def set_states(targets, state, timeout=10):
+    '''
+    Set the state of many devices concurrently, with one connection each.
+    Return a dict of (host, port) => error, or None if the write succeeded.
+    '''
+    async def set_state(host, port):
+        async with AsyncPatlite(host, port, timeout) as patlite:
+            await patlite.set_full_state(state)
+    results = await asyncio.gather(*[set_state(host, port) for host, port in targets], return_exceptions=True)
+    return {
+        target: result if isinstance(result, Exception) else None
+        for target, result in zip(targets, results)
+    }
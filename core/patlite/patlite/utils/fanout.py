@@ -0,0 +1,105 @@
+'''Send a state to many Patlite devices at once'''
+
+import os
+import threading
+from logging import getLogger
+from pathlib import Path
+
+import yaml
+
+from patlite.utils.scheduler import SCHEDULER
+
+log = getLogger('snooze.action.patlite')
+
+DEFAULT_PORT = 10000
+
+class TargetGroups:
+    '''
+    Named groups of devices, read from a YAML file at `/etc/snooze/server/patlite.yaml`
+    (or the value of the `SNOOZE_PATLITE_CONFIG` environment variable):
+        groups:
+            noc-floor1: ['patlite01', 'patlite02:10001']
+    The file is read again when it changes.
+    '''
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get('SNOOZE_PATLITE_CONFIG') or '/etc/snooze/server/patlite.yaml')
+        self.groups = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        '''Return the targets of a group, or None if the group does not exist'''
+        with self.lock:
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self.mtime:
+                self.mtime = mtime
+                self.groups = self.load()
+            return self.groups.get(name)
+
+    def load(self):
+        '''Load the groups from the configuration file'''
+        try:
+            with self.path.open('r') as myfile:
+                config = yaml.safe_load(myfile.read()) or {}
+            groups = config.get('groups') or {}
+            return {str(name): parse_targets(targets) for name, targets in groups.items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as err:
+            log.warning("Error loading Patlite groups from %s: %s", self.path, err)
+            return {}
+
+GROUPS = TargetGroups()
+
+def parse_target(target, port=DEFAULT_PORT):
+    '''Return the (host, port) of a `host` or `host:port` target'''
+    host, sep, target_port = str(target).strip().rpartition(':')
+    if not sep:
+        return (target_port, int(port))
+    return (host, int(target_port))
+
+def parse_targets(targets, port=DEFAULT_PORT):
+    '''Return the list of (host, port) from a list of targets, or a comma separated string'''
+    if isinstance(targets, str):
+        targets = targets.split(',')
+    return [parse_target(target, port) for target in targets or [] if str(target).strip()]
+
+def resolve_targets(options, groups=GROUPS):
+    '''
+    Return the unique (host, port) targets of an action, from its `host`/`port`,
+    `targets` and `group` options.
+    Raise a ValueError if the action targets no Patlite.
+    '''
+    port = int(options.get('port') or DEFAULT_PORT)
+    targets = []
+    if options.get('host'):
+        targets.append((options['host'], port))
+    targets += parse_targets(options.get('targets'), port)
+    group = options.get('group')
+    if group:
+        members = groups.get(group)
+        if members is None:
+            raise ValueError("Unknown Patlite group '{}'".format(group))
+        targets += members
+    if not targets:
+        raise ValueError("No Patlite to set: the action needs a host, targets or a group")
+    return list(dict.fromkeys(targets))
+
+def fan_out(targets, state, scheduler=SCHEDULER, timeout=30):
+    '''
+    Write a state to all the targets concurrently.
+    Return a dict of (host, port) => error, or None if the write succeeded.
+    '''
+    futures = {target: scheduler.submit(target[0], target[1], state) for target in targets}
+    results = {}
+    for (host, port), future in futures.items():
+        try:
+            future.result(timeout)
+            results[(host, port)] = None
+        except Exception as err:
+            log.warning("Could not set the state of Patlite %s:%s: %s", host, port, err)
+            results[(host, port)] = err
+    return results
@@ -1,12 +1,13 @@
 '''A module to change patlite lights'''
 
 import time
+import select
 import struct
 import sys
 from logging import getLogger, DEBUG
 
 from enum import Enum
-from socket import socket, AF_INET, SOCK_STREAM
+from socket import socket, AF_INET, SOCK_STREAM, MSG_PEEK
 
 log = getLogger('snooze.action.patlite')
 log.setLevel(DEBUG)
@@ -40,6 +41,7 @@ READ = b'\x58\x58\x47\x00\x00\x00'
 WRITE_HEADER = b'\x58\x58\x53\x00\x00\x06'
 ACK = b'\x06'
 NAK = b'\x15'
+STATE_SIZE = 6
 
 # Light
 OFF    = b'\x00' # ________________
@@ -74,6 +76,10 @@ BEEP_TO_CODE = {
 CODE_TO_BEEP = {v: k for k, v in BEEP_TO_CODE.items() }
 CODE_TO_LIGHT = {v: k for k, v in LIGHT_TO_CODE.items() }
 
+# Severity of the patterns, when merging several states
+LIGHT_SEVERITY = ['off', 'on', 'blink1', 'blink2']
+BEEP_SEVERITY = ['off', 'tiny', 'short', 'long', 'beep']
+
 class PatliteError(RuntimeError): pass
 
 class State:
@@ -97,6 +103,20 @@ class State:
             + ']'
         )
 
+    @staticmethod
+    def merge(states):
+        '''
+        Merge several states into one, keeping the most severe pattern
+        of every light and of the sound.
+        '''
+        mydict = {}
+        for state in states:
+            for key, alias in state.mystate.items():
+                severity = BEEP_SEVERITY if key == 'sound' else LIGHT_SEVERITY
+                if key not in mydict or severity.index(alias) > severity.index(mydict[key]):
+                    mydict[key] = alias
+        return State(**mydict)
+
     @staticmethod
     def unpack(data):
         '''Unpack a bytestring and return a State object'''
@@ -127,15 +147,47 @@ class Patlite:
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.sock = None
 
     def __enter__(self):
-        self.sock = socket(AF_INET, SOCK_STREAM)
-        self.sock.settimeout(self.timeout)
-        self.sock.connect((self.host, self.port))
+        self.connect()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.sock.close()
+        self.close()
+
+    def connect(self):
+        '''Open the connection to the Patlite'''
+        self.sock = socket(AF_INET, SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        try:
+            self.sock.connect((self.host, self.port))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        '''Close the connection to the Patlite'''
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def is_alive(self):
+        '''
+        Return True if the connection is open and usable: the Patlite did not
+        close it, and there is no unexpected data waiting to be read.
+        '''
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if not readable:
+                return True
+            # Either the connection was closed (empty read), or there is leftover data
+            self.sock.recv(1, MSG_PEEK)
+            return False
+        except (OSError, ValueError):
+            return False
 
     def get_state(self):
         '''Get current status from Patlite'''
@@ -144,10 +196,20 @@ class Patlite:
         state = State.unpack(data)
         return state
 
+    def recv_exactly(self, size):
+        '''Receive exactly `size` bytes, the replies of the Patlite may be split in several packets'''
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by the Patlite")
+            data += chunk
+        return data
+
     def read(self):
         '''Read the raw data for the state'''
         self.sock.sendall(READ)
-        data = self.sock.recv(512)
+        data = self.recv_exactly(STATE_SIZE)
         return data
 
     def set_full_state(self, state):
@@ -156,7 +218,7 @@ class Patlite:
         data = state.pack()
         log.debug("Sending data to Patlite: %s", data)
         self.sock.sendall(WRITE_HEADER + data)
-        ret = self.sock.recv(512)
+        ret = self.recv_exactly(len(ACK))
         if ret == ACK:
             pass
         elif ret == NAK:
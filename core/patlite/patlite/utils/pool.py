@@ -0,0 +1,85 @@
+'''Process-wide pool of persistent connections to Patlite devices'''
+
+import threading
+import time
+from contextlib import contextmanager
+from logging import getLogger
+
+from patlite.utils.patlite import Patlite
+
+log = getLogger('snooze.action.patlite')
+
+class PooledPatlite:
+    '''A persistent connection to a Patlite, used by one thread at a time'''
+    def __init__(self, host, port, timeout):
+        self.patlite = Patlite(host, port=port, timeout=timeout)
+        self.lock = threading.Lock()
+        self.last_used = 0
+
+class PatlitePool:
+    '''
+    Keep one persistent connection per (host, port).
+    Each device has its own lock, so that requests to the same device are
+    serialized, while different devices are used in parallel. Connections
+    are checked before use, and reopened when closed by the device, idle
+    for more than `max_idle` seconds, or after an error.
+    '''
+    def __init__(self, timeout=10, max_idle=60, retries=1):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.retries = retries
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def get(self, host, port):
+        '''Return the pooled connection of a device, creating it if needed'''
+        key = (host, int(port))
+        with self.lock:
+            if key not in self.devices:
+                self.devices[key] = PooledPatlite(host, int(port), self.timeout)
+            return self.devices[key]
+
+    @contextmanager
+    def connection(self, host, port):
+        '''
+        Lock a device and return its connected Patlite.
+        The connection is closed if an error occurs while it is used.
+        '''
+        device = self.get(host, port)
+        with device.lock:
+            patlite = device.patlite
+            if time.monotonic() - device.last_used > self.max_idle or not patlite.is_alive():
+                patlite.close()
+                log.debug("Connecting to Patlite %s:%s", host, port)
+                patlite.connect()
+            try:
+                yield patlite
+            except Exception:
+                patlite.close()
+                raise
+            finally:
+                device.last_used = time.monotonic()
+
+    def run(self, host, port, method, *args):
+        '''
+        Call `method(patlite, *args)` with the connection of a device.
+        Connection errors are retried on a new connection, so methods must be idempotent.
+        '''
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection(host, port) as patlite:
+                    return method(patlite, *args)
+            except OSError as err:
+                if attempt >= self.retries:
+                    raise
+                log.warning("Error with Patlite %s:%s, reconnecting: %s", host, port, err)
+
+    def close(self):
+        '''Close all the connections'''
+        with self.lock:
+            for device in self.devices.values():
+                with device.lock:
+                    device.patlite.close()
+            self.devices.clear()
+
+POOL = PatlitePool()
@@ -0,0 +1,174 @@
+'''Coalesce the writes to Patlite devices'''
+
+import heapq
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+
+from patlite.utils.patlite import Patlite, State
+from patlite.utils.pool import POOL
+
+log = getLogger('snooze.action.patlite')
+
+class PendingWrite:
+    '''States waiting to be written to a device (merged with a reset, when `reset` is set)'''
+    def __init__(self):
+        self.states = []
+        self.futures = []
+        self.submitted = []
+        self.reset = False
+
+    def add(self, state, future):
+        self.states.append(state)
+        self.futures.append(future)
+        self.submitted.append(time.monotonic())
+
+class WriteScheduler:
+    '''
+    Merge the states requested for a device within `window` seconds, and
+    write the result to the device only once.
+    Every light and the sound are set to the most severe pattern requested.
+    The writes to different devices are done in parallel, by up to `workers` threads,
+    and the writes to a device are done one at a time, in order.
+    The functions in `listeners` are called with `(host, port, state)` after
+    every successful write.
+    '''
+    def __init__(self, pool=POOL, window=0.1, workers=16):
+        self.pool = pool
+        self.window = window
+        self.pending = {}
+        self.device_locks = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.deadlines = []
+        self.dispatcher = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='patlite')
+        self.requests = 0
+        self.completed = 0
+        self.writes = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def submit(self, host, port, state):
+        '''
+        Schedule the write of a state to a device.
+        Return a Future, resolved with the state actually written.
+        '''
+        key = (host, int(port))
+        future = Future()
+        with self.lock:
+            self.requests += 1
+            self._pending(key, self.window).add(state, future)
+        return future
+
+    def reset(self, host, port):
+        '''
+        Schedule the reset of a device, without waiting for the window.
+        The states still waiting to be written to the device are dropped (their futures
+        are resolved with the reset), and the reset is written after the write in progress.
+        Return a Future, resolved with the state actually written.
+        '''
+        key = (host, int(port))
+        future = Future()
+        with self.lock:
+            self.requests += 1
+            pending = self._pending(key, 0)
+            pending.states = []
+            pending.reset = True
+            pending.futures.append(future)
+            pending.submitted.append(time.monotonic())
+        return future
+
+    def _pending(self, key, delay):
+        '''Return the pending write of a device, scheduled in `delay` seconds at the latest'''
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = PendingWrite()
+        elif delay >= self.window:
+            return pending
+        heapq.heappush(self.deadlines, (time.monotonic() + delay, key))
+        self.wakeup.notify()
+        if self.dispatcher is None:
+            self.dispatcher = threading.Thread(target=self.dispatch, name='patlite-scheduler', daemon=True)
+            self.dispatcher.start()
+        return pending
+
+    def dispatch(self):
+        '''Give the devices to the workers when their window is over'''
+        with self.wakeup:
+            while True:
+                if not self.deadlines:
+                    self.wakeup.wait()
+                    continue
+                deadline, key = self.deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.wakeup.wait(delay)
+                    continue
+                heapq.heappop(self.deadlines)
+                self.executor.submit(self.flush, key)
+
+    def set_full_state(self, host, port, state, timeout=None):
+        '''Write a state to a device, and wait for the merged write to be done'''
+        return self.submit(host, port, state).result(timeout)
+
+    def flush(self, key):
+        '''Write the merged pending states of a device, after the write in progress to the device'''
+        with self.lock:
+            device_lock = self.device_locks.setdefault(key, threading.Lock())
+        with device_lock:
+            self._write(key)
+
+    def _write(self, key):
+        with self.lock:
+            pending = self.pending.pop(key, None)
+        if pending is None:
+            return
+        host, port = key
+        state = State.merge(pending.states)
+        log.debug("Writing %s to Patlite %s:%s (%d request(s) merged%s)", state, host, port, len(pending.futures),
+            ', after a reset' if pending.reset else '')
+        error = None
+        try:
+            self.pool.run(host, port, Patlite.set_full_state, state)
+        except Exception as err:
+            error = err
+        done = time.monotonic()
+        if error is None:
+            for listener in self.listeners:
+                try:
+                    listener(host, port, state)
+                except Exception as err:
+                    log.warning("Error in write listener: %s", err)
+        with self.lock:
+            self.writes += 1
+            self.completed += len(pending.submitted)
+            if error:
+                self.errors += 1
+            for submitted in pending.submitted:
+                latency = done - submitted
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+        for future in pending.futures:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(state)
+
+    def stats(self):
+        '''Return the metrics of the scheduler'''
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'writes': self.writes,
+                'writes_saved': self.completed - self.writes,
+                'errors': self.errors,
+                'pending': self.requests - self.completed,
+                'latency_avg': self.latency_total / self.completed if self.completed else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+SCHEDULER = WriteScheduler()
@@ -0,0 +1,166 @@
+'''
+Simulator of a Patlite device, to test and benchmark without hardware.
+Usage: python3 -m patlite.utils.simulator [--port 10000] [--latency 0.01] [--nak-rate 0.05] [--max-connections 2]
+'''
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+from logging import getLogger
+
+from patlite.utils.patlite import State, READ, WRITE_HEADER, ACK, NAK, STATE_SIZE
+
+log = getLogger('snooze.patlite.simulator')
+
+class SimulatorHandler(socketserver.BaseRequestHandler):
+    '''Handle the commands of one connection to the simulator'''
+    def recv_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def reply(self, data):
+        '''Send a reply after the configured latency, possibly fragmented or cut'''
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.disconnect_rate and server.random() < server.disconnect_rate:
+            self.request.sendall(data[:len(data) // 2])
+            return False
+        if server.fragment:
+            for index in range(len(data)):
+                self.request.sendall(data[index:index+1])
+                time.sleep(0.001)
+        else:
+            self.request.sendall(data)
+        return True
+
+    def handle(self):
+        server = self.server
+        if not server.acquire():
+            return
+        try:
+            while True:
+                command = self.recv_exactly(len(READ))
+                if not command:
+                    return
+                if command == READ:
+                    server.count('reads')
+                    if not self.reply(server.state):
+                        return
+                elif command == WRITE_HEADER:
+                    data = self.recv_exactly(STATE_SIZE)
+                    if data is None:
+                        return
+                    if server.nak_rate and server.random() < server.nak_rate:
+                        server.count('naks')
+                        ok = self.reply(NAK)
+                    else:
+                        server.count('writes')
+                        server.state = data
+                        ok = self.reply(ACK)
+                    if not ok:
+                        return
+                else:
+                    log.debug("Unknown command: %s", command)
+                    return
+                if server.close_after_request:
+                    return
+        finally:
+            server.release()
+
+class PatliteSimulator(socketserver.ThreadingTCPServer):
+    '''
+    TCP server speaking the Patlite protocol (READ, WRITE_HEADER, ACK/NAK).
+    - latency: seconds to wait before every reply
+    - nak_rate: probability to reply NAK to a write
+    - disconnect_rate: probability to close the connection in the middle of a reply
+    - max_connections: connections above this limit are closed right away
+    - close_after_request: close the connection after every reply
+    - fragment: send the replies one byte at a time
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, nak_rate=0.0, disconnect_rate=0.0,
+            max_connections=None, close_after_request=False, fragment=False, seed=None):
+        self.latency = latency
+        self.nak_rate = nak_rate
+        self.disconnect_rate = disconnect_rate
+        self.max_connections = max_connections
+        self.close_after_request = close_after_request
+        self.fragment = fragment
+        self.state = State().pack()
+        self.stats = {'connections': 0, 'refused': 0, 'reads': 0, 'writes': 0, 'naks': 0}
+        self.active = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.thread = None
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), SimulatorHandler)
+
+    @property
+    def connections(self):
+        return self.stats['connections']
+
+    def random(self):
+        with self.lock:
+            return self._random.random()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def acquire(self):
+        '''Count a new connection. Return False if over the limit'''
+        with self.lock:
+            if self.max_connections is not None and self.active >= self.max_connections:
+                self.stats['refused'] += 1
+                return False
+            self.active += 1
+            self.stats['connections'] += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def start(self):
+        '''Serve in a background thread'''
+        self.thread = threading.Thread(target=self.serve_forever, name='patlite-simulator', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''Stop serving'''
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Patlite device simulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before every reply")
+    parser.add_argument('--nak-rate', type=float, default=0.0, help="Probability to NAK a write")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Probability to cut a reply")
+    parser.add_argument('--max-connections', type=int, default=None)
+    parser.add_argument('--close-after-request', action='store_true')
+    args = parser.parse_args()
+    simulator = PatliteSimulator(args.host, args.port, args.latency, args.nak_rate, args.disconnect_rate,
+        args.max_connections, args.close_after_request)
+    print("Patlite simulator listening on {}:{}".format(*simulator.server_address))
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server_close()
+        print("Stats: {}".format(simulator.stats))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''Cache of the status of the Patlite devices, refreshed in the background'''
+
+import threading
+import time
+from logging import getLogger
+
+from patlite.utils.patlite import Patlite
+from patlite.utils.pool import POOL
+from patlite.utils.scheduler import SCHEDULER
+
+log = getLogger('snooze.patlite')
+
+class CachedStatus:
+    '''Last known state of a device'''
+    def __init__(self):
+        self.state = None
+        self.updated = None
+        self.requested = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def age(self):
+        '''Seconds since the state was read, or None if it never was'''
+        if self.updated is None:
+            return None
+        return time.monotonic() - self.updated
+
+class StatusCache:
+    '''
+    Serve the state of the devices from a cache, so that the load on a device
+    does not depend on the number of viewers.
+    The devices requested within the last `watch_timeout` seconds are polled
+    every `poll_interval` seconds by a background thread. A state older than
+    `ttl` seconds is read again from the device before being returned.
+    '''
+    def __init__(self, pool=POOL, ttl=10, poll_interval=5, watch_timeout=60):
+        self.pool = pool
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.watch_timeout = watch_timeout
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.poller = None
+        self.exit = threading.Event()
+
+    def entry(self, host, port):
+        '''Return the cache entry of a device, creating it if needed'''
+        key = (host, int(port))
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = CachedStatus()
+            return self.entries[key]
+
+    def get(self, host, port, refresh=False):
+        '''
+        Return the state of a device and its age in seconds.
+        The state is read from the device if `refresh` is set, or if the cached state is too old.
+        '''
+        self.start()
+        entry = self.entry(host, port)
+        entry.requested = time.monotonic()
+        age = entry.age
+        if refresh or age is None or age > self.ttl:
+            self.fetch(host, port, entry, max_age=0 if refresh else self.ttl)
+        return entry.state, entry.age
+
+    def fetch(self, host, port, entry, max_age=0):
+        '''Read the state of a device, unless another thread read it less than `max_age` seconds ago'''
+        with entry.lock:
+            age = entry.age
+            if age is not None and age < max_age:
+                return
+            entry.state = self.pool.run(host, port, Patlite.get_state)
+            entry.updated = time.monotonic()
+
+    def update(self, host, port, state):
+        '''Record a state written to a device'''
+        entry = self.entry(host, port)
+        with entry.lock:
+            entry.state = state
+            entry.updated = time.monotonic()
+
+    def start(self):
+        '''Start the background poller if needed'''
+        with self.lock:
+            if self.poller is None or not self.poller.is_alive():
+                self.exit.clear()
+                self.poller = threading.Thread(target=self.poll, name='patlite-status', daemon=True)
+                self.poller.start()
+
+    def stop(self):
+        '''Stop the background poller'''
+        self.exit.set()
+        if self.poller is not None:
+            self.poller.join()
+
+    def poll(self):
+        '''Refresh the devices being watched, and forget the others'''
+        while not self.exit.wait(self.poll_interval):
+            now = time.monotonic()
+            with self.lock:
+                for key, entry in list(self.entries.items()):
+                    if now - entry.requested > self.watch_timeout:
+                        del self.entries[key]
+                watched = list(self.entries.items())
+            for (host, port), entry in watched:
+                try:
+                    self.fetch(host, port, entry, max_age=self.poll_interval / 2)
+                except Exception as err:
+                    log.warning("Could not refresh the status of Patlite %s:%s: %s", host, port, err)
+
+STATUS = StatusCache()
+SCHEDULER.listeners.append(STATUS.update)
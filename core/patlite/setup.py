@@ -25,6 +25,7 @@ setup(
     },
     include_package_data=True,
     install_requires=[
+        'PyYAML',
     ],
     entry_points={
         'snooze.plugins.core': [
@@ -0,0 +1,18 @@
+import socket
+
+import pytest
+
+from patlite.utils.simulator import PatliteSimulator
+
+@pytest.fixture
+def device():
+    simulator = PatliteSimulator().start()
+    yield simulator
+    simulator.stop()
+
+@pytest.fixture
+def closed_port():
+    '''A local port nothing listens to'''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()
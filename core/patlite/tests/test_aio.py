@@ -0,0 +1,73 @@
+import asyncio
+import socket
+
+import pytest
+
+from patlite.utils.aio import AsyncPatlite, set_states
+from patlite.utils.patlite import Patlite, PatliteError, State
+
+class TestFraming:
+    def test_fragmented_sync(self, device):
+        device.fragment = True
+        device.state = State(red='blink1', sound='beep').pack()
+        with Patlite(*device.server_address, timeout=2) as patlite:
+            assert patlite.get_state().mystate['red'] == 'blink1'
+            patlite.set_full_state(State(green='on'))
+
+    def test_truncated_sync(self, device):
+        device.disconnect_rate = 1.0
+        with Patlite(*device.server_address, timeout=2) as patlite:
+            with pytest.raises(ConnectionError):
+                patlite.get_state()
+
+class TestAsyncPatlite:
+    def test_state(self, device):
+        async def run():
+            async with AsyncPatlite(*device.server_address, timeout=2) as patlite:
+                await patlite.set_full_state(State(yellow='on', sound='tiny'))
+                return await patlite.get_state()
+        state = asyncio.run(run())
+        assert state.mystate['yellow'] == 'on'
+        assert state.mystate['sound'] == 'tiny'
+
+    def test_fragmented(self, device):
+        device.fragment = True
+        device.state = State(blue='blink2').pack()
+        async def run():
+            async with AsyncPatlite(*device.server_address, timeout=2) as patlite:
+                return await patlite.get_state()
+        assert asyncio.run(run()).mystate['blue'] == 'blink2'
+
+    def test_truncated(self, device):
+        device.disconnect_rate = 1.0
+        async def run():
+            async with AsyncPatlite(*device.server_address, timeout=2) as patlite:
+                await patlite.get_state()
+        with pytest.raises(ConnectionError):
+            asyncio.run(run())
+
+    def test_nak(self, device):
+        device.nak_rate = 1.0
+        async def run():
+            async with AsyncPatlite(*device.server_address, timeout=2) as patlite:
+                await patlite.reset()
+        with pytest.raises(PatliteError):
+            asyncio.run(run())
+
+    def test_timeout(self):
+        # A listening socket that never replies
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen()
+            async def run():
+                async with AsyncPatlite(*server.getsockname(), timeout=0.2) as patlite:
+                    await patlite.get_state()
+            with pytest.raises(asyncio.TimeoutError):
+                asyncio.run(run())
+
+    def test_set_states(self, device):
+        targets = [device.server_address, ('127.0.0.1', 1)]
+        results = asyncio.run(set_states(targets, State(red='on'), timeout=2))
+        assert results[device.server_address] is None
+        assert isinstance(results[('127.0.0.1', 1)], OSError)
+        assert State.unpack(device.state).mystate['red'] == 'on'
@@ -0,0 +1,58 @@
+import pytest
+
+from patlite.utils.fanout import TargetGroups, fan_out, parse_targets, resolve_targets
+from patlite.utils.patlite import State
+from patlite.utils.pool import PatlitePool
+from patlite.utils.scheduler import WriteScheduler
+from patlite.utils.simulator import PatliteSimulator
+
+def test_parse_targets():
+    assert parse_targets('patlite01, patlite02:10001,') == [('patlite01', 10000), ('patlite02', 10001)]
+    assert parse_targets(['patlite01'], port=10002) == [('patlite01', 10002)]
+    assert parse_targets(None) == []
+
+class TestResolveTargets:
+    def test_targets(self, tmp_path):
+        groups = TargetGroups(tmp_path / 'patlite.yaml')
+        options = {'host': 'patlite01', 'port': 10000, 'targets': 'patlite01, patlite02'}
+        assert resolve_targets(options, groups) == [('patlite01', 10000), ('patlite02', 10000)]
+
+    def test_group(self, tmp_path):
+        path = tmp_path / 'patlite.yaml'
+        path.write_text("groups:\n  floor1: ['patlite01', 'patlite02:10001']\n")
+        groups = TargetGroups(path)
+        options = {'group': 'floor1'}
+        assert resolve_targets(options, groups) == [('patlite01', 10000), ('patlite02', 10001)]
+        with pytest.raises(ValueError):
+            resolve_targets({'group': 'floor2'}, groups)
+
+    def test_no_target(self, tmp_path):
+        path = tmp_path / 'patlite.yaml'
+        path.write_text("groups:\n  empty: []\n")
+        groups = TargetGroups(path)
+        for options in [{}, {'port': 10000, 'targets': ''}, {'group': 'empty'}]:
+            with pytest.raises(ValueError):
+                resolve_targets(options, groups)
+
+def test_fan_out(closed_port):
+    servers = [PatliteSimulator().start() for _ in range(5)]
+    pool = PatlitePool(timeout=2)
+    scheduler = WriteScheduler(pool, window=0.01)
+    try:
+        targets = [server.server_address for server in servers] + [closed_port]
+        results = fan_out(targets, State(red='blink2'), scheduler=scheduler, timeout=5)
+        assert [results[server.server_address] for server in servers] == [None] * 5
+        assert isinstance(results[closed_port], OSError)
+        for server in servers:
+            assert State.unpack(server.state).mystate['red'] == 'blink2'
+    finally:
+        pool.close()
+        for server in servers:
+            server.stop()
+
+def test_action_without_target():
+    pytest.importorskip('snooze.plugins.core')
+    from patlite.plugin import Patlite
+    plugin = Patlite.__new__(Patlite)
+    records = [{'host': 'myhost01'}]
+    assert plugin.send(records, {'lights': {'red': 'on'}}) == ([], records)
@@ -0,0 +1,35 @@
+import pytest
+
+from patlite.utils.patlite import Patlite, State
+from patlite.utils.pool import PatlitePool
+
+class TestPatlitePool:
+    def test_persistent(self, device):
+        pool = PatlitePool(timeout=2)
+        host, port = device.server_address
+        pool.run(host, port, Patlite.set_full_state, State(red='on'))
+        for _ in range(5):
+            assert pool.run(host, port, Patlite.get_state).mystate['red'] == 'on'
+        assert device.connections == 1
+        pool.close()
+
+    def test_reconnect(self, device):
+        device.close_after_request = True
+        pool = PatlitePool(timeout=2)
+        host, port = device.server_address
+        for _ in range(3):
+            pool.run(host, port, Patlite.set_full_state, State(blue='blink1'))
+        assert device.connections == 3
+        assert State.unpack(device.state).mystate['blue'] == 'blink1'
+        pool.close()
+
+    def test_connection_error(self, closed_port):
+        pool = PatlitePool(timeout=1)
+        with pytest.raises(OSError):
+            pool.run(*closed_port, Patlite.get_state)
+
+    def test_same_device(self, device):
+        pool = PatlitePool(timeout=2)
+        host, port = device.server_address
+        assert pool.get(host, port) is pool.get(host, str(port))
+        pool.close()
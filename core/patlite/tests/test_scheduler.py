@@ -0,0 +1,88 @@
+import threading
+
+from patlite.utils.patlite import State
+from patlite.utils.pool import PatlitePool
+from patlite.utils.scheduler import WriteScheduler
+
+def test_merge():
+    state = State.merge([
+        State(red='on', sound='short'),
+        State(red='blink1', green='on', sound='tiny'),
+        State(red='off', sound='beep'),
+    ])
+    assert state.mystate == {'red': 'blink1', 'green': 'on', 'sound': 'beep'}
+
+class TestWriteScheduler:
+    def test_coalesce(self, device):
+        writes = []
+        pool = PatlitePool(timeout=2)
+        original = pool.run
+        def run(host, port, method, *args):
+            writes.append(args)
+            return original(host, port, method, *args)
+        pool.run = run
+        scheduler = WriteScheduler(pool, window=0.2)
+        host, port = device.server_address
+        futures = [
+            scheduler.submit(host, port, State(red='on')),
+            scheduler.submit(host, port, State(yellow='blink2', sound='long')),
+            scheduler.submit(host, port, State(red='blink1')),
+        ]
+        results = [future.result(5) for future in futures]
+        assert len(writes) == 1
+        assert results[0].mystate == {'red': 'blink1', 'yellow': 'blink2', 'sound': 'long'}
+        assert State.unpack(device.state).mystate['yellow'] == 'blink2'
+        stats = scheduler.stats()
+        assert stats['requests'] == 3
+        assert stats['writes'] == 1
+        assert stats['writes_saved'] == 2
+        assert stats['pending'] == 0
+        assert 0 < stats['latency_max'] < 5
+        pool.close()
+
+    def test_concurrent(self, device):
+        pool = PatlitePool(timeout=2)
+        scheduler = WriteScheduler(pool, window=0.2)
+        host, port = device.server_address
+        threads = [
+            threading.Thread(target=scheduler.set_full_state, args=(host, port, State(blue='on'), 5))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = scheduler.stats()
+        assert stats['requests'] == 20
+        assert stats['writes'] < 20
+        pool.close()
+
+    def test_error(self):
+        pool = PatlitePool(timeout=1)
+        scheduler = WriteScheduler(pool, window=0.01)
+        future = scheduler.submit('127.0.0.1', 1, State(red='on'))
+        assert isinstance(future.exception(5), OSError)
+        assert scheduler.stats()['errors'] == 1
+
+    def test_reset(self):
+        writing = threading.Event()
+        release = threading.Event()
+        writes = []
+        class Pool:
+            def run(self, host, port, method, state):
+                if not writes:
+                    writing.set()
+                    release.wait(5)
+                writes.append(state.mystate)
+        scheduler = WriteScheduler(Pool(), window=0.05, workers=4)
+        first = scheduler.submit('patlite01', 10000, State(red='on'))
+        assert writing.wait(5)
+        # A write in progress, and another one pending: the reset is written last
+        pending = scheduler.submit('patlite01', 10000, State(yellow='on'))
+        reset = scheduler.reset('patlite01', 10000)
+        release.set()
+        assert reset.result(5).mystate == {}
+        assert pending.result(5).mystate == {}
+        assert first.result(5).mystate == {'red': 'on'}
+        assert writes == [{'red': 'on'}, {}]
+        assert scheduler.stats()['pending'] == 0
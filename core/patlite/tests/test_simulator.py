@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from patlite.utils.patlite import Patlite, PatliteError, State
+from patlite.utils.simulator import PatliteSimulator
+
+@pytest.fixture
+def simulator(request):
+    simulator = PatliteSimulator(**getattr(request, 'param', {})).start()
+    yield simulator
+    simulator.stop()
+
+class TestPatliteSimulator:
+    def test_protocol(self, simulator):
+        with Patlite(*simulator.server_address, timeout=2) as patlite:
+            patlite.set_full_state(State(red='on', sound='long'))
+            assert patlite.get_state().mystate == {
+                'red': 'on', 'yellow': 'off', 'green': 'off', 'blue': 'off', 'white': 'off', 'sound': 'long',
+            }
+        assert simulator.stats['reads'] == 1
+        assert simulator.stats['writes'] == 1
+
+    @pytest.mark.parametrize('simulator', [{'latency': 0.1}], indirect=True)
+    def test_latency(self, simulator):
+        with Patlite(*simulator.server_address, timeout=2) as patlite:
+            start = time.perf_counter()
+            patlite.get_state()
+            assert time.perf_counter() - start >= 0.1
+
+    @pytest.mark.parametrize('simulator', [{'nak_rate': 0.5, 'seed': 1}], indirect=True)
+    def test_nak_rate(self, simulator):
+        naks = 0
+        with Patlite(*simulator.server_address, timeout=2) as patlite:
+            for _ in range(100):
+                try:
+                    patlite.reset()
+                except PatliteError:
+                    naks += 1
+        assert 20 < naks < 80
+        assert simulator.stats['naks'] == naks
+
+    @pytest.mark.parametrize('simulator', [{'max_connections': 1}], indirect=True)
+    def test_max_connections(self, simulator):
+        with Patlite(*simulator.server_address, timeout=2) as first:
+            first.get_state()
+            with Patlite(*simulator.server_address, timeout=2) as second:
+                with pytest.raises(ConnectionError):
+                    second.get_state()
+        assert simulator.stats['refused'] == 1
@@ -0,0 +1,67 @@
+import time
+
+from patlite.utils.patlite import State
+from patlite.utils.pool import PatlitePool
+from patlite.utils.status import StatusCache
+
+class TestStatusCache:
+    def make_cache(self, **kwargs):
+        pool = PatlitePool(timeout=2)
+        reads = []
+        original = pool.run
+        def run(host, port, method, *args):
+            reads.append(method)
+            return original(host, port, method, *args)
+        pool.run = run
+        return StatusCache(pool, **kwargs), reads
+
+    def test_cached(self, device):
+        cache, reads = self.make_cache(ttl=60, poll_interval=60)
+        host, port = device.server_address
+        device.state = State(red='on').pack()
+        for _ in range(10):
+            state, age = cache.get(host, port)
+            assert state.mystate['red'] == 'on'
+            assert 0 <= age < 60
+        assert len(reads) == 1
+        cache.stop()
+
+    def test_refresh(self, device):
+        cache, reads = self.make_cache(ttl=60, poll_interval=60)
+        host, port = device.server_address
+        cache.get(host, port)
+        device.state = State(green='blink1').pack()
+        assert cache.get(host, port)[0].mystate['green'] == 'off'
+        assert cache.get(host, port, refresh=True)[0].mystate['green'] == 'blink1'
+        assert len(reads) == 2
+        cache.stop()
+
+    def test_poller(self, device):
+        cache, reads = self.make_cache(ttl=60, poll_interval=0.1)
+        host, port = device.server_address
+        cache.get(host, port)
+        device.state = State(white='on').pack()
+        time.sleep(0.5)
+        state, age = cache.get(host, port)
+        assert state.mystate['white'] == 'on'
+        assert age < 0.5
+        cache.stop()
+
+    def test_forget(self, device):
+        cache, reads = self.make_cache(ttl=60, poll_interval=0.05, watch_timeout=0.1)
+        host, port = device.server_address
+        cache.get(host, port)
+        time.sleep(0.4)
+        assert not cache.entries
+        count = len(reads)
+        time.sleep(0.2)
+        assert len(reads) == count
+        cache.stop()
+
+    def test_update(self, device):
+        cache, reads = self.make_cache(ttl=60, poll_interval=60)
+        host, port = device.server_address
+        cache.update(host, port, State(blue='on'))
+        assert cache.get(host, port)[0].mystate == {'blue': 'on'}
+        assert not reads
+        cache.stop()
@@ -0,0 +1,55 @@
+'''
+Measure the startup time of the pacemaker alert scripts.
+Every module is imported in a fresh interpreter with `-X importtime`, and the
+slowest imports are listed. The wall time of the whole process is averaged
+over several runs.
+Usage: python3 benchmarks/bench_startup.py [runs]
+'''
+
+import subprocess
+import sys
+import time
+
+MODULES = [
+    'snooze_pacemaker.agent',
+    'snooze_pacemaker.main',
+]
+
+def import_times(module):
+    '''Return the list of (cumulative microseconds, module) imported by `module`'''
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative), name.rstrip()))
+    return times
+
+def wall_time(module, runs):
+    '''Average wall time, in seconds, of a process importing `module`'''
+    start = time.perf_counter()
+    for _ in range(runs):
+        subprocess.run([sys.executable, '-c', 'import {}'.format(module)], check=True)
+    return (time.perf_counter() - start) / runs
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline = wall_time('os', runs)
+    print("Interpreter startup: {:.1f} ms".format(baseline * 1000))
+    for module in MODULES:
+        times = import_times(module)
+        total = next(cumulative for cumulative, name in times if name.strip() == module)
+        print("\n{}: {:.1f} ms import, {:.1f} ms wall time".format(
+            module, total / 1000, wall_time(module, runs) * 1000))
+        for cumulative, name in sorted(times, reverse=True)[:10]:
+            print("  {:>8.1f} ms {}".format(cumulative / 1000, name))
+
+if __name__ == '__main__':
+    main()
@@ -18,10 +18,14 @@ setup(
     entry_points={
         'console_scripts': [
             'snooze-pacemaker = snooze_pacemaker.main:alert',
+            'snooze-pacemaker-agent = snooze_pacemaker.agent:main',
+            'snooze-pacemaker-forwarder = snooze_pacemaker.forwarder:main',
         ],
     },
     install_requires = [
         'snooze-client',
+        'snooze-severity',
         'python-dateutil',
+        'PyYAML',
     ],
 )
@@ -0,0 +1,48 @@
+'''
+Thin pacemaker alert agent.
+It only forwards the pacemaker environment to the local forwarder daemon,
+and falls back to sending the alert itself when the forwarder is not running.
+'''
+
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = '/run/snooze/pacemaker.sock'
+
+def send(environment, path=DEFAULT_SOCKET, timeout=5):
+    '''
+    Send the `CRM_*` variables of the environment to the forwarder.
+    Return True if the forwarder accepted the alert, False if it refused it, and None if
+    it did not reply (it may have queued the alert).
+    Raise an OSError if the alert could not be written to the forwarder.
+    '''
+    alert = {key: value for key, value in environment.items() if key.startswith('CRM_')}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(alert).encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+        try:
+            reply = sock.recv(64)
+        except OSError as err:
+            sys.stderr.write("No reply from the forwarder at {} ({}), not sending the alert again\n".format(path, err))
+            return None
+    return reply.startswith(b'OK')
+
+def main():
+    '''Forward the alert to the forwarder, or send it directly'''
+    path = os.environ.get('SNOOZE_PACEMAKER_SOCKET') or DEFAULT_SOCKET
+    try:
+        # Only sent directly when the forwarder did not get the alert, or refused it
+        if send(os.environ, path) is not False:
+            return
+        sys.stderr.write("Forwarder at {} refused the alert, sending it directly\n".format(path))
+    except OSError as err:
+        sys.stderr.write("Forwarder at {} unreachable ({}), sending the alert directly\n".format(path, err))
+    from snooze_pacemaker.main import alert
+    alert()
+
+if __name__ == '__main__':
+    main()
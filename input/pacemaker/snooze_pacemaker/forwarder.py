@@ -0,0 +1,264 @@
+'''
+Resident forwarder for pacemaker alerts.
+The agent (`snooze-pacemaker-agent`) writes the pacemaker environment on a
+Unix socket. The forwarder queues the alerts, and sends them to snooze by
+batches, reusing the same client (and connections) for every alert.
+'''
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import signal
+import time
+from pathlib import Path
+from queue import Queue, Empty, Full
+from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+from threading import Event, Lock, Thread
+
+import yaml
+
+from snooze_pacemaker.agent import DEFAULT_SOCKET
+from snooze_pacemaker.main import get_cluster_name, make_record
+
+LOG = logging.getLogger("snooze.pacemaker.forwarder")
+
+def load_config():
+    '''Load the configuration file'''
+    config = {}
+    config_file = Path(os.environ.get('SNOOZE_PACEMAKER_CONFIG') or '/etc/snooze/pacemaker.yaml')
+    try:
+        with config_file.open('r') as myfile:
+            config = yaml.safe_load(myfile.read())
+    except Exception as err:
+        LOG.warning("Error loading config: %s", err)
+
+    if not isinstance(config, dict):
+        config = {}
+
+    return config
+
+def snooze_client(url):
+    '''Return a snooze client for the given URL'''
+    from snooze_client import Snooze
+    return Snooze(url)
+
+class ClusterNameCache:
+    '''Cluster name, queried again only when older than `ttl` seconds'''
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.value = None
+        self.expires = 0
+        self.lock = Lock()
+
+    def get(self):
+        '''Return the cluster name, or an empty string if it is unknown'''
+        with self.lock:
+            if time.monotonic() >= self.expires:
+                self.value = get_cluster_name() or ''
+                self.expires = time.monotonic() + self.ttl
+            return self.value
+
+class ThreadedUnixServer(ThreadingMixIn, UnixStreamServer):
+    '''Multi-threaded Unix socket server'''
+    daemon_threads = True
+
+    def __init__(self, path, forwarder, mode=0o660):
+        self.forwarder = forwarder
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.is_socket():
+            path.unlink()
+        UnixStreamServer.__init__(self, str(path), AlertRequestHandler)
+        os.chmod(str(path), mode)
+
+class AlertRequestHandler(StreamRequestHandler):
+    '''Read one alert (a JSON object of the CRM_* variables) per connection'''
+    max_size = 65536
+
+    def handle(self):
+        data = self.rfile.read(self.max_size)
+        try:
+            environment = json.loads(data.decode('utf-8'))
+            if not isinstance(environment, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as err:
+            LOG.warning("Invalid alert received: %s", err)
+            self.wfile.write(b'ERROR\n')
+            return
+        if self.server.forwarder.put(environment):
+            self.wfile.write(b'OK\n')
+        else:
+            self.wfile.write(b'FULL\n')
+
+class Forwarder:
+    '''
+    Queue the alerts received on a Unix socket, and send them to snooze.
+    Alerts are grouped by recipient, and sent in batches of up to `batch_size`
+    alerts, waiting at most `batch_delay` seconds for a batch to fill.
+    An alert failing with a transient error is tried again later (up to `retries` times),
+    without holding the other alerts. An alert rejected by the server is dropped.
+    '''
+    def __init__(self, socket_path=DEFAULT_SOCKET, socket_mode=0o660, batch_size=100, batch_delay=0.2,
+            max_queue=10000, retries=3, cluster_name_ttl=300, client_factory=snooze_client):
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.retries = retries
+        self.queue = Queue(max_queue)
+        self.cluster_name = ClusterNameCache(cluster_name_ttl)
+        self.client_factory = client_factory
+        self.clients = {}
+        # (due time, sequence, attempt, url, record) of the alerts to try again
+        self.retrying = []
+        self.sequence = itertools.count()
+        self.exit = Event()
+        self.server = ThreadedUnixServer(socket_path, self, socket_mode)
+        self.threads = [
+            Thread(target=self.server.serve_forever, name='listener'),
+            Thread(target=self.sender, name='sender'),
+        ]
+
+    def put(self, environment):
+        '''Queue an alert. Return False if the queue is full'''
+        try:
+            self.queue.put_nowait(environment)
+            return True
+        except Full:
+            LOG.warning("Queue full (%d alerts), refusing alert", self.queue.maxsize)
+            return False
+
+    def start(self):
+        '''Start listening and sending'''
+        LOG.info("Listening on %s", self.socket_path)
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        '''Stop listening, and send the alerts left in the queue'''
+        LOG.info("Stopping forwarder")
+        self.server.shutdown()
+        self.server.server_close()
+        self.exit.set()
+        for thread in self.threads:
+            thread.join()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def serve_forever(self):
+        '''Run the forwarder until interrupted'''
+        signal.signal(signal.SIGTERM, lambda *_: self.exit.set())
+        self.start()
+        try:
+            while not self.exit.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def next_batch(self):
+        '''Wait for the next batch of alerts'''
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except Empty:
+            return []
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def sender(self):
+        '''Send the queued alerts until stopped and the queue is empty'''
+        while not (self.exit.is_set() and self.queue.empty()):
+            batch = self.next_batch()
+            if batch:
+                self.send(batch)
+            self.send_retries()
+        self.send_retries(final=True)
+
+    def send_retries(self, final=False):
+        '''Try again the alerts which are due (all of them, for the last time, if `final`)'''
+        recipients = {}
+        now = time.monotonic()
+        while self.retrying and (final or self.retrying[0][0] <= now):
+            _, _, attempt, url, record = heapq.heappop(self.retrying)
+            recipients.setdefault((url, attempt), []).append(record)
+        for (url, attempt), records in recipients.items():
+            self.send_records(url, records, attempt, retry=not final)
+
+    def send(self, batch):
+        '''Send a batch of alerts to their recipients'''
+        cluster_name = self.cluster_name.get()
+        recipients = {}
+        for environment in batch:
+            url = environment.get('CRM_alert_recipient')
+            try:
+                record = make_record(environment, cluster_name)
+            except Exception as err:
+                LOG.error("Could not make a record from %s: %s", environment, err)
+                continue
+            recipients.setdefault(url, []).append(record)
+        for url, records in recipients.items():
+            self.send_records(url, records)
+
+    def send_records(self, url, records, attempt=1, retry=True):
+        '''
+        Send records to a snooze server. Return True if they were all sent.
+        Every record goes through `alert_with_defaults`, like with the agent alone,
+        so that its content does not depend on the size of the batch.
+        A record failing with a transient error is scheduled to be tried again, and
+        the next records are sent meanwhile.
+        '''
+        if url not in self.clients:
+            self.clients[url] = self.client_factory(url)
+        client = self.clients[url]
+        sent = 0
+        for record in records:
+            try:
+                client.alert_with_defaults(record)
+                sent += 1
+                continue
+            except Exception as err:
+                error = err
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+            if status and 400 <= status < 500 and status not in (408, 429):
+                LOG.error("Alert rejected by %s, dropping it: %s", url, error)
+            elif retry and attempt < self.retries:
+                LOG.warning("Error sending an alert to %s (attempt %d/%d), trying again in %ds: %s",
+                    url, attempt, self.retries, attempt, error)
+                heapq.heappush(self.retrying, (time.monotonic() + attempt, next(self.sequence), attempt + 1, url, record))
+            else:
+                LOG.error("Dropped an alert for %s after %d attempt(s): %s", url, attempt, error)
+        LOG.debug("Sent %d/%d alert(s) to %s", sent, len(records), url)
+        return sent == len(records)
+
+def main():
+    '''Main loop'''
+    logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s", level=logging.INFO)
+    config = load_config()
+    if config.get('debug', False):
+        LOG.setLevel(logging.DEBUG)
+    forwarder = Forwarder(
+        socket_path=config.get('socket_path', DEFAULT_SOCKET),
+        socket_mode=int(str(config.get('socket_mode', '0660')), 8),
+        batch_size=config.get('batch_size', 100),
+        batch_delay=config.get('batch_delay', 0.2),
+        max_queue=config.get('max_queue', 10000),
+        retries=config.get('retries', 3),
+        cluster_name_ttl=config.get('cluster_name_ttl', 300),
+    )
+    forwarder.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,12 @@
 '''Helper to send alerts from pacemaker'''
 
 import os
-import re
-
-import dateutil.parser
-
+import time
 from datetime import datetime
-from subprocess import Popen, TimeoutExpired, CalledProcessError
 
-from snooze_client import Snooze
+# Pacemaker starts a new process for every alert: the modules which are only
+# needed in some cases (dateutil, subprocess, snooze_client) are imported on first use.
+from snooze_severity.classifier import SeverityClassifier, load_rules, ordered_rules
 
 # As described by https://clusterlabs.org/pacemaker/doc/deprecated/en-US/Pacemaker/2.0/html-single/Pacemaker_Explained/index.html#_alert_instance_attributes
 KEYS = [
@@ -32,6 +30,7 @@ KEYS = [
     'alert_attribute_value',
 ]
 
+# By order of priority
 SEVERITY_KEYWORDS = {
     'ok': 'ok',
     'unknown': 'unknown',
@@ -39,30 +38,79 @@ SEVERITY_KEYWORDS = {
     'cancelled': 'err',
 }
 
+def make_classifier():
+    '''
+    Return the severity classifier, using the rules of the YAML file in
+    SNOOZE_PACEMAKER_SEVERITY_RULES if any, or SEVERITY_KEYWORDS
+    '''
+    rules = None
+    if os.environ.get('SNOOZE_PACEMAKER_SEVERITY_RULES'):
+        rules = load_rules(os.environ['SNOOZE_PACEMAKER_SEVERITY_RULES'])
+    if not rules:
+        rules = ordered_rules(SEVERITY_KEYWORDS, word=False)
+    return SeverityClassifier(rules, default='err')
+
+CLASSIFIER = None
+
+STATE_FILE = '/var/lib/snooze/pacemaker_cluster_name'
+
 def get_cluster_name():
     '''Execute a pacemaker command to get the cluster name'''
+    import subprocess
     try:
-        proc = Popen(['crm_attribute', '--query', '-n', 'cluster-name', '-q'], shell=True)
-        stdout, _ = proc.communicate(timeout=3)
-        if stdout:
-            lines = stdout.split('\n')
-            return lines[-1]
-        else:
-            return None
-    except [TimeoutExpired, CalledProcessError]:
+        proc = subprocess.run(
+            ['crm_attribute', '--query', '-n', 'cluster-name', '-q'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            timeout=3,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    lines = [line.strip() for line in proc.stdout.splitlines() if line.strip()]
+    if proc.returncode == 0 and lines:
+        return lines[-1]
+    else:
         return None
 
+def cached_cluster_name(path=None, ttl=None):
+    '''
+    Return the cluster name, cached in a state file for `ttl` seconds, so that
+    `crm_attribute` is not executed for every alert.
+    The state file and the TTL default to the SNOOZE_PACEMAKER_STATE_FILE and
+    SNOOZE_PACEMAKER_CLUSTER_NAME_TTL environment variables.
+    '''
+    path = path or os.environ.get('SNOOZE_PACEMAKER_STATE_FILE') or STATE_FILE
+    if ttl is None:
+        ttl = float(os.environ.get('SNOOZE_PACEMAKER_CLUSTER_NAME_TTL') or 300)
+    try:
+        if time.time() - os.stat(path).st_mtime < ttl:
+            with open(path, 'r') as state_file:
+                return state_file.read().strip() or None
+    except (OSError, ValueError):
+        pass
+    cluster_name = get_cluster_name()
+    if cluster_name is not None:
+        tmp_path = '{}.{}'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as state_file:
+                state_file.write(cluster_name)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+    return cluster_name
+
 def guess_severity(pacemaker):
     '''Guess the severity based on the input dict'''
-    for (regex, keyword) in SEVERITY_KEYWORDS.items():
-        if re.search(regex, pacemaker['alert_desc'], re.I):
-            return keyword
-    else:
-        return 'err'
+    global CLASSIFIER
+    if CLASSIFIER is None:
+        CLASSIFIER = make_classifier()
+    return CLASSIFIER.classify(pacemaker.get('alert_desc'))
 
-def make_record(environment):
+def make_record(environment, cluster_name=None):
     '''
-    Create a snooze record based on the pacemaker environment variables
+    Create a snooze record based on the pacemaker environment variables.
+    The cluster name is read from the state file (or queried) if not given.
     '''
     pacemaker = {}
     record = {}
@@ -74,15 +122,17 @@ def make_record(environment):
         if value:
             pacemaker[key] = value
 
-    cluster_name = get_cluster_name()
+    if cluster_name is None:
+        cluster_name = cached_cluster_name()
     if cluster_name:
         pacemaker['cluster_name'] = cluster_name
 
     if 'alert_timestamp_epoch' in pacemaker: # Pacemaker 2.0
-        timestamp = pacemaker['alert_timestamp_epoch']
-        pacemaker['alert_timestamp_epoch'] = int(timestamp)
+        timestamp = int(pacemaker['alert_timestamp_epoch'])
+        pacemaker['alert_timestamp_epoch'] = timestamp
         record['timestamp'] = datetime.fromtimestamp(timestamp).astimezone().isoformat()
     elif 'alert_timestamp' in pacemaker: # Pacemaker 1.1
+        import dateutil.parser
         timestamp = dateutil.parser.parse(pacemaker['alert_timestamp'])
         record['timestamp'] = timestamp.astimezone().isoformat()
 
@@ -113,6 +163,8 @@ def make_record(environment):
 
 def alert():
     '''Send an alert to pacemaker'''
+    from snooze_client import Snooze
+
     record = make_record(os.environ)
 
     url = os.environ['CRM_alert_recipient']
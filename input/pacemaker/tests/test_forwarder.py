@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+
+import requests
+
+from snooze_pacemaker.agent import main, send
+from snooze_pacemaker.forwarder import Forwarder, ClusterNameCache
+
+ENVIRONMENT = {
+    'CRM_alert_kind': 'node',
+    'CRM_alert_version': '2.0.5',
+    'CRM_alert_recipient': 'https://snooze.example.com:5200',
+    'CRM_alert_node': 'myhost01',
+    'CRM_alert_desc': 'member',
+    'PATH': '/usr/bin',
+}
+
+class FakeClient:
+    def __init__(self, url):
+        self.url = url
+        self.sent = []
+        self.errors = []
+        self.rejected = set()
+
+    def alert(self, records):
+        self.sent.extend(records if isinstance(records, list) else [records])
+
+    def alert_with_defaults(self, record):
+        if self.errors:
+            raise self.errors.pop(0)
+        if record.get('id') in self.rejected:
+            raise ValueError('rejected')
+        self.alert(dict(record, defaults=True))
+
+class TestForwarder:
+    def make_forwarder(self, tmp_path, **kwargs):
+        clients = []
+        def factory(url):
+            client = FakeClient(url)
+            clients.append(client)
+            return client
+        forwarder = Forwarder(str(tmp_path / 'pacemaker.sock'), client_factory=factory, **kwargs)
+        forwarder.cluster_name.get = lambda: 'mycluster'
+        return forwarder, clients
+
+    def test_batch(self, tmp_path):
+        forwarder, clients = self.make_forwarder(tmp_path, batch_delay=0.5)
+        forwarder.start()
+        try:
+            for _ in range(10):
+                assert send(ENVIRONMENT, forwarder.socket_path)
+        finally:
+            forwarder.stop()
+        assert len(clients) == 1
+        records = clients[0].sent
+        assert len(records) == 10
+        assert records[0]['host'] == 'myhost01'
+        assert records[0]['pacemaker']['cluster_name'] == 'mycluster'
+        assert 'PATH' not in records[0]['pacemaker']
+
+    def test_recipients(self, tmp_path):
+        forwarder, clients = self.make_forwarder(tmp_path)
+        forwarder.send([ENVIRONMENT, dict(ENVIRONMENT, CRM_alert_recipient='https://other.example.com')])
+        forwarder.server.server_close()
+        assert sorted(client.url for client in clients) == ['https://other.example.com', 'https://snooze.example.com:5200']
+
+    def test_same_records_in_batches(self, tmp_path):
+        forwarder, clients = self.make_forwarder(tmp_path)
+        forwarder.server.server_close()
+        forwarder.send([ENVIRONMENT])
+        forwarder.send([ENVIRONMENT] * 5)
+        single, *batch = clients[0].sent
+        assert single['defaults']
+        assert all(record == single for record in batch)
+
+    def test_retry_failed_records(self, tmp_path):
+        forwarder, clients = self.make_forwarder(tmp_path)
+        forwarder.server.server_close()
+        forwarder.send([ENVIRONMENT])
+        clients[0].sent.clear()
+        clients[0].errors.append(ConnectionError())
+        # The failed record is tried again later, the next one is not held
+        assert not forwarder.send_records(ENVIRONMENT['CRM_alert_recipient'], [{'id': 1}, {'id': 2}])
+        assert [record['id'] for record in clients[0].sent] == [2]
+        forwarder.send_retries(final=True)
+        assert [record['id'] for record in clients[0].sent] == [2, 1]
+        assert not forwarder.retrying
+
+    def test_poison_record(self, tmp_path):
+        forwarder, clients = self.make_forwarder(tmp_path, retries=2)
+        forwarder.server.server_close()
+        forwarder.send([ENVIRONMENT])
+        clients[0].sent.clear()
+        clients[0].rejected.add(1)
+        forwarder.send_records(ENVIRONMENT['CRM_alert_recipient'], [{'id': 1}, {'id': 2}, {'id': 3}])
+        forwarder.retrying = [(0,) + entry[1:] for entry in forwarder.retrying]
+        forwarder.send_retries()
+        # Only the failing record is dropped, after its retries
+        assert [record['id'] for record in clients[0].sent] == [2, 3]
+        assert not forwarder.retrying
+
+    def test_rejected_record(self, tmp_path):
+        response = requests.Response()
+        response.status_code = 400
+        forwarder, clients = self.make_forwarder(tmp_path)
+        forwarder.server.server_close()
+        forwarder.send([ENVIRONMENT])
+        clients[0].sent.clear()
+        clients[0].errors.append(requests.HTTPError(response=response))
+        forwarder.send_records(ENVIRONMENT['CRM_alert_recipient'], [{'id': 1}, {'id': 2}])
+        assert [record['id'] for record in clients[0].sent] == [2]
+        assert not forwarder.retrying
+
+    def test_full(self, tmp_path):
+        forwarder, _ = self.make_forwarder(tmp_path, max_queue=1)
+        forwarder.threads[0].start()
+        try:
+            assert send(ENVIRONMENT, forwarder.socket_path)
+            assert not send(ENVIRONMENT, forwarder.socket_path)
+        finally:
+            forwarder.server.shutdown()
+            forwarder.server.server_close()
+
+class TestClusterNameCache:
+    def test_ttl(self, monkeypatch):
+        calls = []
+        def get_cluster_name():
+            calls.append(1)
+            return 'mycluster'
+        monkeypatch.setattr('snooze_pacemaker.forwarder.get_cluster_name', get_cluster_name)
+        cache = ClusterNameCache(ttl=0.1)
+        assert cache.get() == 'mycluster'
+        assert cache.get() == 'mycluster'
+        assert len(calls) == 1
+        time.sleep(0.15)
+        cache.get()
+        assert len(calls) == 2
+
+class TestAgent:
+    def test_no_reply(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'slow.sock')
+        received = []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen()
+            def accept():
+                connection, _ = server.accept()
+                received.append(connection.recv(65536))
+                time.sleep(0.5)
+                connection.close()
+            thread = threading.Thread(target=accept)
+            thread.start()
+            assert send(ENVIRONMENT, path, timeout=0.1) is None
+            thread.join()
+        assert received
+        # The forwarder may have queued the alert: it is not sent again
+        fallback = []
+        monkeypatch.setattr('snooze_pacemaker.agent.send', lambda *args: None)
+        monkeypatch.setattr('snooze_pacemaker.main.alert', lambda: fallback.append(1))
+        main()
+        assert not fallback
+
+    def test_unreachable(self, tmp_path, monkeypatch):
+        fallback = []
+        monkeypatch.setenv('SNOOZE_PACEMAKER_SOCKET', str(tmp_path / 'missing.sock'))
+        monkeypatch.setattr('snooze_pacemaker.main.alert', lambda: fallback.append(1))
+        main()
+        assert fallback
@@ -1,4 +1,7 @@
-from snooze_pacemaker.main import make_record
+import subprocess
+import sys
+
+from snooze_pacemaker.main import make_record, cached_cluster_name
 
 class TestPacemaker1x:
     def test_resource(self):
@@ -23,3 +26,30 @@ class TestPacemaker1x:
         assert record['timestamp'] == '2021-08-23T13:50:04+09:00'
         assert record['process'] == 'resource'
         assert record['message'] == "Resource operation 'start' for 'myresource': unknown error"
+
+class TestClusterName:
+    def test_cached(self, tmp_path, monkeypatch):
+        calls = []
+        def get_cluster_name():
+            calls.append(1)
+            return 'mycluster'
+        monkeypatch.setattr('snooze_pacemaker.main.get_cluster_name', get_cluster_name)
+        path = str(tmp_path / 'cluster_name')
+        assert cached_cluster_name(path, ttl=60) == 'mycluster'
+        assert cached_cluster_name(path, ttl=60) == 'mycluster'
+        assert len(calls) == 1
+        assert cached_cluster_name(path, ttl=0) == 'mycluster'
+        assert len(calls) == 2
+
+    def test_unknown(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('snooze_pacemaker.main.get_cluster_name', lambda: None)
+        path = tmp_path / 'cluster_name'
+        assert cached_cluster_name(str(path), ttl=60) is None
+        assert not path.exists()
+
+def test_lazy_imports():
+    '''The alert scripts should not import heavy modules before they are needed'''
+    code = "import sys, snooze_pacemaker.main, snooze_pacemaker.agent;" \
+        + "print(' '.join(m for m in ('snooze_client', 'dateutil', 'yaml') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    assert output.strip() == ''
@@ -0,0 +1,56 @@
+'''
+Compare the severity classifier with searching the keywords one by one.
+Usage: python3 benchmarks/bench_classifier.py [iterations]
+'''
+
+import random
+import re
+import string
+import sys
+import timeit
+
+from snooze_severity.classifier import SeverityClassifier, ordered_rules
+
+SUBJECTS = [
+    'Backup of myhost01 finished with success',
+    'CRITICAL: /var is 98% full on myhost02',
+    'Cron <root@myhost03> run-parts /etc/cron.daily',
+    'Resource operation start for myresource: not running',
+    'Weekly report of the batch jobs',
+]
+
+def random_keywords(count, seed=42):
+    '''Generate unique random keywords'''
+    rand = random.Random(seed)
+    keywords = ['fatal', 'critical', 'warning', 'error', 'notice', 'info', 'success', 'ok']
+    while len(keywords) < count:
+        keyword = ''.join(rand.choice(string.ascii_lowercase) for _ in range(rand.randint(4, 10)))
+        if keyword not in keywords:
+            keywords.append(keyword)
+    return keywords[:count]
+
+def linear_search(keywords, subject):
+    '''The previous implementation: one regex per keyword'''
+    for keyword in keywords:
+        if re.search(r"\b%s\b" % keyword, subject, re.IGNORECASE):
+            return keyword
+    return None
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("{:>6} {:>14} {:>14} {:>8}".format('rules', 'linear (us)', 'compiled (us)', 'speedup'))
+    for count in (8, 100, 500, 2000):
+        keywords = random_keywords(count)
+        classifier = SeverityClassifier(ordered_rules(keywords))
+        for subject in SUBJECTS:
+            assert classifier.classify(subject) == linear_search(keywords, subject)
+        linear = timeit.timeit(
+            lambda: [linear_search(keywords, subject) for subject in SUBJECTS], number=iterations)
+        compiled = timeit.timeit(
+            lambda: [classifier.classify(subject) for subject in SUBJECTS], number=iterations)
+        per_call = iterations * len(SUBJECTS) / 1e6
+        print("{:>6} {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+            count, linear / per_call, compiled / per_call, linear / compiled))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+'''Setup of the python package'''
+
+from setuptools import setup, find_packages
+
+with open("README.md", "r") as f:
+    long_description = f.read()
+
+setup(
+    name='snooze-severity',
+    version='1.0.0',
+    author='Guillaume Ludinard, Florian Dematraz',
+    author_email='guillaume.ludi@gmail.com, ',
+    description="Keyword based severity classifier shared by snooze input plugins",
+    long_description=long_description,
+    long_description_content_type="text/markdown",
+    packages=find_packages(include=['snooze_severity', 'snooze_severity.*']),
+    classifiers=[
+        'License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)',
+    ],
+    install_requires=[
+        'PyYAML',
+    ],
+)
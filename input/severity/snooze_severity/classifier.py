@@ -0,0 +1,157 @@
+'''Keyword based severity classifier'''
+
+import logging
+import re
+from pathlib import Path
+
+LOG = logging.getLogger("snooze.severity")
+
+class Rule:
+    '''A keyword, and the severity to return when it is found'''
+    def __init__(self, keyword, severity=None, priority=0, word=True):
+        self.keyword = keyword
+        self.severity = severity or keyword
+        self.priority = priority
+        self.word = word
+
+    def __repr__(self):
+        return "Rule({!r}, severity={!r}, priority={!r}, word={!r})".format(
+            self.keyword, self.severity, self.priority, self.word)
+
+def trie_pattern(keywords):
+    '''
+    Return a regex matching any of the keywords, factorized by common prefixes
+    (`error|errors|event` => `e(?:rror(?:s)?|vent)`), so that the regex engine
+    does not try every keyword at every position of the text.
+    Longer keywords are tried first.
+    '''
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+def _node_pattern(node):
+    terminal = '' in node
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    pattern = '(?:' + '|'.join(branches) + ')'
+    if terminal:
+        pattern += '?'
+    return pattern
+
+def _is_word(char):
+    return char.isalnum() or char == '_'
+
+def _boundary(text, position):
+    '''Return True if there is a word boundary (`\\b`) at a position of the text'''
+    before = position > 0 and _is_word(text[position - 1])
+    after = position < len(text) and _is_word(text[position])
+    return before != after
+
+class SeverityClassifier:
+    '''
+    Guess a severity from a text, by looking for keywords.
+    The keywords are compiled in case insensitive regexes (one for the words, one for the
+    substrings), shaped as prefix trees, so the text is scanned once per regex whatever the
+    number of rules. Every keyword found is considered, even when it overlaps another one:
+    the longest keyword starting at each position is matched in a lookahead, and the keywords
+    it starts with are checked too. When several keywords
+    are found, the severity of the rule with the highest priority is returned.
+    Rules with the same priority are ranked by their order in the list.
+
+    Rules can be given as `Rule` objects, or dicts with the same keys:
+        - keyword: (required) Text to look for
+        - severity: Severity to return (default: the keyword)
+        - priority: The highest priority wins (default: 0)
+        - word: Match the keyword on word boundaries only (default: true)
+    '''
+    def __init__(self, rules, default=None):
+        self.default = default
+        self.rules = {}
+        for index, rule in enumerate(rules):
+            if isinstance(rule, dict):
+                rule = Rule(**rule)
+            rank = (rule.priority, -index)
+            key = rule.keyword.lower()
+            if key not in self.rules or rank > self.rules[key][0]:
+                self.rules[key] = (rank, rule)
+        self.regexes = []
+        words = [key for key, (_, rule) in self.rules.items() if rule.word]
+        if words:
+            self.regexes.append((re.compile(r'(?=(\b' + trie_pattern(words) + r'\b))', re.IGNORECASE), True))
+        substrings = [key for key, (_, rule) in self.rules.items() if not rule.word]
+        if substrings:
+            self.regexes.append((re.compile('(?=(' + trie_pattern(substrings) + '))', re.IGNORECASE), False))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, text):
+        '''Return the matching rule with the highest priority, or None'''
+        if not text or not self.regexes:
+            return None
+        best = None
+        for regex, word in self.regexes:
+            for match in regex.finditer(text):
+                start, found = match.start(), match.group(1).lower()
+                # The longest keyword at this position, and the shorter ones it starts with
+                for end in range(len(found), 0, -1):
+                    entry = self.rules.get(found[:end])
+                    if entry is None or entry[1].word != word:
+                        continue
+                    if word and not _boundary(text, start + end):
+                        continue
+                    if best is None or entry[0] > best[0]:
+                        best = entry
+        if best:
+            return best[1]
+        return None
+
+    def classify(self, text):
+        '''Return the severity guessed from the text, or the default severity'''
+        rule = self.match(text)
+        if rule:
+            LOG.debug("Guessed the severity %s from '%s'", rule.severity, text)
+            return rule.severity
+        return self.default
+
+def ordered_rules(keywords, word=True):
+    '''
+    Build rules from a list of keywords (or a dict of keyword => severity),
+    the first keyword having the highest priority.
+    '''
+    if isinstance(keywords, dict):
+        keywords = list(keywords.items())
+    else:
+        keywords = [(keyword, keyword) for keyword in keywords]
+    return [
+        Rule(keyword, severity, priority=len(keywords) - index, word=word)
+        for index, (keyword, severity) in enumerate(keywords)
+    ]
+
+def load_rules(path):
+    '''
+    Load the rules from a YAML file containing a list of rules, or a dict
+    with a `rules` key. Return None if the file does not exist or is invalid.
+    '''
+    # Only imported when needed, for the alert scripts started for every alert
+    import yaml
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        data = yaml.safe_load(path.read_text())
+        if isinstance(data, dict):
+            data = data.get('rules')
+        if not isinstance(data, list):
+            raise ValueError("Expected a list of rules")
+        return [Rule(**rule) for rule in data]
+    except Exception as err:
+        LOG.warning("Could not load severity rules from %s: %s", path, err)
+        return None
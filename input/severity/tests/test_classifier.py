@@ -0,0 +1,119 @@
+import random
+import re
+import string
+
+import pytest
+
+from snooze_severity.classifier import Rule, SeverityClassifier, load_rules, ordered_rules, trie_pattern
+
+def test_trie_pattern():
+    assert trie_pattern(['error', 'errors', 'event']) == 'e(?:rror(?:s)?|vent)'
+    assert trie_pattern(['ok']) == 'ok'
+
+class TestSeverityClassifier:
+    def test_keyword(self):
+        classifier = SeverityClassifier([{'keyword': 'critical'}])
+        assert classifier.classify('Disk usage CRITICAL on myhost01') == 'critical'
+
+    def test_default(self):
+        classifier = SeverityClassifier([{'keyword': 'critical'}], default='err')
+        assert classifier.classify('Something happened') == 'err'
+        assert classifier.classify('') == 'err'
+        assert classifier.classify(None) == 'err'
+
+    def test_priority(self):
+        classifier = SeverityClassifier([
+            {'keyword': 'ok', 'priority': 1},
+            {'keyword': 'fatal', 'priority': 10},
+        ])
+        assert classifier.classify('OK: previous fatal error resolved') == 'fatal'
+
+    def test_order_breaks_ties(self):
+        classifier = SeverityClassifier([{'keyword': 'warning'}, {'keyword': 'error'}])
+        assert classifier.classify('error: warning') == 'warning'
+
+    def test_word_boundaries(self):
+        classifier = SeverityClassifier([{'keyword': 'ok'}])
+        assert classifier.classify('Booking confirmed') is None
+        assert classifier.classify('Backup ok.') == 'ok'
+
+    def test_substring(self):
+        classifier = SeverityClassifier([{'keyword': 'not running', 'severity': 'err', 'word': False}])
+        assert classifier.classify('myresource: not running') == 'err'
+        assert classifier.classify('xnot runningx') == 'err'
+
+    def test_longest_keyword(self):
+        classifier = SeverityClassifier([
+            {'keyword': 'error', 'severity': 'err'},
+            {'keyword': 'error resolved', 'severity': 'ok', 'priority': 1},
+        ])
+        assert classifier.classify('Error resolved') == 'ok'
+
+    def test_overlapping_keywords(self):
+        classifier = SeverityClassifier([Rule('disk failure', priority=1), Rule('disk', 'warning', 10)])
+        assert classifier.match('disk failure').keyword == 'disk'
+        classifier = SeverityClassifier([Rule('error', priority=1), Rule('err', priority=10, word=False)])
+        assert classifier.match('disk error').keyword == 'err'
+        classifier = SeverityClassifier([Rule('ab', priority=1, word=False), Rule('bc', priority=10, word=False)])
+        assert classifier.match('abc').keyword == 'bc'
+
+    def test_overlapping_same_as_linear_search(self):
+        '''Keywords overlapping each other, with a small alphabet'''
+        rand = random.Random(42)
+        keywords = sorted({''.join(rand.choice('ab ') for _ in range(rand.randint(1, 5))).strip() for _ in range(40)} - {''})
+        rules = [Rule(keyword, priority=rand.randint(0, 5), word=rand.random() < 0.5) for keyword in keywords]
+        classifier = SeverityClassifier(rules)
+        for _ in range(200):
+            text = ''.join(rand.choice('ab .') for _ in range(20))
+            found = [
+                (rule.priority, -index) for index, rule in enumerate(rules)
+                if re.search((r'\b{}\b' if rule.word else '{}').format(re.escape(rule.keyword)), text)
+            ]
+            expected = rules[-max(found)[1]] if found else None
+            assert classifier.match(text) is expected
+
+    def test_special_characters(self):
+        classifier = SeverityClassifier([{'keyword': '[down]', 'severity': 'critical', 'word': False}])
+        assert classifier.classify('Link [DOWN] on eth0') == 'critical'
+        assert classifier.classify('Link d on eth0') is None
+
+    def test_ordered_rules(self):
+        classifier = SeverityClassifier(ordered_rules(['fatal', 'critical', 'ok']))
+        assert classifier.classify('ok: critical fatal') == 'fatal'
+        classifier = SeverityClassifier(ordered_rules({'unknown': 'unknown', 'cancelled': 'err'}, word=False))
+        assert classifier.classify('Cancelled (unknown)') == 'unknown'
+
+    def test_same_as_linear_search(self):
+        '''The classifier returns the same result as searching the rules one by one'''
+        rand = random.Random(42)
+        keywords = sorted({''.join(rand.choice(string.ascii_lowercase) for _ in range(rand.randint(3, 8))) for _ in range(300)})
+        rules = ordered_rules(keywords)
+        classifier = SeverityClassifier(rules)
+        for _ in range(200):
+            words = [rand.choice(keywords) if rand.random() < 0.1 else 'filler' for _ in range(10)]
+            text = ' '.join(words)
+            expected = next((rule.severity for rule in rules if rule.keyword in words), None)
+            assert classifier.classify(text) == expected
+
+class TestLoadRules:
+    def test_list(self, tmp_path):
+        path = tmp_path / 'rules.yaml'
+        path.write_text("- keyword: down\n  severity: critical\n  priority: 5\n- keyword: up\n  severity: ok\n")
+        rules = load_rules(path)
+        assert [(rule.keyword, rule.severity, rule.priority) for rule in rules] == [('down', 'critical', 5), ('up', 'ok', 0)]
+
+    def test_dict(self, tmp_path):
+        path = tmp_path / 'rules.yaml'
+        path.write_text("rules:\n  - keyword: down\n")
+        rules = load_rules(path)
+        assert len(rules) == 1
+        assert rules[0].severity == 'down'
+
+    def test_missing(self, tmp_path):
+        assert load_rules(tmp_path / 'missing.yaml') is None
+
+    @pytest.mark.parametrize('content', ["keyword: down\n", "- severity: critical\n", "- keyword: down\n  color: red\n"])
+    def test_invalid(self, tmp_path, content):
+        path = tmp_path / 'rules.yaml'
+        path.write_text(content)
+        assert load_rules(path) is None
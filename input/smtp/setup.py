@@ -24,6 +24,7 @@ setup(
     },
     install_requires=[
         'snooze-client',
+        'snooze-severity',
         'PyYAML',
         'pathlib',
     ],
@@ -1,22 +1,67 @@
 '''SMTP listener for snooze'''
 
-import asyncore
 import email
-import email.policy
 import logging
-import re
+import os
 
+import yaml
 from dateutil import parser
 from datetime import datetime
-from smtpd import SMTPServer
+from pathlib import Path
 
-from snooze_smtp.parser import parse_received
+from snooze_smtp.parser import parse_received, parse_mail, summarize_attachments
+from snooze_smtp.server import SMTPServer
+from snooze_severity.classifier import SeverityClassifier, load_rules, ordered_rules
 from snooze_client import Snooze
 
 LOG = logging.getLogger("snooze.smtp")
 logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s", level=logging.DEBUG)
 
-def make_record(mail, peer, mailfrom, rcpttos, domains):
+# By order of priority
+SEVERITY_KEYWORDS = [
+    'fatal',
+    'critical',
+    'warning',
+    'error',
+    'notice',
+    'info',
+    'success',
+    'ok',
+]
+
+DEFAULT_CLASSIFIER = SeverityClassifier(ordered_rules(SEVERITY_KEYWORDS))
+
+def load_config():
+    '''Load the configuration file'''
+    config = {}
+    config_file = Path(os.environ.get('SNOOZE_SMTP_CONFIG') or '/etc/snooze/smtp.yaml')
+    try:
+        with config_file.open('r') as myfile:
+            config = yaml.safe_load(myfile.read())
+    except Exception as err:
+        LOG.warning("Error loading config: %s", err)
+
+    if not isinstance(config, dict):
+        config = {}
+
+    return config
+
+def make_classifier(config):
+    '''
+    Return the severity classifier configured by `severity_rules` (inline rules),
+    or `severity_rules_file` (YAML file). Defaults to SEVERITY_KEYWORDS.
+    '''
+    rules = config.get('severity_rules')
+    if not rules and config.get('severity_rules_file'):
+        rules = load_rules(config['severity_rules_file'])
+    if rules:
+        try:
+            return SeverityClassifier(rules)
+        except Exception as err:
+            LOG.warning("Invalid severity rules, using the default ones: %s", err)
+    return DEFAULT_CLASSIFIER
+
+def make_record(mail, peer, mailfrom, rcpttos, domains, classifier=None):
     '''
     Create a snooze record from a mail and its SMTP reception data.
     '''
@@ -64,6 +109,11 @@ def make_record(mail, peer, mailfrom, rcpttos, domains):
         if data:
             body[content_type] = data.get_content()
 
+    # Attachments are only summarized, their content is never part of the record
+    attachments = summarize_attachments(mail)
+    if attachments:
+        smtp['attachments'] = attachments
+
     if mail.get('Date'):
         timestamp = parser.parse(mail['Date'])
     else:
@@ -72,7 +122,7 @@ def make_record(mail, peer, mailfrom, rcpttos, domains):
     record['source'] = 'smtp'
     record['process'] = user
 
-    severity = guess_severity(mail['Subject'])
+    severity = guess_severity(mail['Subject'], classifier)
     if severity:
         record['severity'] = severity
     else:
@@ -80,39 +130,47 @@ def make_record(mail, peer, mailfrom, rcpttos, domains):
 
     return record
 
-def guess_severity(subject):
+def guess_severity(subject, classifier=None):
     '''Guess the severity of the mail by looking at the subject'''
-    keywords = [
-        'fatal',
-        'critical',
-        'warning',
-        'error',
-        'notice',
-        'info',
-        'success',
-        'ok',
-    ]
-    for keyword in keywords:
-        if re.search(r"\b%s\b" % keyword, subject, re.IGNORECASE):
-            LOG.debug("Guessed the severity %s from subject '%s'", keyword, subject)
-            return keyword
-    else:
-        return None
+    return (classifier or DEFAULT_CLASSIFIER).classify(subject)
 
-class SnoozeSMTPServer(SMTPServer):
-    def __init__(self, domains, *args, **kwargs):
+class SnoozeSMTPServer:
+    '''
+    SMTP listener sending the mails received to snooze.
+    The mails are parsed and sent by a pool of workers, so that a slow
+    snooze server does not prevent new mails from being accepted.
+    '''
+    def __init__(self, domains, address, max_body_size=1048576, max_header_size=65536, classifier=None, **kwargs):
         LOG.info("Starting SMTP server...")
         self.snooze = Snooze()
         self.domains = domains
-        super().__init__(*args, **kwargs)
-
-    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
-        '''Method called every time an email is received'''
+        self.classifier = classifier
+        self.max_body_size = max_body_size
+        self.max_header_size = max_header_size
+        host, port = address
+        self.server = SMTPServer(
+            self.process_message,
+            host,
+            port,
+            max_kept_size=max_header_size + max_body_size,
+            **kwargs
+        )
+
+    def serve_forever(self):
+        '''Run the SMTP listener'''
+        self.server.run()
+
+    def process_message(self, peer, mailfrom, rcpttos, data, size):
+        '''Method called by a worker every time an email is received'''
         try:
             LOG.debug("Received mail from %s", mailfrom)
-            mail = email.message_from_bytes(data, policy=email.policy.SMTPUTF8)
+            mail, _, truncated = parse_mail(data, self.max_body_size, self.max_header_size)
 
-            record = make_record(mail, peer, mailfrom, rcpttos, self.domains)
+            record = make_record(mail, peer, mailfrom, rcpttos, self.domains, self.classifier)
+            if truncated or size > len(data):
+                LOG.debug("Mail from %s truncated (%d bytes)", mailfrom, size)
+                record['smtp']['size'] = size
+                record['smtp']['truncated'] = True
 
             LOG.debug("Will send alert to snooze: %s", record)
             self.snooze.alert(record)
@@ -124,11 +182,23 @@ class SnoozeSMTPServer(SMTPServer):
 
 def main():
     '''Main loop'''
-    SnoozeSMTPServer(['dc.odx.co.jp'], ('0.0.0.0', 1025), None)
+    config = load_config()
+    server = SnoozeSMTPServer(
+        config.get('domains', ['dc.odx.co.jp']),
+        (config.get('listening_address', '0.0.0.0'), config.get('listening_port', 1025)),
+        max_body_size=config.get('max_body_size', 1048576),
+        max_header_size=config.get('max_header_size', 65536),
+        classifier=make_classifier(config),
+        max_message_size=config.get('max_message_size', 33554432),
+        workers=config.get('workers', 4),
+        max_pending=config.get('max_pending', 100),
+    )
     try:
-        asyncore.loop()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        LOG.info("Exiting SMTP server")
     except Exception as err:
-        print("Exception during loop: %s" % err)
+        LOG.error("Exception during loop: %s", err)
 
 if __name__ == '__main__':
     main()
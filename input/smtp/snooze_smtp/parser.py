@@ -1,43 +1,230 @@
 '''Module for miscellaneous parsers'''
 
+import email.policy
+import functools
 import re
+from email.parser import BytesFeedParser
 from dateutil.parser import parse
 
-OPT_SPACE = r'[\n\r\s]*'
-SPACE = r'[\n\r\s]+'
-REGEX_STR = ''.join([
-    '(',
-    'from', SPACE, r'(?P<from>.*?)', SPACE,
-    r'\(', r'(?P<from_domain>.*?)', OPT_SPACE, r'\[(?P<from_ip>.*?)\]', r'\)', SPACE,
-    ')?',
-    'by', SPACE, r'(?P<by>.*?)', OPT_SPACE, r'(\((?P<by_comment>.*?)\))?', SPACE,
-    'with', SPACE, r'(?P<with>.*?)', SPACE,
-    'id', SPACE, r'(?P<id>.*?)', OPT_SPACE,
-    '(', 'for', SPACE, r'(?P<for>.*?)', OPT_SPACE, '(', r'\(', r'(?P<for_comment>.*?)', r'\)', ')?', ')?',
-    OPT_SPACE, ';', OPT_SPACE,
-    r'(?P<date>.*)',
-])
+# Words, comment delimiters, and the separator of the date. None of these
+# patterns can backtrack, so tokenizing is linear in the size of the header.
+TOKEN = re.compile(r'[^\s();]+|[();]|\s+')
 
-REGEX = re.compile(REGEX_STR, re.M)
+# Keywords of the clauses of a Received header (RFC 5321 section 4.4)
+CLAUSES = ('from', 'by', 'via', 'with', 'id', 'for')
 
+# Longer strings are not dates, and are not worth a try
+MAX_DATE_LENGTH = 128
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(date):
+    '''
+    Return the date in ISO format, or the date unchanged if it cannot be parsed.
+    The same relays often appear in many mails within the same second, so the
+    results are cached.
+    '''
+    if len(date) > MAX_DATE_LENGTH:
+        return date
+    try:
+        return parse(date).isoformat()
+    except Exception:
+        return date
+
+def tokenize_received(received):
+    '''
+    Split a Received header in a list of words and comments, and the date.
+    Comments (between parenthesis, possibly nested) are returned as a tuple
+    containing their content. An unclosed comment runs to the end of the header.
+    '''
+    tokens = []
+    date = None
+    depth = 0
+    comment_start = 0
+    for match in TOKEN.finditer(received):
+        token = match.group()
+        if token == '(':
+            if depth == 0:
+                comment_start = match.end()
+            depth += 1
+        elif token == ')':
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    tokens.append((received[comment_start:match.start()].strip(),))
+        elif depth > 0 or token.isspace():
+            continue
+        elif token == ';':
+            date = received[match.end():].strip()
+            break
+        else:
+            tokens.append(token)
+    if depth > 0:
+        tokens.append((received[comment_start:].strip(),))
+    return tokens, date
 
 def parse_received(received):
     '''
     Parse the information in the Received field.
     Will follow the RFC822.
+    Return None if the header has no `by` clause or no date.
     '''
-    match = re.match(REGEX, received)
-    if match:
-        relay = dict(match.groupdict())
+    tokens, date = tokenize_received(received)
+    if date is None:
+        return None
+    relay = {}
+    clause = None
+    for token in tokens:
+        if isinstance(token, tuple):
+            # Comment following the value of a clause
+            comment = token[0]
+            if clause not in relay:
+                continue
+            if clause == 'from' and 'from_domain' not in relay:
+                domain, sep, rest = comment.partition('[')
+                if sep:
+                    relay['from_ip'] = rest.partition(']')[0]
+                relay['from_domain'] = domain.strip()
+            elif clause in ('by', 'for') and clause + '_comment' not in relay:
+                relay[clause + '_comment'] = comment
+            continue
+        keyword = token.lower()
+        if keyword in CLAUSES and (clause is None or clause in relay):
+            clause = keyword
+        elif clause is not None and clause not in relay:
+            relay[clause] = token
+    if 'by' not in relay:
+        return None
+    relay['timestamp'] = parse_date(date)
+    return relay
 
-        # Date formatting
-        date = relay.pop('date')
-        try:
-            relay['timestamp'] = parse(date).isoformat()
-        except Exception:
-            relay['timestamp'] = date
 
-        relay = {k: v for k, v in relay.items() if v is not None}
-        return relay
-    else:
-        return None
+HEADER_END = re.compile(rb'\r?\n\r?\n')
+
+class MailFeedParser:
+    '''
+    Incremental mail parser keeping the memory used by a message bounded.
+    The headers are always parsed (up to `max_header_size` bytes, the header
+    lines past this size are dropped), but only the first `max_body_size` bytes
+    of the body are fed to the email parser. The rest of the body is only counted.
+    '''
+    def __init__(self, max_body_size=1048576, max_header_size=65536, policy=email.policy.SMTPUTF8):
+        self.parser = BytesFeedParser(policy=policy)
+        self.max_body_size = max_body_size
+        self.max_header_size = max_header_size
+        self.in_headers = True
+        self.skipping_headers = False
+        self.headers_truncated = False
+        self.headers = b''
+        self.header_size = 0
+        self.body_size = 0
+
+    @property
+    def size(self):
+        '''Total size of the message fed so far'''
+        return self.header_size + self.body_size
+
+    @property
+    def truncated(self):
+        '''True if some of the headers or of the body were not parsed'''
+        return self.headers_truncated or self.body_size > self.max_body_size
+
+    def _end_headers(self):
+        '''
+        Feed the headers up to the last complete line within `max_header_size`,
+        and end the header section, so that the header lines past the limit are
+        not parsed as headers. They are dropped until the blank line separator.
+        Return the data past the headers fed.
+        '''
+        cut = self.headers.rfind(b'\n', 0, self.max_header_size) + 1
+        if cut:
+            self.parser.feed(self.headers[:cut] + b'\r\n')
+            # The dropped data starts at the beginning of a line
+            previous = b'\n'
+        else:
+            cut = self.max_header_size
+            self.parser.feed(self.headers[:cut] + b'\r\n\r\n')
+            previous = b''
+        data = self.headers[cut:]
+        self.header_size = cut
+        self.headers = previous
+        self.headers_truncated = True
+        self.skipping_headers = True
+        return data
+
+    def _skip_headers(self, data):
+        '''
+        Drop the header lines past the limit until the blank line separator.
+        Return the data following it, or None if it was not found yet.
+        '''
+        previous = len(self.headers)
+        self.headers += data
+        match = HEADER_END.search(self.headers)
+        if match is None:
+            self.header_size += len(data)
+            self.headers = self.headers[-3:]
+            return None
+        self.header_size += match.end() - previous
+        data = self.headers[match.end():]
+        self.headers = b''
+        self.skipping_headers = False
+        return data
+
+    def feed(self, data):
+        '''Feed a chunk of the raw message'''
+        if self.in_headers:
+            start = max(0, len(self.headers) - 3)
+            self.headers += data
+            match = HEADER_END.search(self.headers, start)
+            if match and match.end() <= self.max_header_size:
+                data = self.headers[match.end():]
+                self.headers = self.headers[:match.end()]
+                self.header_size = len(self.headers)
+                self.parser.feed(self.headers)
+                self.headers = b''
+            elif len(self.headers) > self.max_header_size:
+                data = self._end_headers()
+            else:
+                return
+            self.in_headers = False
+        if self.skipping_headers:
+            data = self._skip_headers(data)
+            if data is None:
+                return
+        allowed = self.max_body_size - self.body_size
+        if allowed > 0:
+            self.parser.feed(data[:allowed])
+        self.body_size += len(data)
+
+    def close(self):
+        '''Finish the parsing and return the message'''
+        if self.in_headers:
+            self.header_size = len(self.headers)
+            self.parser.feed(self.headers)
+            self.headers = b''
+        return self.parser.close()
+
+def parse_mail(data, max_body_size=1048576, max_header_size=65536):
+    '''
+    Parse a raw mail, and return the message along with its size and
+    whether its body was truncated.
+    '''
+    feeder = MailFeedParser(max_body_size, max_header_size)
+    feeder.feed(data)
+    mail = feeder.close()
+    return mail, feeder.size, feeder.truncated
+
+def summarize_attachments(mail):
+    '''Return the filename, content type and (encoded) size of the attachments of a mail'''
+    attachments = []
+    if not mail.is_multipart():
+        return attachments
+    for part in mail.walk():
+        if part.is_multipart() or part.get_content_disposition() != 'attachment':
+            continue
+        payload = part.get_payload(decode=False) or ''
+        attachments.append({
+            'filename': part.get_filename() or '',
+            'content_type': part.get_content_type(),
+            'size': len(payload),
+        })
+    return attachments
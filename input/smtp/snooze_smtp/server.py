@@ -0,0 +1,267 @@
+'''Asyncio SMTP server, delegating the processing of the mails to a pool of workers'''
+
+import asyncio
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger("snooze.smtp.server")
+
+def parse_path(arg, keyword):
+    '''
+    Parse the argument of MAIL/RCPT (`FROM:<address> PARAM=VALUE ...`).
+    Return the address and a dict of the ESMTP parameters, or None if the syntax is invalid.
+    '''
+    if not arg[:len(keyword)].upper() == keyword:
+        return None
+    arg = arg[len(keyword):].strip()
+    if arg.startswith('<'):
+        address, sep, rest = arg[1:].partition('>')
+        if not sep:
+            return None
+    else:
+        address, _, rest = arg.partition(' ')
+    params = {}
+    for param in rest.split():
+        key, _, value = param.partition('=')
+        params[key.upper()] = value or True
+    return address, params
+
+class SMTPSession:
+    '''A SMTP session with one client'''
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.greeted = False
+        self.closing = False
+        self.reset()
+
+    def reset(self):
+        '''Reset the mail transaction'''
+        self.mailfrom = None
+        self.rcpttos = []
+
+    async def push(self, line):
+        '''Send a reply to the client'''
+        self.writer.write(line.encode('utf-8') + b'\r\n')
+        await self.writer.drain()
+
+    async def readline(self):
+        '''
+        Read a line from the client. Return an empty bytestring on timeout or disconnection,
+        and None if the line is longer than the stream limit (the whole line is discarded)
+        '''
+        try:
+            return await asyncio.wait_for(self._readline(), self.server.timeout)
+        except asyncio.TimeoutError:
+            return b''
+
+    async def _readline(self):
+        overrun = False
+        while True:
+            try:
+                line = await self.reader.readuntil(b'\n')
+            except asyncio.LimitOverrunError as err:
+                # Discard what was received of the line, until its end arrives
+                await self.reader.readexactly(err.consumed)
+                overrun = True
+                continue
+            except asyncio.IncompleteReadError as err:
+                line = err.partial
+            if overrun:
+                LOG.debug("Dropped a line longer than %d bytes from %s", self.server.line_limit, self.peer)
+                return None if line else b''
+            return line
+
+    async def run(self):
+        '''Process the commands of the client until it quits'''
+        try:
+            await self.push('220 {} ESMTP Snooze'.format(self.server.hostname))
+            # Commands are processed one at a time, in the order they were received.
+            # This is enough to support pipelining (RFC 2920).
+            while not self.closing:
+                line = await self.readline()
+                if line is None:
+                    await self.push('500 Error: line too long')
+                    continue
+                if not line:
+                    break
+                command, _, arg = line.decode('utf-8', 'replace').rstrip('\r\n').partition(' ')
+                method = getattr(self, 'smtp_' + command.upper(), None)
+                if method is None:
+                    await self.push('500 Error: command "{}" not recognized'.format(command))
+                    continue
+                await method(arg.strip())
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            LOG.debug("Connection with %s lost: %s", self.peer, err)
+        finally:
+            self.writer.close()
+
+    async def smtp_HELO(self, arg):
+        if not arg:
+            await self.push('501 Syntax: HELO hostname')
+            return
+        self.greeted = True
+        self.reset()
+        await self.push('250 {}'.format(self.server.hostname))
+
+    async def smtp_EHLO(self, arg):
+        if not arg:
+            await self.push('501 Syntax: EHLO hostname')
+            return
+        self.greeted = True
+        self.reset()
+        await self.push('250-{}'.format(self.server.hostname))
+        await self.push('250-SIZE {}'.format(self.server.max_message_size))
+        await self.push('250-8BITMIME')
+        await self.push('250-SMTPUTF8')
+        await self.push('250 PIPELINING')
+
+    async def smtp_NOOP(self, arg):
+        await self.push('250 OK')
+
+    async def smtp_RSET(self, arg):
+        self.reset()
+        await self.push('250 OK')
+
+    async def smtp_VRFY(self, arg):
+        await self.push('252 Cannot VRFY user, but will accept message and attempt delivery')
+
+    async def smtp_QUIT(self, arg):
+        await self.push('221 Bye')
+        self.closing = True
+
+    async def smtp_MAIL(self, arg):
+        if not self.greeted:
+            await self.push('503 Error: send HELO first')
+            return
+        if self.mailfrom is not None:
+            await self.push('503 Error: nested MAIL command')
+            return
+        path = parse_path(arg, 'FROM:')
+        if path is None:
+            await self.push('501 Syntax: MAIL FROM:<address>')
+            return
+        address, params = path
+        size = params.get('SIZE')
+        if size and str(size).isdigit() and int(size) > self.server.max_message_size:
+            await self.push('552 Error: message size exceeds fixed maximum message size')
+            return
+        self.mailfrom = address
+        await self.push('250 OK')
+
+    async def smtp_RCPT(self, arg):
+        if self.mailfrom is None:
+            await self.push('503 Error: need MAIL command')
+            return
+        path = parse_path(arg, 'TO:')
+        if path is None or not path[0]:
+            await self.push('501 Syntax: RCPT TO:<address>')
+            return
+        self.rcpttos.append(path[0])
+        await self.push('250 OK')
+
+    async def smtp_DATA(self, arg):
+        if not self.rcpttos:
+            await self.push('503 Error: need RCPT command')
+            return
+        await self.push('354 End data with <CR><LF>.<CR><LF>')
+        # Only the beginning of the mail is kept in memory, the rest is only counted
+        data = bytearray()
+        size = 0
+        too_long = False
+        while True:
+            line = await self.readline()
+            if line is None:
+                too_long = True
+                continue
+            if not line:
+                self.closing = True
+                return
+            if line in (b'.\r\n', b'.\n'):
+                break
+            if line.startswith(b'.'):
+                line = line[1:]
+            size += len(line)
+            remaining = self.server.max_kept_size - len(data)
+            if remaining > 0:
+                data += line[:remaining]
+        if too_long:
+            await self.push('500 Error: line too long')
+        elif size > self.server.max_message_size:
+            await self.push('552 Error: message size exceeds fixed maximum message size')
+        else:
+            await self.server.dispatch(self.peer, self.mailfrom, self.rcpttos, bytes(data), size)
+            await self.push('250 OK')
+        self.reset()
+
+class SMTPServer:
+    '''
+    Asyncio SMTP server.
+    The event loop only handles the SMTP sessions. Every mail received is given
+    to `handler(peer, mailfrom, rcpttos, data, size)` in a pool of worker threads.
+    When `max_pending` mails are waiting to be processed, the sessions wait before
+    acknowledging the end of DATA.
+    '''
+    def __init__(self, handler, host='0.0.0.0', port=1025, hostname=None, workers=4, max_pending=100,
+            max_message_size=33554432, max_kept_size=1114112, line_limit=1048576, timeout=300):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.hostname = hostname or socket.getfqdn()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_message_size = max_message_size
+        self.max_kept_size = max_kept_size
+        self.line_limit = line_limit
+        self.timeout = timeout
+        self.executor = None
+        self.server = None
+        self.semaphore = None
+        self.pending = set()
+
+    async def start(self):
+        '''Start listening'''
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.semaphore = asyncio.Semaphore(self.max_pending)
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=self.line_limit)
+        LOG.info("Listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        '''Stop listening, and wait for the pending mails to be processed'''
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pending:
+            await asyncio.wait(self.pending)
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+    async def handle_client(self, reader, writer):
+        await SMTPSession(self, reader, writer).run()
+
+    async def dispatch(self, *args):
+        '''Give a mail to the pool of workers'''
+        await self.semaphore.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.handler, *args)
+        self.pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self.pending.discard(future)
+        self.semaphore.release()
+        if not future.cancelled() and future.exception():
+            LOG.error("Error processing mail: %s", future.exception())
+
+    def run(self):
+        '''Run the server until interrupted'''
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.start())
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(self.stop())
+            loop.close()
@@ -1,4 +1,8 @@
-from snooze_smtp.parser import parse_received
+import random
+import time
+from email.message import EmailMessage
+
+from snooze_smtp.parser import parse_received, parse_date, parse_mail, summarize_attachments, MailFeedParser
 
 class TestParseReceived:
 
@@ -42,3 +46,128 @@ class TestParseReceived:
         assert relay['with'] == 'SMTPS'
         assert relay['id'] == 'myid12345'
         assert relay['timestamp'] == '2021-08-16T08:00:37-07:00'
+
+    def test_comments(self):
+        received = "from mx01.example.com (unknown [1.2.3.4]) by mx.example2.com (Postfix (nested)) with ESMTP;" \
+        + " Mon, 16 Aug 2021 08:00:37 -0700 (PDT)"
+        relay = parse_received(received)
+        assert relay['from_domain'] == 'unknown'
+        assert relay['from_ip'] == '1.2.3.4'
+        assert relay['by'] == 'mx.example2.com'
+        assert relay['by_comment'] == 'Postfix (nested)'
+        assert relay['with'] == 'ESMTP'
+        assert 'id' not in relay
+        assert relay['timestamp'] == '2021-08-16T08:00:37-07:00'
+
+    def test_invalid(self):
+        assert parse_received('by mx.example.com with SMTP id myid123456789') is None
+        assert parse_received('from mx.example.com; Mon, 16 Aug 2021 23:50:33 -0700') is None
+        assert parse_received('') is None
+
+    def test_invalid_date(self):
+        relay = parse_received('by mx.example.com; not a date')
+        assert relay['timestamp'] == 'not a date'
+
+    def test_date_cache(self):
+        parse_date.cache_clear()
+        for _ in range(10):
+            parse_received('by mx.example.com with SMTP id myid; Mon, 16 Aug 2021 23:50:33 -0700 (PDT)')
+        info = parse_date.cache_info()
+        assert info.misses == 1
+        assert info.hits == 9
+
+class TestParseReceivedPathological:
+    '''Headers that would cause catastrophic backtracking in a regex based parser'''
+
+    def assert_fast(self, received, max_seconds=1.0):
+        start = time.perf_counter()
+        parse_received(received)
+        assert time.perf_counter() - start < max_seconds
+
+    def test_repeated_clauses(self):
+        self.assert_fast('by x with y id z ' * 20000)
+        self.assert_fast('from a (b [c]) by x with y id z for w ' * 10000 + ';')
+
+    def test_unclosed(self):
+        self.assert_fast('from a (b [' + 'c ' * 50000)
+        self.assert_fast('by ' + '(' * 50000 + '; Mon, 16 Aug 2021 23:50:33 -0700')
+        self.assert_fast('by ' + ')' * 50000 + '; Mon, 16 Aug 2021 23:50:33 -0700')
+
+    def test_whitespace(self):
+        self.assert_fast('from' + ' \r\n\t' * 50000 + 'by x')
+        self.assert_fast('by x with y id z; ' + ' ' * 100000)
+
+    def test_fuzz(self):
+        rand = random.Random(42)
+        vocabulary = ['from', 'by', 'with', 'id', 'for', 'via', '(', ')', '[', ']', ';', ' ', '\n', 'mx.example.com',
+            '1.2.3.4', '<john.doe@example.com>', 'Mon, 16 Aug 2021 23:50:33 -0700']
+        start = time.perf_counter()
+        for _ in range(2000):
+            received = ' '.join(rand.choice(vocabulary) for _ in range(rand.randint(0, 200)))
+            relay = parse_received(received)
+            assert relay is None or 'by' in relay
+        assert time.perf_counter() - start < 5.0
+
+class TestParseMail:
+
+    def test_truncated(self):
+        data = b'Subject: Cron output\r\nFrom: cron@example.com\r\n\r\n' + b'x' * 5000
+        mail, size, truncated = parse_mail(data, max_body_size=100)
+        assert mail['Subject'] == 'Cron output'
+        assert len(mail.get_content()) == 100
+        assert size == len(data)
+        assert truncated
+
+    def test_not_truncated(self):
+        data = b'Subject: Cron output\r\nFrom: cron@example.com\r\n\r\nShort message\r\n'
+        mail, size, truncated = parse_mail(data, max_body_size=100)
+        assert mail.get_content() == 'Short message\r\n'
+        assert size == len(data)
+        assert not truncated
+
+    def test_feed_chunks(self):
+        data = b'Subject: Cron output\r\nFrom: cron@example.com\r\n\r\n' + b'x' * 5000
+        feeder = MailFeedParser(max_body_size=100)
+        for index in range(0, len(data), 7):
+            feeder.feed(data[index:index+7])
+        mail = feeder.close()
+        assert mail['Subject'] == 'Cron output'
+        assert mail['From'] == 'cron@example.com'
+        assert len(mail.get_content()) == 100
+        assert feeder.size == len(data)
+
+    def test_header_size(self):
+        headers = b'Subject: Cron output\r\n' + b''.join(b'X-Filler-%d: value\r\n' % index for index in range(100))
+        data = headers + b'From: cron@example.com\r\n\r\nShort message\r\n'
+        for chunk_size in (len(data), 7):
+            feeder = MailFeedParser(max_header_size=200)
+            for index in range(0, len(data), chunk_size):
+                feeder.feed(data[index:index+chunk_size])
+            mail = feeder.close()
+            assert mail['Subject'] == 'Cron output'
+            # The header lines past the limit are dropped, not parsed as headers nor as body
+            assert mail['From'] is None
+            assert len(mail.keys()) < 20
+            assert mail.get_content() == 'Short message\r\n'
+            assert feeder.size == len(data)
+            assert feeder.truncated
+
+    def test_header_line_size(self):
+        data = b'Subject: ' + b'x' * 500 + b'\r\nFrom: cron@example.com\r\n\r\nShort message\r\n'
+        mail, size, truncated = parse_mail(data, max_header_size=100)
+        assert mail['From'] is None
+        assert mail.get_content() == 'Short message\r\n'
+        assert size == len(data)
+        assert truncated
+
+    def test_attachments(self):
+        mail = EmailMessage()
+        mail['Subject'] = 'Backup report'
+        mail.set_content('See attached log')
+        mail.add_attachment(b'x' * 3000, maintype='application', subtype='gzip', filename='backup.log.gz')
+        mail, _, _ = parse_mail(mail.as_bytes())
+        attachments = summarize_attachments(mail)
+        assert len(attachments) == 1
+        assert attachments[0]['filename'] == 'backup.log.gz'
+        assert attachments[0]['content_type'] == 'application/gzip'
+        assert attachments[0]['size'] >= 4000
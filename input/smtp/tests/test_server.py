@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+from snooze_smtp.server import SMTPServer, parse_path
+
+def run_session(commands, handler, **kwargs):
+    '''
+    Start a server on a random port, send all the commands at once (or the chunks of
+    a list one by one), and return the replies
+    '''
+    async def session():
+        server = SMTPServer(handler, '127.0.0.1', 0, hostname='mx.example.com', **kwargs)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for chunk in commands if isinstance(commands, list) else [commands]:
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0.05)
+        replies = (await reader.read()).decode().splitlines()
+        writer.close()
+        await server.stop()
+        return replies
+    return asyncio.run(session())
+
+class TestParsePath:
+    def test_simple(self):
+        assert parse_path('FROM:<john@example.com>', 'FROM:') == ('john@example.com', {})
+
+    def test_params(self):
+        assert parse_path('from:<john@example.com> SIZE=1000 BODY=8BITMIME', 'FROM:') == \
+            ('john@example.com', {'SIZE': '1000', 'BODY': '8BITMIME'})
+
+    def test_invalid(self):
+        assert parse_path('<john@example.com>', 'FROM:') is None
+
+class TestSMTPServer:
+    def test_pipelining(self):
+        mails = []
+        def handler(peer, mailfrom, rcpttos, data, size):
+            mails.append((mailfrom, rcpttos, data, size, threading.current_thread()))
+        replies = run_session(
+            b'EHLO client.example.com\r\n'
+            b'MAIL FROM:<cron@myhost01.example.com>\r\n'
+            b'RCPT TO:<root@example.com>\r\n'
+            b'DATA\r\n'
+            b'Subject: test\r\n\r\nline 1\r\n..line 2\r\n.\r\n'
+            b'QUIT\r\n',
+            handler,
+        )
+        assert replies[0] == '220 mx.example.com ESMTP Snooze'
+        assert '250 PIPELINING' in replies
+        assert replies[-4:] == ['250 OK', '354 End data with <CR><LF>.<CR><LF>', '250 OK', '221 Bye']
+        assert len(mails) == 1
+        mailfrom, rcpttos, data, size, thread = mails[0]
+        assert mailfrom == 'cron@myhost01.example.com'
+        assert rcpttos == ['root@example.com']
+        assert data == b'Subject: test\r\n\r\nline 1\r\n.line 2\r\n'
+        assert size == len(data)
+        assert thread is not threading.main_thread()
+
+    def test_size_cap(self):
+        mails = []
+        def handler(peer, mailfrom, rcpttos, data, size):
+            mails.append((data, size))
+        run_session(
+            b'HELO client\r\nMAIL FROM:<a@b.c>\r\nRCPT TO:<d@e.f>\r\nDATA\r\n'
+            + b'x' * 1000 + b'\r\n.\r\nQUIT\r\n',
+            handler,
+            max_kept_size=100,
+        )
+        assert mails == [(b'x' * 100, 1002)]
+
+    def test_message_too_big(self):
+        mails = []
+        replies = run_session(
+            b'HELO client\r\nMAIL FROM:<a@b.c> SIZE=2000\r\nQUIT\r\n',
+            lambda *args: mails.append(args),
+            max_message_size=1000,
+        )
+        assert replies[2].startswith('552')
+        assert not mails
+
+    def test_bad_sequence(self):
+        replies = run_session(b'MAIL FROM:<a@b.c>\r\nHELO client\r\nDATA\r\nFOO\r\nQUIT\r\n', lambda *args: None)
+        assert replies[1].startswith('503')
+        assert replies[3].startswith('503')
+        assert replies[4].startswith('500')
+
+    def test_line_too_long(self):
+        # The end of the line arrives after the limit was reached: it is not a command
+        replies = run_session([b'HELO client\r\n' + b'x' * 200, b'QUIT\r\n', b'NOOP\r\nQUIT\r\n'],
+            lambda *args: None, line_limit=64)
+        assert replies[1:] == ['250 mx.example.com', '500 Error: line too long', '250 OK', '221 Bye']
+
+    def test_line_too_long_in_data(self):
+        mails = []
+        replies = run_session(
+            [b'HELO client\r\nMAIL FROM:<a@b.c>\r\nRCPT TO:<d@e.f>\r\nDATA\r\nline 1\r\n' + b'x' * 200,
+                b'.\r\nline 2\r\n.\r\nQUIT\r\n'],
+            lambda *args: mails.append(args),
+            line_limit=64,
+        )
+        # The end of the long line does not end the message
+        assert replies[-2:] == ['500 Error: line too long', '221 Bye']
+        assert not mails
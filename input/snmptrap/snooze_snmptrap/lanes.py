@@ -0,0 +1,62 @@
+'''Queue partitioned in lanes, to keep the ordering of the traps of each device'''
+
+import logging
+import threading
+import zlib
+from queue import Queue
+
+log = logging.getLogger("snooze.snmptrap.lanes")
+
+class LaneQueue:
+    '''
+    A set of FIFO queues (lanes), each one consumed by a single worker.
+    Records are dispatched to a lane by hashing their `source_ip`, so the
+    records of a given device are always processed in the order they were
+    received, while different devices are processed in parallel.
+    '''
+    def __init__(self, lanes=4):
+        self.lanes = [Queue() for _ in range(max(1, lanes))]
+        self.received = [0] * len(self.lanes)
+        self.high_water = [0] * len(self.lanes)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lanes)
+
+    def lane_index(self, record):
+        '''Return the index of the lane a record belongs to'''
+        key = str(record.get('source_ip', '')).encode()
+        return zlib.crc32(key) % len(self.lanes)
+
+    def put(self, record):
+        '''Queue a record in the lane of its device'''
+        index = self.lane_index(record)
+        lane = self.lanes[index]
+        lane.put(record)
+        depth = lane.qsize()
+        with self.lock:
+            self.received[index] += 1
+            if depth > self.high_water[index]:
+                self.high_water[index] = depth
+
+    def get(self, index):
+        '''Wait for the next record of a lane'''
+        return self.lanes[index].get()
+
+    def stop(self):
+        '''Ask the worker of every lane to stop'''
+        for lane in self.lanes:
+            lane.put(None)
+
+    def stats(self):
+        '''Return the current depth, high-water mark and number of records received for every lane'''
+        with self.lock:
+            return [
+                {
+                    'lane': index,
+                    'depth': lane.qsize(),
+                    'high_water': self.high_water[index],
+                    'received': self.received[index],
+                }
+                for index, lane in enumerate(self.lanes)
+            ]
@@ -5,8 +5,7 @@ import datetime
 import logging
 import os
 import yaml
-from multiprocessing import JoinableQueue
-from threading import Thread
+from threading import Event, Thread
 from pathlib import Path
 
 from pysnmp.carrier.asyncio.dgram import udp
@@ -20,6 +19,10 @@ from pysnmp.smi.error import MibNotFoundError, NoSuchObjectError
 from pysnmp.proto.api import v2c
 
 from snooze_client import Snooze
+from snooze_snmptrap.lanes import LaneQueue
+from snooze_snmptrap.usm import (
+    AUTH_HASHES, EngineIdCache, SourceLimiter, authenticate, hash_passphrase, localize_key, usm_parameters,
+)
 
 log = logging.getLogger("snooze.snmptrap")
 logging.basicConfig(
@@ -30,6 +33,39 @@ logging.basicConfig(
 MAP_TABLE = {
 }
 
+AUTH_PROTOCOLS = {
+    "none": config.usmNoAuthProtocol,
+    "md5": config.usmHMACMD5AuthProtocol,
+    "sha": config.usmHMACSHAAuthProtocol,
+    "sha224": config.usmHMAC128SHA224AuthProtocol,
+    "sha256": config.usmHMAC192SHA256AuthProtocol,
+    "sha384": config.usmHMAC256SHA384AuthProtocol,
+    "sha512": config.usmHMAC384SHA512AuthProtocol,
+}
+
+PRIV_PROTOCOLS = {
+    "none": config.usmNoPrivProtocol,
+    "des": config.usmDESPrivProtocol,
+    "3des": config.usm3DESEDEPrivProtocol,
+    "aes": config.usmAesCfb128Protocol,
+    "aes128": config.usmAesCfb128Protocol,
+    "aes192": config.usmAesCfb192Protocol,
+    "aes256": config.usmAesCfb256Protocol,
+}
+
+WILDCARD_ENGINE_ID = OctetString(hexValue='0000000000')
+
+
+class LearningUdpTransport(udp.UdpTransport):
+    '''UDP transport giving every datagram to `on_datagram(datagram, address)` before pysnmp processes it'''
+    def __init__(self, on_datagram, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, datagram, transportAddress):
+        self.on_datagram(datagram, transportAddress)
+        super().datagram_received(datagram, transportAddress)
+
 
 class SNMPTrap:
     def __init__(
@@ -41,6 +77,10 @@ class SNMPTrap:
         mib_list=None,
         community="public",
         v3_users=None,
+        engine_cache=None,
+        engine_cache_size=100000,
+        learn_engine_ids=False,
+        learn_interval=60,
     ):
         self.queue = queue
         self.mib_dirs = mib_dirs or ["/usr/share/snmp/mibs"]
@@ -51,75 +91,124 @@ class SNMPTrap:
 
         self.snmp_engine = engine.SnmpEngine()
 
+        if learn_engine_ids and v3_users:
+            transport = LearningUdpTransport(self._learn_engine_id)
+        else:
+            transport = udp.UdpTransport()
         config.addTransport(
             self.snmp_engine,
             udp.domainName,
-            udp.UdpTransport().openServerMode((bind_address, port)),
+            transport.openServerMode((bind_address, port)),
         )
 
         # SNMPv1/v2c community string
         config.addV1System(self.snmp_engine, "my-area", community)
 
         # SNMPv3 users
-        v3_users = v3_users or []
-        for user in v3_users:
+        self.v3_users = {}
+        for user in v3_users or []:
             username = user.get("username")
-            auth_key = user.get("auth_key")
-            priv_key = user.get("priv_key")
-            auth_protocol = user.get("auth_protocol", "none")
-            priv_protocol = user.get("priv_protocol", "none")
-
-            # Map auth protocol
-            auth_proto_map = {
-                "none": config.usmNoAuthProtocol,
-                "md5": config.usmHMACMD5AuthProtocol,
-                "sha": config.usmHMACSHAAuthProtocol,
-                "sha224": config.usmHMAC128SHA224AuthProtocol,
-                "sha256": config.usmHMAC192SHA256AuthProtocol,
-                "sha384": config.usmHMAC256SHA384AuthProtocol,
-                "sha512": config.usmHMAC384SHA512AuthProtocol,
-            }
-            # Map priv protocol
-            priv_proto_map = {
-                "none": config.usmNoPrivProtocol,
-                "des": config.usmDESPrivProtocol,
-                "3des": config.usm3DESEDEPrivProtocol,
-                "aes": config.usmAesCfb128Protocol,
-                "aes128": config.usmAesCfb128Protocol,
-                "aes192": config.usmAesCfb192Protocol,
-                "aes256": config.usmAesCfb256Protocol,
-            }
-
-            auth_proto = auth_proto_map.get(auth_protocol.lower(), config.usmNoAuthProtocol)
-            priv_proto = priv_proto_map.get(priv_protocol.lower(), config.usmNoPrivProtocol)
-
-            log.info("Adding SNMPv3 user: %s (auth=%s, priv=%s)", username, auth_protocol, priv_protocol)
+            self.v3_users[username] = user
+            log.info(
+                "Adding SNMPv3 user: %s (auth=%s, priv=%s)",
+                username, user.get("auth_protocol", "none"), user.get("priv_protocol", "none"),
+            )
+            self._add_v3_user(user)
+            for engine_id in user.get("engine_ids", []):
+                self._add_v3_user(user, OctetString(hexValue=engine_id))
+
+        # Authenticated SNMPv3 traps need one USM entry per authoritative engine ID.
+        # The engine IDs are learned from the traps received from a known user with an
+        # unknown engine ID, once the trap is authenticated with the key of the user
+        # localized for this engine ID. They are persisted so that they are known
+        # again after a restart.
+        self.known_engines = {
+            (bytes(OctetString(hexValue=engine_id)), user.get("username"))
+            for user in v3_users or [] for engine_id in user.get("engine_ids", [])
+        }
+        self.engine_cache = EngineIdCache(engine_cache, max_entries=engine_cache_size)
+        for engine_id, username in self.engine_cache.load():
+            if username in self.v3_users:
+                self._add_v3_user(self.v3_users[username], OctetString(engine_id))
+                self.known_engines.add((engine_id, username))
+        self.learn_limiter = SourceLimiter(learn_interval)
+        self.auth_keys = {}
+
+        ntfrcv.NotificationReceiver(self.snmp_engine, self._cbFun)
 
+        self._load_mibs()
+
+    def _add_v3_user(self, user, engine_id=None):
+        '''Register a SNMPv3 user in the USM table, for a given authoritative engine ID'''
+        auth_proto = AUTH_PROTOCOLS.get(user.get("auth_protocol", "none").lower(), config.usmNoAuthProtocol)
+        priv_proto = PRIV_PROTOCOLS.get(user.get("priv_protocol", "none").lower(), config.usmNoPrivProtocol)
+        kwargs = {}
+        if engine_id is not None:
+            kwargs["securityEngineId"] = engine_id
+        elif auth_proto == config.usmNoAuthProtocol:
             # For SNMPv3 TRAP reception with no authentication, we use the magic
             # securityEngineId of five zeros to accept traps from any engine ID.
             # See pysnmp documentation for UsmUserData.
-            if auth_proto == config.usmNoAuthProtocol:
-                # Use OctetString for the magic engine ID (five zeros)
-                from pysnmp.proto.rfc1902 import OctetString
-                magic_engine_id = OctetString(hexValue='0000000000')
-                config.addV3User(
-                    self.snmp_engine,
-                    username,
-                    auth_proto, auth_key,
-                    priv_proto, priv_key,
-                    securityEngineId=magic_engine_id,
+            kwargs["securityEngineId"] = WILDCARD_ENGINE_ID
+        config.addV3User(
+            self.snmp_engine,
+            user.get("username"),
+            auth_proto, user.get("auth_key"),
+            priv_proto, user.get("priv_key"),
+            **kwargs
+        )
+
+    def _auth_key(self, user):
+        '''Return the authentication protocol and the (not localized) key of a user, or (None, None)'''
+        protocol = user.get("auth_protocol", "none").lower()
+        if protocol not in AUTH_HASHES or not user.get("auth_key"):
+            return None, None
+        username = user.get("username")
+        if username not in self.auth_keys:
+            self.auth_keys[username] = hash_passphrase(user["auth_key"], protocol)
+        return protocol, self.auth_keys[username]
+
+    def _learn_engine_id(self, message, transport_address):
+        '''
+        Called with every message received, before pysnmp processes it.
+        If it is an authenticated SNMPv3 message from a known user but an unknown engine ID,
+        and it is authenticated with the key of the user localized for this engine ID, add the
+        user for this engine ID so that this trap and the next ones of the device are accepted.
+        Each source can only try once per `learn_interval`.
+        '''
+        try:
+            params = usm_parameters(message)
+            if params is None:
+                return
+            engine_id, username = params["engine_id"], params["username"]
+            user = self.v3_users.get(username)
+            if not user or not engine_id or engine_id == bytes(WILDCARD_ENGINE_ID):
+                return
+            if (engine_id, username) in self.known_engines:
+                return
+            protocol, key = self._auth_key(user)
+            if not protocol:
+                return
+            source = (transport_address or ("unknown",))[0]
+            if not self.learn_limiter.allow(source):
+                log.debug("Not learning SNMPv3 engine ID %s from %s: too many attempts", engine_id.hex(), source)
+                return
+            localized_key = localize_key(key, engine_id, protocol)
+            if not authenticate(message, params["auth"], localized_key, protocol):
+                log.warning(
+                    "Not learning SNMPv3 engine ID %s for user %s (from %s): authentication failed",
+                    engine_id.hex(), username, source,
                 )
-            else:
-                config.addV3User(
-                    self.snmp_engine,
-                    username,
-                    auth_proto, auth_key,
-                    priv_proto, priv_key,
+                return
+            if self.engine_cache.add(engine_id, username):
+                log.info(
+                    "Learned SNMPv3 engine ID %s for user %s (from %s)",
+                    engine_id.hex(), username, source,
                 )
-
-        ntfrcv.NotificationReceiver(self.snmp_engine, self._cbFun)
-
-        self._load_mibs()
+                self.known_engines.add((engine_id, username))
+                self._add_v3_user(user, OctetString(engine_id))
+        except Exception as err:
+            log.warning("Could not learn SNMPv3 engine ID: %s", err)
 
     def _load_mibs(self):
         snmp_builder = builder.MibBuilder()
@@ -261,14 +350,22 @@ class Main:
         self.api = Snooze(snooze_uri)
 
         self.send_workers_pool = self.config.get('send_workers', 4)
+        self.stats_interval = self.config.get('stats_interval', 60)
+        self.exit = Event()
 
         listening_address = self.config.get('listening_address', '0.0.0.0')
         listening_port = self.config.get('listening_port', 162)
         mib_dirs = self.config.get('mib_dirs', ['/usr/share/snmp/mibs'])
         community = self.config.get('community', 'public')
         v3_users = self.config.get('v3_users', [])
-
-        self.send_queue = JoinableQueue()
+        v3_engine_cache = self.config.get('v3_engine_cache', '/var/lib/snooze/snmptrap_engines.jsonl')
+        v3_engine_cache_size = self.config.get('v3_engine_cache_size', 100000)
+        v3_learn_engine_ids = self.config.get('v3_learn_engine_ids', False)
+        v3_learn_interval = self.config.get('v3_learn_interval', 60)
+
+        # One lane per send worker: the traps of a device are always sent by
+        # the same worker, so in the order they were received.
+        self.send_queue = LaneQueue(self.send_workers_pool)
         self.snmp_server = SNMPTrap(
             self.send_queue,
             bind_address=listening_address,
@@ -277,6 +374,10 @@ class Main:
             mib_list=[],
             community=community,
             v3_users=v3_users,
+            engine_cache=v3_engine_cache,
+            engine_cache_size=v3_engine_cache_size,
+            learn_engine_ids=v3_learn_engine_ids,
+            learn_interval=v3_learn_interval,
         )
         self.snmp_thread = Thread(target=self.snmp_server.start, daemon=True)
 
@@ -289,33 +390,48 @@ class Main:
         return threads
 
     def send_worker(self, index):
-        '''A worker for sending records to Snooze'''
+        '''A worker for sending the records of one lane to Snooze'''
         while True:
-            log.debug("[send_record] Waiting for queue")
-            record = self.send_queue.get()
+            log.debug("[send_record] Waiting for lane %d", index)
+            record = self.send_queue.get(index)
             if not record:
                 log.info("Stopping send worker %d", index)
                 break
             snmp_map(record)
             log.debug("Sending record to snooze: %s", record)
-            self.api.alert(record)
+            try:
+                self.api.alert(record)
+            except Exception as err:
+                log.error("Error sending record from %s: %s", record.get('source_ip'), err)
+
+    def stats_worker(self):
+        '''Periodically log the depth of every lane'''
+        while not self.exit.wait(self.stats_interval):
+            for lane in self.send_queue.stats():
+                log.info(
+                    "Lane %d: depth=%d high_water=%d received=%d",
+                    lane['lane'], lane['depth'], lane['high_water'], lane['received'],
+                )
 
     def stop_threads(self, queue, threads):
-        for _ in threads:
-            queue.put(None)
+        queue.stop()
         for thread in threads:
             thread.join()
 
     def run(self):
+        send_threads = []
         try:
             self.snmp_thread.start()
             send_threads = self.start_send_workers(self.send_workers_pool)
+            if self.stats_interval:
+                Thread(target=self.stats_worker, daemon=True).start()
 
             threads = [self.snmp_thread] + send_threads
             for thread in threads:
                 thread.join()
         finally:
             log.info("Stopping SNMP listener")
+            self.exit.set()
             transportDispatcher = self.snmp_server.snmp_engine.transportDispatcher
             transportDispatcher.jobFinished(1)
             transportDispatcher.unregisterRecvCbFun(recvId=None)
@@ -0,0 +1,219 @@
+'''Persistent cache of the SNMPv3 engine IDs learned from incoming traps'''
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+log = logging.getLogger("snooze.snmptrap.usm")
+
+# Authentication protocol => (hash function, length of the message authentication code)
+# See RFC 3414 (MD5, SHA) and RFC 7860 (SHA-2)
+AUTH_HASHES = {
+    'md5': (hashlib.md5, 12),
+    'sha': (hashlib.sha1, 12),
+    'sha224': (hashlib.sha224, 16),
+    'sha256': (hashlib.sha256, 24),
+    'sha384': (hashlib.sha384, 32),
+    'sha512': (hashlib.sha512, 48),
+}
+
+def hash_passphrase(passphrase, protocol):
+    '''Return the key of a passphrase (RFC 3414 A.2), not localized yet'''
+    digest = AUTH_HASHES[protocol][0]()
+    passphrase = passphrase.encode() if isinstance(passphrase, str) else bytes(passphrase)
+    repeated = passphrase * (64 // len(passphrase) + 2)
+    for index in range(0, 1048576, 64):
+        offset = index % len(passphrase)
+        digest.update(repeated[offset:offset + 64])
+    return digest.digest()
+
+def localize_key(key, engine_id, protocol):
+    '''Localize a key for an authoritative engine ID'''
+    return AUTH_HASHES[protocol][0](key + bytes(engine_id) + key).digest()
+
+def _ber_field(data, position, tag):
+    '''
+    Read the BER field at a position of the data, which must have the given tag.
+    Return the start and the end of its value.
+    '''
+    if data[position] != tag:
+        raise ValueError("Unexpected BER tag {:#x} at {}".format(data[position], position))
+    length = data[position + 1]
+    start = position + 2
+    if length & 0x80:
+        size = length & 0x7f
+        if not 0 < size <= 4:
+            raise ValueError("Unsupported BER length at {}".format(position))
+        length = int.from_bytes(data[start:start + size], 'big')
+        start += size
+    end = start + length
+    if end > len(data):
+        raise ValueError("Truncated BER field at {}".format(position))
+    return start, end
+
+def usm_parameters(message):
+    '''
+    Return the USM security parameters of an authenticated SNMPv3 message, as a dict with the
+    `engine_id`, `username` and `auth` (start and end of the authentication parameters in the
+    message), or None if the message is not an authenticated SNMPv3 message
+    '''
+    message = bytes(message)
+    try:
+        start, end = _ber_field(message, 0, 0x30)
+        version_start, version_end = _ber_field(message, start, 0x02)
+        if message[version_start:version_end] != b'\x03':
+            return None
+        header_start, header_end = _ber_field(message, version_end, 0x30)
+        # msgID, msgMaxSize, msgFlags
+        position = header_start
+        for tag in (0x02, 0x02):
+            position = _ber_field(message, position, tag)[1]
+        flags_start, flags_end = _ber_field(message, position, 0x04)
+        if flags_end == flags_start or not message[flags_start] & 0x01:
+            return None
+        # msgSecurityParameters: an OCTET STRING wrapping the UsmSecurityParameters sequence
+        security_start, _ = _ber_field(message, header_end, 0x04)
+        usm_start, _ = _ber_field(message, security_start, 0x30)
+        engine_start, engine_end = _ber_field(message, usm_start, 0x04)
+        position = engine_end
+        for tag in (0x02, 0x02):
+            position = _ber_field(message, position, tag)[1]
+        user_start, user_end = _ber_field(message, position, 0x04)
+        auth_start, auth_end = _ber_field(message, user_end, 0x04)
+    except (IndexError, ValueError):
+        return None
+    return {
+        'engine_id': message[engine_start:engine_end],
+        'username': message[user_start:user_end].decode('utf-8', 'replace'),
+        'auth': (auth_start, auth_end),
+    }
+
+def authenticate(message, auth, localized_key, protocol):
+    '''
+    Return True if the authentication parameters of a whole SNMPv3 message (at `auth`, the
+    start and end returned by `usm_parameters`) are the HMAC of the message computed with
+    the localized key
+    '''
+    hash_function, length = AUTH_HASHES[protocol]
+    message = bytes(message)
+    start, end = auth
+    if end - start != length:
+        return False
+    zeroed = message[:start] + bytes(length) + message[end:]
+    expected = hmac.new(localized_key, zeroed, hash_function).digest()[:length]
+    return hmac.compare_digest(expected, message[start:end])
+
+class SourceLimiter:
+    '''
+    Allow one attempt per source every `interval` seconds.
+    At most `max_sources` sources are remembered, the oldest ones are forgotten first.
+    '''
+    def __init__(self, interval=60, max_sources=10000, clock=time.monotonic):
+        self.interval = interval
+        self.max_sources = max_sources
+        self.clock = clock
+        self.attempts = OrderedDict()
+
+    def allow(self, source):
+        '''Return True and record the attempt if the source did not try in the last interval'''
+        now = self.clock()
+        last = self.attempts.get(source)
+        if last is not None and now - last < self.interval:
+            return False
+        self.attempts[source] = now
+        self.attempts.move_to_end(source)
+        while len(self.attempts) > self.max_sources:
+            self.attempts.popitem(last=False)
+        return True
+
+class EngineIdCache:
+    '''
+    Append-only store of the (authoritative engine ID, user name) pairs seen
+    in authenticated SNMPv3 traps.
+    Each line of the cache file is a JSON object. Duplicated or broken lines
+    are dropped when the file is loaded.
+    '''
+    def __init__(self, path=None, max_entries=100000):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.entries = set()
+        self.lock = threading.Lock()
+
+    def __contains__(self, entry):
+        return entry in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(sorted(self.entries))
+
+    def load(self):
+        '''Load the cache file, and return the list of (engine_id, username) pairs'''
+        if not self.path or not self.path.exists():
+            return []
+        lines = 0
+        try:
+            with self.path.open('r') as cache_file:
+                for line in cache_file:
+                    lines += 1
+                    try:
+                        data = json.loads(line)
+                        entry = (bytes.fromhex(data['engine_id']), data['username'])
+                    except (ValueError, KeyError, TypeError):
+                        log.debug("Ignoring invalid line in %s: %s", self.path, line)
+                        continue
+                    self.entries.add(entry)
+        except OSError as err:
+            log.warning("Could not read SNMPv3 engine ID cache %s: %s", self.path, err)
+            return []
+        if lines != len(self.entries):
+            self.compact()
+        log.info("Loaded %d SNMPv3 engine ID(s) from %s", len(self.entries), self.path)
+        return list(self)
+
+    def add(self, engine_id, username):
+        '''
+        Remember a new (engine_id, username) pair.
+        Return False if the pair is already known or the cache is full.
+        '''
+        entry = (bytes(engine_id), str(username))
+        with self.lock:
+            if entry in self.entries:
+                return False
+            if len(self.entries) >= self.max_entries:
+                log.warning("SNMPv3 engine ID cache is full (%d entries), ignoring %s", self.max_entries, entry[0].hex())
+                return False
+            self.entries.add(entry)
+            if self.path:
+                try:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    with self.path.open('a') as cache_file:
+                        cache_file.write(self._dump(entry))
+                except OSError as err:
+                    log.warning("Could not write SNMPv3 engine ID cache %s: %s", self.path, err)
+        return True
+
+    def compact(self):
+        '''Rewrite the cache file with only the valid and unique entries'''
+        if not self.path:
+            return
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with tmp_path.open('w') as cache_file:
+                for entry in self:
+                    cache_file.write(self._dump(entry))
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            log.warning("Could not compact SNMPv3 engine ID cache %s: %s", self.path, err)
+
+    @staticmethod
+    def _dump(entry):
+        engine_id, username = entry
+        return json.dumps({'engine_id': engine_id.hex(), 'username': username}) + '\n'
@@ -0,0 +1,32 @@
+from snooze_snmptrap.lanes import LaneQueue
+
+class TestLaneQueue:
+    def test_same_device_same_lane(self):
+        queue = LaneQueue(4)
+        for index in range(10):
+            queue.put({'source_ip': '10.0.0.1', 'index': index})
+        lane = queue.lane_index({'source_ip': '10.0.0.1'})
+        assert [queue.get(lane)['index'] for _ in range(10)] == list(range(10))
+
+    def test_spread(self):
+        queue = LaneQueue(4)
+        for index in range(256):
+            queue.put({'source_ip': '10.0.0.{}'.format(index)})
+        stats = queue.stats()
+        assert sum(lane['depth'] for lane in stats) == 256
+        assert all(lane['depth'] > 0 for lane in stats)
+
+    def test_stats(self):
+        queue = LaneQueue(2)
+        record = {'source_ip': '10.0.0.1'}
+        lane = queue.lane_index(record)
+        queue.put(record)
+        queue.put(record)
+        queue.get(lane)
+        stats = queue.stats()[lane]
+        assert stats == {'lane': lane, 'depth': 1, 'high_water': 2, 'received': 2}
+
+    def test_stop(self):
+        queue = LaneQueue(3)
+        queue.stop()
+        assert [queue.get(index) for index in range(3)] == [None, None, None]
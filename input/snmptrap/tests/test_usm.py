@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+
+from snooze_snmptrap.usm import EngineIdCache, SourceLimiter, authenticate, hash_passphrase, localize_key, usm_parameters
+
+ENGINE_ID = bytes.fromhex('000000000000000000000002')
+
+def ber(tag, value):
+    if len(value) < 0x80:
+        return bytes([tag, len(value)]) + value
+    return bytes([tag, 0x81, len(value)]) + value
+
+def snmpv3_message(engine_id, username, auth_parameters, flags=b'\x01', pdu=b'scoped pdu'):
+    '''An SNMPv3 message, and the position of its authentication parameters'''
+    usm = ber(0x30,
+        ber(0x04, engine_id) + ber(0x02, b'\x01') + ber(0x02, b'\x02')
+        + ber(0x04, username.encode()) + ber(0x04, auth_parameters) + ber(0x04, b'')
+    )
+    header = ber(0x30, ber(0x02, b'\x01') + ber(0x02, b'\x05\xdc') + ber(0x04, flags) + ber(0x02, b'\x03'))
+    message = ber(0x30, ber(0x02, b'\x03') + header + ber(0x04, usm) + ber(0x04, pdu))
+    start = message.index(ber(0x04, username.encode())) + len(username) + 4
+    return message, (start, start + len(auth_parameters))
+
+class TestEngineIdCache:
+    def test_add(self, tmp_path):
+        cache = EngineIdCache(tmp_path / 'engines.jsonl')
+        assert cache.add(b'\x80\x00\x1f\x88\x04abc', 'awx')
+        assert not cache.add(b'\x80\x00\x1f\x88\x04abc', 'awx')
+        assert (b'\x80\x00\x1f\x88\x04abc', 'awx') in cache
+        assert len(cache) == 1
+
+    def test_persist(self, tmp_path):
+        path = tmp_path / 'engines.jsonl'
+        cache = EngineIdCache(path)
+        cache.add(b'\x80\x00\x1f\x88\x04abc', 'awx')
+        cache.add(b'\x80\x00\x1f\x88\x04def', 'monitor')
+        reloaded = EngineIdCache(path)
+        assert reloaded.load() == [
+            (b'\x80\x00\x1f\x88\x04abc', 'awx'),
+            (b'\x80\x00\x1f\x88\x04def', 'monitor'),
+        ]
+
+    def test_compact(self, tmp_path):
+        path = tmp_path / 'engines.jsonl'
+        path.write_text(
+            '{"engine_id": "80001f8804616263", "username": "awx"}\n'
+            '{"engine_id": "80001f8804616263", "username": "awx"}\n'
+            'not json\n'
+        )
+        cache = EngineIdCache(path)
+        assert cache.load() == [(b'\x80\x00\x1f\x88\x04abc', 'awx')]
+        assert path.read_text() == '{"engine_id": "80001f8804616263", "username": "awx"}\n'
+
+    def test_max_entries(self):
+        cache = EngineIdCache(max_entries=1)
+        assert cache.add(b'\x80\x00\x1f\x88\x04abc', 'awx')
+        assert not cache.add(b'\x80\x00\x1f\x88\x04def', 'awx')
+        assert len(cache) == 1
+
+class TestAuthentication:
+    def test_localize_key(self):
+        # RFC 3414 A.3
+        key = hash_passphrase('maplesyrup', 'md5')
+        assert key.hex() == '9faf3283884e92834ebc9847d8edd963'
+        assert localize_key(key, ENGINE_ID, 'md5').hex() == '526f5eed9fcce26f8964c2930787d82b'
+        key = hash_passphrase('maplesyrup', 'sha')
+        assert localize_key(key, ENGINE_ID, 'sha').hex() == '6695febc9288e36282235fc7151f128497b38f3f'
+
+    def test_usm_parameters(self):
+        message, auth = snmpv3_message(ENGINE_ID, 'awx', bytes(24))
+        assert usm_parameters(message) == {'engine_id': ENGINE_ID, 'username': 'awx', 'auth': auth}
+        # Not authenticated, not SNMPv3, or not BER
+        assert usm_parameters(snmpv3_message(ENGINE_ID, 'awx', b'', flags=b'\x00')[0]) is None
+        assert usm_parameters(ber(0x30, ber(0x02, b'\x01') + ber(0x04, b'public'))) is None
+        assert usm_parameters(message[:20]) is None
+        assert usm_parameters(b'') is None
+
+    def test_authenticate(self):
+        key = localize_key(hash_passphrase('maplesyrup', 'sha256'), ENGINE_ID, 'sha256')
+        zeroed, auth = snmpv3_message(ENGINE_ID, 'awx', bytes(24))
+        auth_parameters = hmac.new(key, zeroed, hashlib.sha256).digest()[:24]
+        message, _ = snmpv3_message(ENGINE_ID, 'awx', auth_parameters)
+        assert authenticate(message, usm_parameters(message)['auth'], key, 'sha256')
+        # Forged message, or key localized for another engine ID
+        forged, _ = snmpv3_message(ENGINE_ID, 'awx', auth_parameters, pdu=b'forged pdu')
+        assert not authenticate(forged, auth, key, 'sha256')
+        other_key = localize_key(hash_passphrase('maplesyrup', 'sha256'), b'other', 'sha256')
+        assert not authenticate(message, auth, other_key, 'sha256')
+        # Authentication parameters of the wrong length
+        assert not authenticate(message, (auth[0], auth[1] - 1), key, 'sha256')
+
+    def test_authenticate_field_position(self):
+        '''The authentication parameters are located by position, not by searching their bytes'''
+        key = localize_key(hash_passphrase('maplesyrup', 'sha256'), ENGINE_ID, 'sha256')
+        # The user name has the same bytes as the zeroed authentication parameters
+        zeroed, auth = snmpv3_message(ENGINE_ID, '\x00' * 24, bytes(24))
+        assert zeroed.index(bytes(24)) < auth[0]
+        assert usm_parameters(zeroed)['auth'] == auth
+        auth_parameters = hmac.new(key, zeroed, hashlib.sha256).digest()[:24]
+        message = zeroed[:auth[0]] + auth_parameters + zeroed[auth[1]:]
+        assert authenticate(message, usm_parameters(message)['auth'], key, 'sha256')
+
+class TestSourceLimiter:
+    def test_allow(self):
+        now = [0]
+        limiter = SourceLimiter(interval=60, max_sources=2, clock=lambda: now[0])
+        assert limiter.allow('10.0.0.1')
+        assert not limiter.allow('10.0.0.1')
+        assert limiter.allow('10.0.0.2')
+        now[0] = 61
+        assert limiter.allow('10.0.0.1')
+        # The oldest source is forgotten
+        assert limiter.allow('10.0.0.3')
+        assert list(limiter.attempts) == ['10.0.0.1', '10.0.0.3']
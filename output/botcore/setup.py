@@ -0,0 +1,25 @@
+'''Setup of the python package'''
+
+from setuptools import setup, find_packages
+
+with open("README.md", "r") as f:
+    long_description = f.read()
+
+setup(
+    name='snooze-bot-core',
+    version='1.0.0',
+    author='Florian Dematraz, Guillaume Ludinard',
+    author_email='florian.dematraz@snoozeweb.net, ',
+    description="Common code of the snooze chat bots (Teams, Mattermost, Google Chat)",
+    long_description=long_description,
+    long_description_content_type="text/markdown",
+    packages=find_packages(include=['snooze_bot_core', 'snooze_bot_core.*']),
+    classifiers=[
+        'License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)',
+    ],
+    install_requires=[
+        'pyparsing',
+        'python-dateutil',
+        'snooze-client',
+    ],
+)
@@ -0,0 +1,246 @@
+'''Commands of the chat bots (ack, esc, close, open, snooze, comment)'''
+
+import logging
+import re
+import uuid
+from datetime import datetime, timedelta
+
+from snooze_bot_core.bot_parser import parser as bot_parser
+from snooze_bot_core.dialect import MARKDOWN
+
+LOG = logging.getLogger("snooze.bot.commands")
+
+duration_regex = re.compile(r"((\d+) *(months|month|mins|min|m|hours|hour|h|weeks|week|w|days|day|d|years|year|y)|forever){0,1} *(.*)", re.IGNORECASE)
+
+ACK = ['ack', 'acknowledge', 'ok', '/ack']
+ESC = ['esc', 'escalate', 're-escalate', 'reescalate', 're-esc', 'reesc', '/esc']
+CLOSE = ['close', 'done', '/close']
+OPEN = ['open', 'reopen', 're-open', '/open']
+SNOOZE = ['snooze', '/snooze']
+HELP = ['help', '/help']
+HELP_SNOOZE = ['help_snooze', '/help_snooze']
+
+def split_command(original_message):
+    '''Return the command (casefolded) and its arguments'''
+    try:
+        command, text = re.split(r'[^a-zA-Z0-9\/]', original_message, 1)
+    except ValueError:
+        command = original_message
+        text = ''
+    return command.casefold(), text
+
+def parse_duration(text, now):
+    '''
+    Parse the arguments of the snooze command (`<duration> [condition]`).
+    Return the end of the snooze (None for forever), a readable duration and the condition.
+    Raise ValueError if the duration is invalid.
+    '''
+    duration_match = duration_regex.search(text)
+    if not duration_match:
+        raise ValueError("Invalid snooze syntax: {}".format(text))
+    duration_time, duration_number, duration_period, query = duration_match.groups()
+    if duration_time and duration_time == 'forever':
+        return None, 'Forever', query
+    if not duration_period:
+        return now + timedelta(hours=1), '1h', query
+    duration_period = duration_period.casefold()
+    number = int(duration_number)
+    if duration_period.startswith('h'):
+        return now + timedelta(hours=number), duration_number + ' hour(s)', query
+    elif duration_period.startswith('d'):
+        return now + timedelta(days=number), duration_number + ' day(s)', query
+    elif duration_period.startswith('w'):
+        return now + timedelta(weeks=number), duration_number + ' week(s)', query
+    elif duration_period.startswith('month'):
+        return now + timedelta(days=number*30), duration_number + ' month(s)', query
+    elif duration_period.startswith('m'):
+        return now + timedelta(minutes=number), duration_number + ' minute(s)', query
+    elif duration_period.startswith('y'):
+        return now + timedelta(days=number*365), duration_number + ' year(s)', query
+    raise ValueError("Invalid snooze duration: {}".format(duration_period))
+
+class CommandDispatcher:
+    '''
+    Run the command of a chat message on the records of its thread, and
+    return the reply of the bot.
+    - query: SnoozeQuery finding the records of a thread
+    - method: name of the chat, saved in the comments (`teams`, `mattermost`, ...)
+    - default_action_name: used in the comments when the action is unknown
+    - dialect: markup of the replies (see `snooze_bot_core.dialect`)
+    '''
+    def __init__(self, client, query, method, default_action_name='SnoozeBot', dialect=MARKDOWN,
+            bot_name='Bot', snooze_url='', date_format='%a, %b %d, %Y at %I:%M %p', snooze_limit=10):
+        self.client = client
+        self.query = query
+        self.method = method
+        self.default_action_name = default_action_name
+        self.dialect = dialect
+        self.bot_name = bot_name
+        self.snooze_url = snooze_url
+        self.date_format = date_format
+        self.snooze_limit = snooze_limit
+
+    def help_snooze(self, display_name):
+        d = self.dialect
+        return """`{}`: Command: {} snooze <duration> [condition]
+
+{} (forever or X mins|min|m|hours|hour|h|weeks|week|w|days|day|d|months|month|years|year|y): {}
+{} (text): {}
+
+Example: {} {} 6h host = example_host""".format(display_name, d.bold('@' + self.bot_name),
+            d.bold('duration'), d.italic('Duration of this snooze entry'),
+            d.bold('condition'), d.italic('Condition for which this snooze entry will match'),
+            d.italic('@' + self.bot_name), d.bold('snooze'))
+
+    def help(self, display_name):
+        d = self.dialect
+        return """`{}`: List of available commands:
+
+{} [message]: {}
+{} <modification> [message]: {}
+{} [message]: {}
+{} [message]: {}
+{} <duration> [condition]: {}
+any other message: {}
+
+Example: {} {} severity = critical {}""".format(display_name,
+            d.bold(', '.join(ACK[:-1])), d.italic('Acknowledge an alert'),
+            d.bold(', '.join(ESC[:-1])), d.italic('Re-escalate an alert'),
+            d.bold(', '.join(CLOSE[:-1])), d.italic('Close an alert'),
+            d.bold(', '.join(OPEN[:-1])), d.italic('Re-open an alert'),
+            d.bold('snooze'), d.italic('Snooze an alert (default 1h) (') + '`/help_snooze`' + d.italic(')'),
+            d.italic('Comment an alert'),
+            d.italic('@' + self.bot_name), d.bold('esc'), d.italic('Please check'))
+
+    def web(self, path):
+        return '{}/web/?#/{}'.format(self.snooze_url, path)
+
+    def dispatch(self, display_name, original_message, thread):
+        '''Run the command of a message posted by `display_name` in `thread`, and return the reply'''
+        d = self.dialect
+        command, text = split_command(original_message)
+        if command in HELP_SNOOZE:
+            return self.help_snooze(display_name)
+        elif not command or command in HELP:
+            if text == 'snooze':
+                return self.help_snooze(display_name)
+            return self.help(display_name)
+        records = self.query.records(thread)
+        if len(records) == 0:
+            return '{} `{}`:Cannot find the corresponding alert! (command: `{}`)'.format(d.cross, display_name, original_message)
+        action_name = self.query.action_name(records[0], thread, self.default_action_name)
+        user = '{} via {}'.format(display_name, action_name)
+        link = ''
+        if self.snooze_url:
+            link = d.link(self.web('record?tab=All&s=hash%3D{}'.format(records[0]['hash'])), '[Link]')
+        if command in SNOOZE:
+            return self.snooze(records, display_name, user, text)
+        elif command in ACK:
+            LOG.debug('ACK %d alerts', len(records))
+            return self.comment(records, display_name, user, 'ack', text, link,
+                'acknowledged', 'acknowledge', self.web('record?tab=Acknowledged'), '[Link]')
+        elif command in ESC:
+            LOG.debug('ESC %d alerts', len(records))
+            try:
+                modifications, comment = bot_parser(text)
+            except Exception as err:
+                LOG.exception(err)
+                return '{} `{}`: Could not re-escalate alert(s)!'.format(d.cross, display_name)
+            return self.comment(records, display_name, user, 'esc', comment, link,
+                're-escalated', 're-escalate', self.web('record?tab=Re-escalated'), '[Link]', modifications)
+        elif command in CLOSE:
+            LOG.debug('CLOSE %d alerts', len(records))
+            return self.comment(records, display_name, user, 'close', text, link,
+                'closed', 'close', self.web('record?tab=Closed'), '[Link]')
+        elif command in OPEN:
+            LOG.debug('OPEN %d alerts', len(records))
+            return self.comment(records, display_name, user, 'open', text, link,
+                're-opened', 're-open', self.web('record?tab=Alerts&s=state=open'), 'SnoozeWeb')
+        else:
+            LOG.debug('COMMENT %d alerts', len(records))
+            message = text if command == '/comment' else original_message
+            try:
+                self.client.comment_batch([{'record_uid': record['uid'], 'name': user, 'method': self.method, 'message': message} for record in records])
+            except Exception as err:
+                LOG.exception(err)
+                return '{} `{}`: Could not comment alert(s)!'.format(d.cross, display_name)
+            if len(records) == 1:
+                return '{} Comment added successfully by `{}`: `{}`! {}'.format(d.check, display_name, message, link)
+            return '{} {} comments added successfully by `{}`: `{}`! {}'.format(d.check, d.bold(len(records)),
+                display_name, message, d.link(self.web('record'), '[Link]'))
+
+    def comment(self, records, display_name, user, comment_type, message, link, done, verb, tab_url, tab_text, modifications=None):
+        '''Add a comment of type `comment_type` to the records'''
+        d = self.dialect
+        payload = []
+        for record in records:
+            comment = {'type': comment_type, 'record_uid': record['uid'], 'name': user, 'method': self.method, 'message': message}
+            if modifications is not None:
+                comment['modifications'] = modifications
+            payload.append(comment)
+        try:
+            self.client.comment_batch(payload)
+        except Exception as err:
+            LOG.exception(err)
+            return '{} `{}`: Could not {} alert(s)!'.format(d.cross, display_name, verb)
+        msg_extra = ''
+        if modifications:
+            msg_extra += ' with modification `{}`'.format(modifications)
+        if message:
+            msg_extra += ' {} message `{}`'.format('and' if modifications else 'with', message)
+        if len(records) == 1:
+            return '{} Alert {} successfully by `{}`{}! {}'.format(d.check, done, display_name, msg_extra, link)
+        return '{} {} alerts {} successfully by `{}`{}! {}'.format(d.check, d.bold(len(records)), done,
+            display_name, msg_extra, d.link(tab_url, tab_text))
+
+    def snooze(self, records, display_name, user, text):
+        '''Snooze the records (or the condition given in `text`), and acknowledge them'''
+        d = self.dialect
+        LOG.debug("Snooze %d alerts with parameters: '%s'", len(records), text)
+        now = datetime.now()
+        try:
+            later, duration, query = parse_duration(text, now)
+        except ValueError:
+            return "{} `{}`: Invalid snooze filter duration syntax. Use `/help_snooze` to learn how to use this command".format(d.cross, display_name)
+        if query:
+            conditions = [None]
+        else:
+            query = ''
+            conditions = [['=', 'hash', '{}'.format(record['hash'])] for record in records]
+        if len(conditions) > self.snooze_limit:
+            return '{} `{}`: Cannot Snooze more than {} alert(s) without using an explicit condition. Please try again or use {}.'.format(
+                d.cross, display_name, self.snooze_limit, d.link(self.web('snooze'), 'SnoozeWeb'))
+        time_constraints = {}
+        if later:
+            time_constraints = {"datetime": [{"from": now.astimezone().strftime("%Y-%m-%dT%H:%M:%S%z"), "until": later.astimezone().strftime("%Y-%m-%dT%H:%M:%S%z")}]}
+        try:
+            payload = [{'name': '[{}] {} ({})'.format(duration, display_name, str(uuid.uuid4())[:5]), 'condition': condition, 'ql': query, 'time_constraints': time_constraints, 'comment': display_name} for condition in conditions]
+            result = self.client.snooze_batch(payload)
+            if result.get('rejected'):
+                return '{} `{}`: Could not Snooze alert(s)!'.format(d.cross, display_name)
+            LOG.debug('Done: %s', result)
+            ack_payload = [{'type': 'ack', 'record_uid': record['uid'], 'name': user, 'method': self.method, 'message': 'Snoozed for {}'.format(duration)} for record in records]
+            self.client.comment_batch(ack_payload)
+        except Exception as err:
+            LOG.exception(err)
+            return '{} `{}`: Could not Snooze alert(s)!'.format(d.cross, display_name)
+        count = ''
+        if len(records) > 1:
+            link = d.link(self.web('record?tab=Acknowledged'), '[Link]')
+            snoozelink = d.link(self.web('snooze?tab=All'), '[Link]')
+            count = d.bold(len(records)) + ' '
+        elif self.snooze_url:
+            link = d.link(self.web('record?tab=All&s=hash%3D{}'.format(records[0]['hash'])), '[Link]')
+            snoozelink = d.link(self.web('snooze?tab=All&s=hash%3D{}'.format(records[0]['hash'])), '[Link]')
+        else:
+            link = snoozelink = ''
+        comment_text = "{} {}Alert(s) acknowledged successfully by `{}`! {}\n".format(d.check, count, display_name, link)
+        warning_text = ''
+        added = result.get('data', {}).get('added', [])
+        if len(added) > 0:
+            res_cond = added[0].get('condition', [])
+            if len(res_cond) > 0 and res_cond[0] == 'SEARCH':
+                warning_text = "\n{} Snooze filter condition `{}` might not be expected. Please double check in the Web interface".format(d.warning, res_cond)
+        if later:
+            return comment_text + '{} Snoozed for {}! Expires at {} {}'.format(d.check, duration, d.bold(later.strftime(self.date_format)), snoozelink) + warning_text
+        return comment_text + '{} Snoozed forever! {}'.format(d.check, snoozelink) + warning_text
@@ -0,0 +1,16 @@
+'''Dates in the alert messages'''
+
+import re
+
+from dateutil import parser
+
+date_regex = re.compile(r"[0-9]{1,4}-[0-9]{1,2}-[0-9]{1,2}T[0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}[\+\d]*")
+
+def format_dates(text, date_format, local=False):
+    '''Replace the ISO dates found in the text with `date_format`, converted to the local timezone if `local`'''
+    def replace(match):
+        date = parser.parse(match.group())
+        if local:
+            date = date.astimezone()
+        return date.strftime(date_format)
+    return date_regex.sub(replace, str(text))
@@ -0,0 +1,142 @@
+'''
+Delivery of the messages to the chats, in the background.
+Each destination (channel, space, thread) has an outbox: its messages are sent in order,
+one at a time, while the destinations are served concurrently by a pool of workers.
+Failed sends are retried with an exponential backoff and jitter, or after the Retry-After
+delay given by the chat. Sends are limited per chat (`rate`) and per destination
+(`destination_rate`). Sending returns a future, completed once the message is delivered
+or all the tries failed.
+'''
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from snooze_bot_core.throttle import RateLimiter, retry_after
+
+LOG = logging.getLogger("snooze.bot.delivery")
+
+def error_response(error):
+    '''
+    Return the HTTP status and headers of the response in an exception
+    (requests, httpx or googleapiclient), or (None, {})
+    '''
+    response = getattr(error, 'response', None)
+    if response is None:
+        response = getattr(error, 'resp', None)
+    if response is None:
+        return None, {}
+    status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None and isinstance(response, dict):
+        headers = {key.title(): value for key, value in response.items()}
+    return status, headers or {}
+
+def chain(future, function):
+    '''Return a future of `function(result)` of a future'''
+    chained = Future()
+    def done(future):
+        try:
+            chained.set_result(function(future.result()))
+        except Exception as err:
+            chained.set_exception(err)
+    future.add_done_callback(done)
+    return chained
+
+def completed(result=None):
+    '''Return a future already completed'''
+    future = Future()
+    future.set_result(result)
+    return future
+
+class Delivery:
+    '''
+    Send the messages with `send(*args, **kwargs)` (which returns the response of the chat,
+    or raises an exception when the message could not be sent), in the background.
+    Each message is tried up to `retries` + 1 times.
+    '''
+    def __init__(self, send, workers=8, retries=3, backoff=1, max_backoff=60, rate=0, destination_rate=0,
+            clock=time.monotonic, sleep=time.sleep):
+        self.send = send
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.limiter = RateLimiter(rate, clock=clock, sleep=sleep)
+        self.destination_rate = destination_rate
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery')
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # destination => messages waiting
+        self.outboxes = {}
+        self.limiters = {}
+
+    def submit(self, destination, *args, **kwargs):
+        '''Queue a message to a destination. Return a future of the response of the chat'''
+        future = Future()
+        with self.lock:
+            outbox = self.outboxes.get(destination)
+            if outbox is None:
+                outbox = self.outboxes[destination] = deque()
+                self.executor.submit(self._drain, destination, outbox)
+            outbox.append((future, args, kwargs))
+        return future
+
+    def _drain(self, destination, outbox):
+        '''Send the messages of a destination until its outbox is empty'''
+        while True:
+            with self.lock:
+                if not outbox:
+                    del self.outboxes[destination]
+                    self.idle.notify_all()
+                    return
+                future, args, kwargs = outbox.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._send(destination, args, kwargs))
+            except Exception as err:
+                LOG.error("Could not send a message to %s: %s", destination, err)
+                future.set_exception(err)
+
+    def _limiter(self, destination):
+        with self.lock:
+            limiter = self.limiters.get(destination)
+            if limiter is None:
+                limiter = self.limiters[destination] = RateLimiter(self.destination_rate, clock=self.clock, sleep=self.sleep)
+            return limiter
+
+    def _send(self, destination, args, kwargs):
+        limiter = self._limiter(destination)
+        for attempt in range(self.retries + 1):
+            limiter.acquire()
+            self.limiter.acquire()
+            try:
+                return self.send(*args, **kwargs)
+            except Exception as err:
+                status, headers = error_response(err)
+                if attempt == self.retries or (status and 400 <= status < 500 and status not in (408, 429)):
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if status in (429, 503):
+                    # The chat throttles the requests: hold the other destinations too
+                    delay = max(delay, retry_after(headers, 0))
+                    limiter.pause(delay)
+                    self.limiter.pause(delay)
+                else:
+                    self.sleep(delay)
+                LOG.warning("Could not send a message to %s (%s), retrying in %.1fs", destination, err, delay)
+
+    def pending(self):
+        '''Number of messages waiting to be sent'''
+        with self.lock:
+            return sum(len(outbox) for outbox in self.outboxes.values())
+
+    def flush(self, timeout=None):
+        '''Wait for all the messages to be sent. Return False if some are still waiting after `timeout` seconds'''
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.outboxes, timeout)
@@ -0,0 +1,34 @@
+'''Text formatting of the bot replies, for each chat markup'''
+
+class Markdown:
+    '''Markdown, as understood by Mattermost and Teams'''
+    check = ':white_check_mark:'
+    cross = ':x:'
+    warning = ':warning:'
+
+    def bold(self, text):
+        return '**{}**'.format(text)
+
+    def italic(self, text):
+        return '*{}*'.format(text)
+
+    def link(self, url, text):
+        return '[{}]({})'.format(text, url)
+
+class GoogleChat(Markdown):
+    '''Google Chat markup (`*bold*`, `_italic_`, `<url|text>`)'''
+    check = '✅'
+    cross = '❌'
+    warning = '⚠'
+
+    def bold(self, text):
+        return '*{}*'.format(text)
+
+    def italic(self, text):
+        return '_{}_'.format(text)
+
+    def link(self, url, text):
+        return '<{}|{}>'.format(url, text)
+
+MARKDOWN = Markdown()
+GOOGLE_CHAT = GoogleChat()
@@ -0,0 +1,217 @@
+'''
+Base of the chat bots: post the alerts received from a snooze action in the
+chat channels, and run the commands of the users on these alerts.
+'''
+
+import logging
+from concurrent.futures import wait
+
+from snooze_bot_core.commands import CommandDispatcher, duration_regex
+from snooze_bot_core.dates import date_regex
+from snooze_bot_core.delivery import Delivery, chain, completed
+from snooze_bot_core.dialect import MARKDOWN
+from snooze_bot_core.query import SnoozeQuery, ThreadIndex, webhook_threads
+
+LOG = logging.getLogger("snooze.bot")
+
+def snooze_client():
+    '''Return a client of the snooze server'''
+    from snooze_client import Snooze
+    return Snooze()
+
+class SnoozeBotPlugin:
+    '''
+    Common part of the chat bots. Each chat (the transport) subclasses it and implements:
+    - send_message(message, channel_id, thread, attachment, request): post a message,
+      and return the response of the chat. It raises an exception on failure, and is
+      called by the delivery engine (use `deliver` to send a message)
+    - make_thread(channel, response): the thread of a posted message, saved in the record
+    - format_record(req_media, threads, multi, website): the message of one alert
+    - format_batch(content, multi, website): the message posted in a channel for its alerts
+    and may override:
+    - parse_user_message(message): display name, text and thread of a received message
+    - resolve_channel(channel): channel to post in, and parent thread if any
+    - get_action_name(request), get_website(request), buttons()
+    '''
+    method = 'bot'
+    default_action_name = 'SnoozeBot'
+    default_snooze_url = 'http://localhost:5201'
+    destinations = 'channels'
+    thread_fields = ['root_id']
+    dialect = MARKDOWN
+    empty_message = ''
+    date_regex = date_regex
+    duration_regex = duration_regex
+
+    def __init__(self, config, client=None):
+        self.config = config
+        self.date_format = self.config.get('date_format', '%a, %b %d, %Y at %I:%M %p')
+        self.client = client or snooze_client()
+        self.bot_name = self.config.get('bot_name', 'Bot')
+        self.snooze_url = self.config.get('snooze_url', self.default_snooze_url)
+        if self.snooze_url.endswith('/'):
+            self.snooze_url = self.snooze_url[:-1]
+        self.message_limit = self.config.get('message_limit', 10)
+        self.snooze_limit = self.config.get('snooze_limit', self.message_limit)
+        self.fanout_timeout = self.config.get('fanout_timeout', 10)
+        self.delivery = Delivery(
+            self.send_message,
+            workers=self.config.get('fanout_workers', 8),
+            retries=self.config.get('delivery_retries', 3),
+            backoff=self.config.get('delivery_backoff', 1),
+            max_backoff=self.config.get('delivery_max_backoff', 60),
+            rate=self.config.get('delivery_rate', 0),
+            destination_rate=self.config.get('delivery_channel_rate', 0),
+        )
+        index_path = self.config.get('thread_index', '/var/lib/snooze/{}_threads.sqlite'.format(self.method))
+        self.thread_index = ThreadIndex(index_path, self.config.get('thread_index_ttl', 2592000))
+        self.snooze_query = SnoozeQuery(self.client, self.thread_fields, self.thread_index)
+        self.dispatcher = CommandDispatcher(self.client, self.snooze_query, self.method, self.default_action_name,
+            self.dialect, self.bot_name, self.snooze_url, self.date_format, self.snooze_limit)
+
+    def send_message(self, message, channel_id=None, thread=None, attachment=None, request=None):
+        raise NotImplementedError
+
+    def deliver(self, message, channel_id=None, thread=None, attachment=None, request=None, **options):
+        '''Send a message in the background. Return a future of the response of the chat'''
+        destination = channel_id or thread
+        if isinstance(destination, dict):
+            destination = destination.get('channel_id') or str(destination)
+        return self.delivery.submit(destination, message, channel_id=channel_id, thread=thread, attachment=attachment, request=request, **options)
+
+    def make_thread(self, channel, response):
+        raise NotImplementedError
+
+    def format_record(self, req_media, threads, multi, website):
+        raise NotImplementedError
+
+    def format_batch(self, content, multi, website):
+        raise NotImplementedError
+
+    def resolve_channel(self, channel):
+        return channel, None
+
+    def get_action_name(self, request):
+        return request.params['snooze_action_name']
+
+    def get_website(self, request):
+        return self.snooze_url
+
+    def buttons(self):
+        return [{'text': 'Acknowledge', 'action': 'ack', 'style': 'success'}, {'text': 'Close', 'action': 'close', 'style': 'primary'}]
+
+    def process_alert(self, request, medias):
+        if not isinstance(medias, list):
+            medias = [medias]
+        response = self.process_records(request, medias)
+        LOG.debug("Response: %s", response)
+        return response
+
+    def process_records(self, req, medias):
+        '''
+        Post the alerts of a webhook, and return the threads to save in each record.
+        Channels are posted concurrently. Channels not posted after `fanout_timeout`
+        seconds are left out of the response, so that a slow chat does not make the
+        snooze action time out (and post everything again when it retries). Their
+        messages are still delivered in the background, and their threads indexed.
+        '''
+        multi = len(medias) > 1
+        channels = {}
+        return_value = {}
+        website = self.get_website(req)
+        action_name = self.get_action_name(req)
+        for req_media in medias[:self.message_limit]:
+            self.process_rec(channels, req_media, action_name, multi, website)
+        for req_media in medias[self.message_limit:]:
+            self.process_rec(channels, req_media, action_name, multi, website, False)
+        attachment = self.buttons()
+        futures = [
+            (self.post_channel(channel, content, multi, website, attachment, req), channel, content)
+            for channel, content in channels.items()
+        ]
+        done, not_done = wait([future for future, _, _ in futures], timeout=self.fanout_timeout)
+        if not_done:
+            LOG.warning("%d/%d channel(s) not posted after %ss", len(not_done), len(futures), self.fanout_timeout)
+            for future, channel, content in futures:
+                if future in not_done:
+                    future.add_done_callback(lambda future, content=content: self.remember_late(future, content))
+        # Results are merged in the order of the channels, whatever the order they were posted in
+        for future, channel, content in futures:
+            if future not in done:
+                continue
+            try:
+                thread = future.result()
+            except Exception as err:
+                LOG.error("Could not post on %s: %s", channel, err)
+                continue
+            if not multi and content[0]['threads']:
+                return_value = {content[0]['record_hash']: {'threads': content[0]['threads'], 'multithreads': content[0]['multithreads']}}
+                continue
+            if thread is None:
+                continue
+            for message in content:
+                if multi:
+                    message['multithreads'].append(thread)
+                else:
+                    message['threads'].append(thread)
+                return_value[message['record_hash']] = {'threads': message['threads'], 'multithreads': message['multithreads']}
+        for record_hash, threads in return_value.items():
+            self.snooze_query.remember(threads['threads'] + threads['multithreads'], record_hash)
+        if multi:
+            return return_value
+        return next(iter(return_value.values()), {})
+
+    def post_channel(self, channel, content, multi, website, attachment, req):
+        '''Queue the alerts of one channel. Return a future of the thread of the new message, or None'''
+        channel, parent_thread = self.resolve_channel(channel)
+        if not multi and content[0]['threads']:
+            for thread in content[0]['threads']:
+                self.deliver(content[0]['msg'], channel_id=channel, thread=thread, attachment=attachment, request=req)
+            return completed(None)
+        future = self.deliver(self.format_batch(content, multi, website), channel_id=channel, thread=parent_thread, attachment=attachment, request=req)
+        def thread_of(resp):
+            if not resp:
+                return None
+            if parent_thread:
+                return parent_thread.copy()
+            return self.make_thread(channel, resp)
+        return chain(future, thread_of)
+
+    def remember_late(self, future, content):
+        '''Index the thread of a message delivered after the response of the webhook'''
+        if future.exception() is not None or future.result() is None:
+            return
+        for message in content:
+            self.snooze_query.remember([future.result()], message['record_hash'])
+
+    def process_rec(self, channels, req_media, action_name, multi, website, process=True):
+        '''Add the message of an alert to the channels it should be posted in'''
+        record = req_media['alert']
+        LOG.debug('Received record: %s', record)
+        threads, multithreads = webhook_threads(record, action_name)
+        msg = self.empty_message
+        if process:
+            msg = self.format_record(req_media, threads, multi, website)
+        for channel in req_media[self.destinations]:
+            channels.setdefault(channel, []).append({'msg': msg, 'record_hash': record.get('hash', ''), 'threads': threads, 'multithreads': multithreads})
+
+    def parse_user_message(self, message):
+        '''Return the display name, text and thread of a message received from the chat'''
+        try:
+            display_name = message.user_name
+            thread = message.root_id
+            if 'command' in message.body:
+                original_message = message.command + ' ' + message.text.lstrip()
+            else:
+                original_message = message.text.lstrip()
+        except Exception:
+            display_name = message.sender_name
+            original_message = message.text.lstrip()
+            thread = message.root_id or message.id
+        return display_name, original_message, thread
+
+    def process_user_message(self, message):
+        '''Run the command of a message received from the chat, and return the reply'''
+        LOG.debug("Received message: '%s'", message)
+        display_name, original_message, thread = self.parse_user_message(message)
+        return self.dispatcher.dispatch(display_name, original_message, thread)
@@ -0,0 +1,140 @@
+'''
+Snooze queries of the chat bots.
+The bots save the threads they post in the webhook response of the action
+(`snooze_webhook_responses`), and find the records back from these threads.
+A thread is either a dict (`{'channel_id': ..., 'root_id': ...}`) or a string,
+depending on the chat.
+'''
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+LOG = logging.getLogger("snooze.bot.query")
+
+def webhook_threads(record, action_name):
+    '''Return the threads and multithreads saved in the record by the action'''
+    for action_result in record.get('snooze_webhook_responses', []):
+        if action_result.get('action_name') == action_name:
+            content = action_result.get('content', {})
+            return content.get('threads', []), content.get('multithreads', [])
+    return [], []
+
+def thread_id(thread, fields):
+    '''Return the identifier of a thread (the first of `fields` set, or the thread itself if it is a string)'''
+    if isinstance(thread, dict):
+        return next((thread.get(field) for field in fields if thread.get(field)), None)
+    return thread
+
+def thread_query(thread, fields):
+    '''Return the query matching the records with a thread identified by `thread`'''
+    conditions = []
+    for key in ['threads', 'multithreads']:
+        for field in fields:
+            path = 'content.{}.{}'.format(key, field) if field else 'content.{}'.format(key)
+            conditions.append(['IN', ['IN', thread, path], 'snooze_webhook_responses'])
+    return ['OR'] + conditions
+
+class ThreadIndex:
+    '''
+    Local index of the threads posted by the bot (thread identifier => record hashes),
+    persisted in a SQLite database, so that the records of a thread are found by hash
+    instead of searching the webhook responses of every record.
+    Entries not updated for `ttl` seconds are removed.
+    '''
+    def __init__(self, path=':memory:', ttl=2592000):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.inserts = 0
+        if path != ':memory:':
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self.db = sqlite3.connect(str(path), check_same_thread=False)
+            except (OSError, sqlite3.Error) as err:
+                LOG.warning("Could not open the thread index %s, keeping it in memory: %s", path, err)
+                path = ':memory:'
+        if path == ':memory:':
+            self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS threads (thread TEXT, hash TEXT, updated REAL, PRIMARY KEY (thread, hash))")
+        self.prune()
+
+    def add(self, entries):
+        '''Index a list of (thread identifier, record hash)'''
+        now = time.time()
+        rows = [(str(thread), record_hash, now) for thread, record_hash in entries if thread and record_hash]
+        if not rows:
+            return
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO threads VALUES (?, ?, ?)", rows)
+            self.inserts += len(rows)
+        if self.inserts >= 1000:
+            self.prune()
+
+    def get(self, thread):
+        '''Return the hashes of the records of a thread'''
+        with self.lock:
+            rows = self.db.execute("SELECT hash FROM threads WHERE thread = ? ORDER BY hash", (str(thread),)).fetchall()
+        return [row[0] for row in rows]
+
+    def forget(self, thread):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM threads WHERE thread = ?", (str(thread),))
+
+    def prune(self):
+        '''Remove the old entries'''
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM threads WHERE updated < ?", (time.time() - self.ttl,))
+            self.inserts = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+def hash_query(hashes):
+    '''Return the query matching the records with the given hashes'''
+    conditions = [['=', 'hash', record_hash] for record_hash in hashes]
+    if len(conditions) == 1:
+        return conditions[0]
+    return ['OR'] + conditions
+
+class SnoozeQuery:
+    '''
+    Find the records of a thread.
+    `fields` are the keys identifying a thread when threads are dicts
+    (`['root_id', 'thread_id']`), or `['']` when threads are strings.
+    The records are looked up by hash in the `index` of the threads first, and
+    searched in the webhook responses only if the thread is unknown.
+    '''
+    def __init__(self, client, fields, index=None):
+        self.client = client
+        self.fields = fields
+        self.index = index if index is not None else ThreadIndex()
+
+    def records(self, thread):
+        '''Return the records posted in a thread'''
+        hashes = self.index.get(thread)
+        if hashes:
+            records = self.client.record(hash_query(hashes))
+            if records:
+                return records
+            LOG.debug("Records of thread %s not found by hash, searching them", thread)
+            self.index.forget(thread)
+        records = self.client.record(thread_query(thread, self.fields))
+        self.index.add([(thread, record.get('hash')) for record in records])
+        return records
+
+    def remember(self, threads, record_hash):
+        '''Index the threads of a record'''
+        self.index.add([(thread_id(thread, self.fields), record_hash) for thread in threads])
+
+    def action_name(self, record, thread, default=None):
+        '''Return the name of the action which posted the record in the thread'''
+        for action_result in record.get('snooze_webhook_responses', []):
+            content = action_result.get('content', {})
+            threads = content.get('threads', []) + content.get('multithreads', [])
+            if thread in [thread_id(t, self.fields) for t in threads]:
+                return action_result.get('action_name') or default
+        return default
@@ -0,0 +1,63 @@
+'''Request budget of the chat APIs'''
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+LOG = logging.getLogger("snooze.bot.throttle")
+
+def retry_after(headers, default=1):
+    '''Return the seconds to wait given by the Retry-After header (seconds or HTTP date), or `default`'''
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return default
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+class RateLimiter:
+    '''
+    Token bucket shared by the threads calling an API: at most `rate` requests per second,
+    with bursts of `burst` requests. A `rate` of 0 does not limit the requests.
+    All the requests can also be paused, when the API throttles them.
+    '''
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(self.rate, 1))
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = clock()
+        self.paused_until = 0
+
+    def reserve(self):
+        '''Take a token, and return the seconds to wait before using it'''
+        with self.lock:
+            now = self.clock()
+            wait = self.paused_until - now
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            return max(wait, 0)
+
+    def acquire(self):
+        '''Wait for a token'''
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        '''Hold every request for `seconds`'''
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
@@ -0,0 +1,24 @@
+import pytest
+
+class FakeClient:
+    '''Records the calls made to the snooze server'''
+    def __init__(self, records=None):
+        self.records = records or []
+        self.queries = []
+        self.comments = []
+        self.snoozes = []
+
+    def record(self, query):
+        self.queries.append(query)
+        return self.records
+
+    def comment_batch(self, payload):
+        self.comments.extend(payload)
+
+    def snooze_batch(self, payload):
+        self.snoozes.extend(payload)
+        return {'data': {'added': payload}}
+
+@pytest.fixture
+def client():
+    return FakeClient()
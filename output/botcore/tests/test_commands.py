@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from snooze_bot_core.commands import CommandDispatcher, parse_duration, split_command
+from snooze_bot_core.dialect import GOOGLE_CHAT
+from snooze_bot_core.query import SnoozeQuery
+
+RECORD = {'uid': 'u1', 'hash': 'h1', 'snooze_webhook_responses': [
+    {'action_name': 'teams_action', 'content': {'threads': [{'channel_id': 'c1', 'thread_id': 't1'}], 'multithreads': []}},
+]}
+
+def dispatcher(client, **kwargs):
+    return CommandDispatcher(client, SnoozeQuery(client, ['root_id', 'thread_id']), 'teams',
+        snooze_url='http://snooze', **kwargs)
+
+class TestParse:
+    def test_split_command(self):
+        assert split_command('ACK all good') == ('ack', 'all good')
+        assert split_command('/close') == ('/close', '')
+
+    @pytest.mark.parametrize('text, delta, duration', [
+        ('', timedelta(hours=1), '1h'),
+        ('2h', timedelta(hours=2), '2 hour(s)'),
+        ('3 days', timedelta(days=3), '3 day(s)'),
+        ('1w', timedelta(weeks=1), '1 week(s)'),
+        ('2 months', timedelta(days=60), '2 month(s)'),
+        ('30m', timedelta(minutes=30), '30 minute(s)'),
+        ('1y', timedelta(days=365), '1 year(s)'),
+    ])
+    def test_duration(self, text, delta, duration):
+        now = datetime(2024, 1, 1)
+        assert parse_duration(text, now) == (now + delta, duration, '')
+
+    def test_forever_with_condition(self):
+        assert parse_duration('forever host = a', datetime.now()) == (None, 'Forever', 'host = a')
+
+class TestDispatch:
+    def test_help(self, client):
+        reply = dispatcher(client).dispatch('john', 'help', 't1')
+        assert '**ack, acknowledge, ok** [message]: *Acknowledge an alert*' in reply
+        assert client.queries == []
+
+    def test_not_found(self, client):
+        reply = dispatcher(client).dispatch('john', 'ack', 't1')
+        assert reply.startswith(':x:')
+        assert client.queries == [['OR',
+            ['IN', ['IN', 't1', 'content.threads.root_id'], 'snooze_webhook_responses'],
+            ['IN', ['IN', 't1', 'content.threads.thread_id'], 'snooze_webhook_responses'],
+            ['IN', ['IN', 't1', 'content.multithreads.root_id'], 'snooze_webhook_responses'],
+            ['IN', ['IN', 't1', 'content.multithreads.thread_id'], 'snooze_webhook_responses'],
+        ]]
+
+    def test_ack(self, client):
+        client.records = [RECORD]
+        reply = dispatcher(client).dispatch('john', 'ack all good', 't1')
+        assert client.comments == [{'type': 'ack', 'record_uid': 'u1', 'name': 'john via teams_action', 'method': 'teams', 'message': 'all good'}]
+        assert reply == ":white_check_mark: Alert acknowledged successfully by `john` with message `all good`! [[Link]](http://snooze/web/?#/record?tab=All&s=hash%3Dh1)"
+
+    def test_esc(self, client):
+        client.records = [RECORD, dict(RECORD, uid='u2')]
+        reply = dispatcher(client).dispatch('john', 'esc severity = critical please check', 'unknown')
+        assert [c['record_uid'] for c in client.comments] == ['u1', 'u2']
+        assert client.comments[0]['modifications'] == [['SET', 'severity', 'critical']]
+        assert client.comments[0]['message'] == 'please check'
+        assert client.comments[0]['name'] == 'john via SnoozeBot'
+        assert '**2** alerts re-escalated' in reply
+
+    def test_comment(self, client):
+        client.records = [RECORD]
+        dispatcher(client).dispatch('john', 'looking into it', 't1')
+        assert client.comments[0]['message'] == 'looking into it'
+        assert 'type' not in client.comments[0]
+
+    def test_snooze(self, client):
+        client.records = [RECORD]
+        reply = dispatcher(client).dispatch('john', 'snooze 2h', 't1')
+        assert client.snoozes[0]['condition'] == ['=', 'hash', 'h1']
+        assert client.snoozes[0]['time_constraints']['datetime']
+        assert client.comments[0]['message'] == 'Snoozed for 2 hour(s)'
+        assert 'Snoozed for 2 hour(s)! Expires at **' in reply
+
+    def test_snooze_limit(self, client):
+        client.records = [RECORD] * 3
+        reply = dispatcher(client, snooze_limit=2).dispatch('john', 'snooze 1d', 't1')
+        assert client.snoozes == []
+        assert 'Cannot Snooze more than 2 alert(s)' in reply
+
+    def test_google_chat(self, client):
+        client.records = [RECORD, RECORD]
+        reply = CommandDispatcher(client, SnoozeQuery(client, ['']), 'google', dialect=GOOGLE_CHAT,
+            snooze_url='http://snooze').dispatch('john', 'close', 'spaces/a/threads/b')
+        assert client.queries[0][1] == ['IN', ['IN', 'spaces/a/threads/b', 'content.threads'], 'snooze_webhook_responses']
+        assert reply == '✅ *2* alerts closed successfully by `john`! <http://snooze/web/?#/record?tab=Closed|[Link]>'
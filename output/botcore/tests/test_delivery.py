@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+import requests
+
+from snooze_bot_core.delivery import Delivery, chain, completed, error_response
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+class Chat:
+    '''Chat failing with the given errors before accepting the messages'''
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+        self.sleeps = []
+
+    def send(self, message, channel_id=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((channel_id, message))
+        return {'id': message}
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+def delivery(chat, **options):
+    return Delivery(chat.send, sleep=chat.sleep, **options)
+
+def test_send():
+    chat = Chat()
+    future = delivery(chat).submit('c1', 'hello', channel_id='c1')
+    assert future.result(1) == {'id': 'hello'}
+    assert chat.sent == [('c1', 'hello')]
+
+def test_backoff():
+    chat = Chat([ConnectionError(), http_error(500), http_error(502)])
+    future = delivery(chat, backoff=1, max_backoff=3).submit('c1', 'hello')
+    assert future.result(1) == {'id': 'hello'}
+    # Exponential backoff with jitter, bounded by max_backoff
+    assert len(chat.sleeps) == 3
+    assert all(0 <= sleep <= limit for sleep, limit in zip(chat.sleeps, [1, 2, 3]))
+
+def test_retry_after():
+    chat = Chat([http_error(429, {'Retry-After': '30'})])
+    now = [0]
+    def sleep(seconds):
+        chat.sleep(seconds)
+        now[0] += seconds
+    engine = Delivery(chat.send, backoff=1, clock=lambda: now[0], sleep=sleep)
+    future = engine.submit('c1', 'hello')
+    assert future.result(1) == {'id': 'hello'}
+    assert len(chat.sleeps) == 1
+    assert 29 < chat.sleeps[0] <= 30
+    # The other destinations are held too
+    assert engine.limiter.paused_until == pytest.approx(30, abs=1)
+
+def test_give_up():
+    chat = Chat([ConnectionError()] * 5)
+    future = delivery(chat, retries=2, backoff=0).submit('c1', 'hello')
+    with pytest.raises(ConnectionError):
+        future.result(1)
+    assert len(chat.errors) == 2
+
+def test_not_retried():
+    chat = Chat([http_error(403)])
+    future = delivery(chat).submit('c1', 'hello')
+    with pytest.raises(requests.HTTPError):
+        future.result(1)
+    assert chat.sleeps == []
+
+def test_destination_order():
+    release = threading.Event()
+    sent = []
+    def send(message):
+        if message == 'c1-1':
+            release.wait(1)
+        sent.append(message)
+    engine = Delivery(send, workers=2)
+    futures = [engine.submit('c1', 'c1-1'), engine.submit('c1', 'c1-2'), engine.submit('c2', 'c2-1')]
+    futures[2].result(1)
+    # c2 is not blocked by c1, and c1 messages keep their order
+    assert sent == ['c2-1']
+    release.set()
+    assert engine.flush(1)
+    assert sent == ['c2-1', 'c1-1', 'c1-2']
+
+def test_rate():
+    chat = Chat()
+    engine = delivery(chat, destination_rate=1)
+    for index in range(3):
+        engine.submit('c1', index)
+    assert engine.flush(1)
+    # Burst of 1, then 1 message per second (the sleeps of the test do not advance the clock)
+    assert chat.sleeps == pytest.approx([1, 2], abs=0.1)
+
+def test_futures():
+    assert chain(completed(2), lambda value: value * 2).result() == 4
+    failed = chain(completed(None), lambda value: value['id'])
+    assert isinstance(failed.exception(), TypeError)
+
+def test_error_response():
+    assert error_response(http_error(429, {'Retry-After': '3'}))[0] == 429
+    assert error_response(ValueError()) == (None, {})
+    class GoogleError(Exception):
+        resp = type('Response', (dict,), {'status': 429})({'retry-after': '5'})
+    assert error_response(GoogleError()) == (429, {'Retry-After': '5'})
@@ -0,0 +1,108 @@
+import time
+from types import SimpleNamespace
+
+from snooze_bot_core.plugin import SnoozeBotPlugin
+
+class FakeChat(SnoozeBotPlugin):
+    '''Chat transport keeping the posted messages in memory'''
+    method = 'fake'
+
+    def __init__(self, config, client, fail=(), delays=None):
+        super().__init__(dict({'thread_index': ':memory:', 'delivery_backoff': 0}, **config), client)
+        self.sent = []
+        self.fail = fail
+        self.delays = delays or {}
+
+    def send_message(self, message, channel_id=None, thread=None, attachment=None, request=None):
+        time.sleep(self.delays.get(channel_id, 0))
+        self.sent.append((channel_id, thread, message))
+        if channel_id in self.fail:
+            raise ConnectionError('{} is down'.format(channel_id))
+        return {'id': 'post-{}'.format(channel_id), 'root_id': ''}
+
+    def make_thread(self, channel, response):
+        return {'channel_id': channel, 'root_id': response['root_id'] or response['id']}
+
+    def format_record(self, req_media, threads, multi, website):
+        return req_media['alert']['message']
+
+    def format_batch(self, content, multi, website):
+        return '\n'.join(message['msg'] for message in content if message['msg'])
+
+def request():
+    return SimpleNamespace(params={'snooze_action_name': 'chat'})
+
+def media(name, channels, threads=None):
+    record = {'hash': name, 'message': name}
+    if threads:
+        record['snooze_webhook_responses'] = [{'action_name': 'chat', 'content': {'threads': threads, 'multithreads': []}}]
+    return {'channels': channels, 'alert': record}
+
+def test_single(client):
+    plugin = FakeChat({}, client)
+    response = plugin.process_records(request(), [media('a', ['c1'])])
+    assert plugin.sent == [('c1', None, 'a')]
+    assert response == {'threads': [{'channel_id': 'c1', 'root_id': 'post-c1'}], 'multithreads': []}
+
+def test_existing_threads(client):
+    plugin = FakeChat({}, client)
+    thread = {'channel_id': 'c1', 'root_id': 'old'}
+    response = plugin.process_records(request(), [media('a', ['c1'], [thread])])
+    assert plugin.delivery.flush(1)
+    assert plugin.sent == [('c1', thread, 'a')]
+    assert response == {'threads': [thread], 'multithreads': []}
+
+def test_multi(client):
+    plugin = FakeChat({}, client)
+    response = plugin.process_records(request(), [media('a', ['c1', 'c2']), media('b', ['c2'])])
+    assert sorted(plugin.sent) == [('c1', None, 'a'), ('c2', None, 'a\nb')]
+    assert response['a']['multithreads'] == [{'channel_id': 'c1', 'root_id': 'post-c1'}, {'channel_id': 'c2', 'root_id': 'post-c2'}]
+    assert response['b']['multithreads'] == [{'channel_id': 'c2', 'root_id': 'post-c2'}]
+
+def test_message_limit(client):
+    plugin = FakeChat({'message_limit': 2}, client)
+    response = plugin.process_records(request(), [media(name, ['c1']) for name in 'abc'])
+    assert plugin.sent == [('c1', None, 'a\nb')]
+    assert set(response) == {'a', 'b', 'c'}
+
+def test_send_failure(client):
+    plugin = FakeChat({}, client, fail=['c1'])
+    assert plugin.process_records(request(), [media('a', ['c1'])]) == {}
+    # Tried 4 times
+    assert len(plugin.sent) == 4
+
+def test_user_message(client):
+    client.records = [{'uid': 'u1', 'hash': 'h1', 'snooze_webhook_responses': [
+        {'action_name': 'chat', 'content': {'threads': [{'channel_id': 'c1', 'root_id': 'r1'}]}}]}]
+    plugin = FakeChat({}, client)
+    message = SimpleNamespace(user_name='john', root_id='r1', body={}, text=' ok')
+    reply = plugin.process_user_message(message)
+    assert reply.startswith(':white_check_mark: Alert acknowledged')
+    assert client.comments == [{'type': 'ack', 'record_uid': 'u1', 'name': 'john via chat', 'method': 'fake', 'message': ''}]
+
+def test_concurrent_channels(client):
+    plugin = FakeChat({}, client, delays={'c1': 0.3, 'c2': 0.3, 'c3': 0.3})
+    start = time.monotonic()
+    response = plugin.process_records(request(), [media('a', ['c1', 'c2', 'c3']), media('b', ['c3'])])
+    assert time.monotonic() - start < 0.6
+    assert [t['channel_id'] for t in response['a']['multithreads']] == ['c1', 'c2', 'c3']
+
+def test_deadline(client):
+    plugin = FakeChat({'fanout_timeout': 0.2}, client, delays={'c2': 1})
+    start = time.monotonic()
+    response = plugin.process_records(request(), [media('a', ['c1']), media('b', ['c2'])])
+    assert time.monotonic() - start < 0.5
+    assert response == {'a': {'threads': [], 'multithreads': [{'channel_id': 'c1', 'root_id': 'post-c1'}]}}
+
+def test_threads_indexed(client):
+    plugin = FakeChat({}, client)
+    plugin.process_records(request(), [media('a', ['c1', 'c2']), media('b', ['c2'])])
+    assert plugin.thread_index.get('post-c1') == ['a']
+    assert plugin.thread_index.get('post-c2') == ['a', 'b']
+
+def test_late_threads_indexed(client):
+    plugin = FakeChat({'fanout_timeout': 0.1}, client, delays={'c1': 0.3})
+    assert plugin.process_records(request(), [media('a', ['c1'])]) == {}
+    # Delivered after the response: commands in the thread still find the alert
+    assert plugin.delivery.flush(1)
+    assert plugin.thread_index.get('post-c1') == ['a']
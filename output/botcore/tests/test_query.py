@@ -0,0 +1,58 @@
+import time
+
+from snooze_bot_core.query import SnoozeQuery, ThreadIndex, hash_query
+
+RECORD = {'uid': 'u1', 'hash': 'h1'}
+
+class TestThreadIndex:
+    def test_add_get(self):
+        index = ThreadIndex()
+        index.add([('t1', 'h2'), ('t1', 'h1'), ('t2', 'h1'), (None, 'h3')])
+        assert index.get('t1') == ['h1', 'h2']
+        assert index.get('t3') == []
+        assert len(index) == 3
+
+    def test_persistent(self, tmp_path):
+        path = tmp_path / 'threads.sqlite'
+        ThreadIndex(path).add([('t1', 'h1')])
+        assert ThreadIndex(path).get('t1') == ['h1']
+
+    def test_prune(self):
+        index = ThreadIndex(ttl=60)
+        index.add([('t1', 'h1')])
+        index.db.execute("UPDATE threads SET updated = ?", (time.time() - 120,))
+        index.prune()
+        assert index.get('t1') == []
+
+    def test_unwritable_path(self, tmp_path):
+        (tmp_path / 'file').write_text('')
+        index = ThreadIndex(tmp_path / 'file' / 'threads.sqlite')
+        index.add([('t1', 'h1')])
+        assert index.get('t1') == ['h1']
+
+def test_hash_query():
+    assert hash_query(['h1']) == ['=', 'hash', 'h1']
+    assert hash_query(['h1', 'h2']) == ['OR', ['=', 'hash', 'h1'], ['=', 'hash', 'h2']]
+
+class TestSnoozeQuery:
+    def test_miss_then_hit(self, client):
+        client.records = [RECORD]
+        query = SnoozeQuery(client, ['root_id'])
+        assert query.records('t1') == [RECORD]
+        assert client.queries[0][0] == 'OR'
+        assert query.records('t1') == [RECORD]
+        assert client.queries[1] == ['=', 'hash', 'h1']
+
+    def test_remember(self, client):
+        client.records = [RECORD]
+        query = SnoozeQuery(client, ['root_id', 'thread_id'])
+        query.remember([{'channel_id': 'c1', 'thread_id': 't1'}], 'h1')
+        query.records('t1')
+        assert client.queries == [['=', 'hash', 'h1']]
+
+    def test_stale_entry(self, client):
+        query = SnoozeQuery(client, [''])
+        query.remember(['spaces/a/threads/b'], 'gone')
+        assert query.records('spaces/a/threads/b') == []
+        assert len(client.queries) == 2
+        assert query.index.get('spaces/a/threads/b') == []
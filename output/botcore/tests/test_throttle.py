@@ -0,0 +1,41 @@
+from snooze_bot_core.throttle import RateLimiter, retry_after
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_rate():
+    clock = FakeClock()
+    limiter = RateLimiter(2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+        limiter.acquire()
+    # 2 requests of the initial burst, then 2 per second
+    assert clock.now == 102.0
+
+def test_unlimited():
+    clock = FakeClock()
+    limiter = RateLimiter(0, clock=clock, sleep=clock.sleep)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.now == 100.0
+
+def test_pause():
+    clock = FakeClock()
+    limiter = RateLimiter(10, clock=clock, sleep=clock.sleep)
+    limiter.pause(30)
+    limiter.acquire()
+    assert clock.now == 130.0
+    limiter.acquire()
+    assert clock.now == 130.0
+
+def test_retry_after():
+    assert retry_after({'Retry-After': '12'}) == 12
+    assert retry_after({}, 5) == 5
+    assert retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0
+    assert retry_after({'Retry-After': 'soon'}, 3) == 3
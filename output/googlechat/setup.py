@@ -28,6 +28,7 @@ setup(
         'pyparsing',
         'python-dateutil',
         'pyyaml',
+        'snooze-bot-core',
         'snooze-client',
     ],
     extras_require={
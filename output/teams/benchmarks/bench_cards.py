@@ -0,0 +1,65 @@
+'''
+Compare the rendering of the alert cards with the previous string.Template rendering,
+for cards of 1, 10 and 100 alerts.
+Usage: python3 benchmarks/bench_cards.py [iterations]
+'''
+
+import json
+import re
+import sys
+import timeit
+from string import Template
+
+from dateutil import parser
+
+from snooze_teams.main import TeamsPlugin
+
+DATE_FORMAT = '%a, %b %d, %Y at %I:%M %p'
+date_regex = re.compile(r"[0-9]{1,4}-[0-9]{1,2}-[0-9]{1,2}T[0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}[\+\d]*")
+
+def make_batch(count):
+    records = [{
+        'host': 'host{:03d}'.format(index),
+        'hash': 'hash{:03d}'.format(index),
+        'source': 'syslog',
+        'process': 'kernel',
+        'severity': 'err',
+        'message': 'Filesystem /var is 98% full',
+        'timestamp': '2024-01-02T03:{:02d}:05+0000'.format(index % 60),
+    } for index in range(count)]
+    return {'header': count > 1, 'footer': False, 'messages': [{'msg': {'record': record}} for record in records]}
+
+def template_card(message, website='http://localhost:5201'):
+    '''The previous implementation: JSON text built with string.Template'''
+    timestamp = date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(DATE_FORMAT), message['messages'][0]['msg']['record']['timestamp'])
+    facts = []
+    for item in message['messages']:
+        record = item['msg']['record']
+        msg = {
+            'key': '[{}]({}/web/?#/record?tab=All&s=hash%3D{})'.format(record['host'], website, record['hash']),
+            'value': '[{}] **{}** {}'.format(record['source'], record['process'], record['message']),
+        }
+        facts.append(Template('{"title": "$key", "value": "$value"}').substitute(msg))
+    return Template('''{
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "type": "AdaptiveCard", "version": "1.4", "msteams": {"width": "full"},
+        "body": [{"type": "ColumnSet", "columns": [{"type": "Column", "items": [
+            {"type": "TextBlock", "weight": "Bolder", "text": "$header", "wrap": true},
+            {"type": "TextBlock", "spacing": "None", "text": "$timestamp", "isSubtle": true, "wrap": true}
+        ], "width": "stretch"}]}, {"type": "FactSet", "facts": [$facts]}]
+    }''').substitute({'schema': '$schema', 'header': 'Received alerts', 'timestamp': timestamp, 'facts': ','.join(facts)})
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    plugin = TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:', 'date_format': DATE_FORMAT}, client=object())
+    print("{:>7} {:>16} {:>16}".format('alerts', 'template (us)', 'builder (us)'))
+    for count in [1, 10, 100]:
+        message = make_batch(count)
+        # Every card must be valid JSON
+        json.loads(plugin.format_message(message, {})['attachments'][0]['content'])
+        template = timeit.timeit(lambda: template_card(message), number=iterations) / iterations
+        builder = timeit.timeit(lambda: plugin.format_message(message, {}), number=iterations) / iterations
+        print("{:>7} {:>16.1f} {:>16.1f}".format(count, template * 1e6, builder * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+'''Cache of the Graph metadata (channel information), shared by the webhook requests and the poller'''
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+LOG = logging.getLogger("snooze.teamschat.cache")
+
+class MetadataCache:
+    '''
+    Cache of the values returned by `loader(key)`, kept `ttl` seconds. Failures are kept `negative_ttl` seconds.
+    Concurrent lookups of a key wait for a single load. Once expired, a value is still returned
+    while it is reloaded in the background (and kept if the reload fails).
+    At most `size` keys are kept, the least recently used ones are dropped first.
+    '''
+    def __init__(self, loader, ttl=3600, negative_ttl=60, size=1024, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self.clock = clock
+        self.lock = threading.Lock()
+        # key => (value, loaded, expiration)
+        self.entries = OrderedDict()
+        # key => event set when loaded
+        self.loading = {}
+
+    def get(self, key, default=None):
+        '''Return the value of a key, or `default` if it could not be loaded'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                value, loaded, expiration = entry
+                if expiration > self.clock():
+                    return value if loaded else default
+                if loaded:
+                    self._reload(key)
+                    return value
+            event = self.loading.get(key)
+            owner = event is None
+            if owner:
+                event = self.loading[key] = threading.Event()
+        if owner:
+            self._load(key)
+        else:
+            event.wait()
+        with self.lock:
+            entry = self.entries.get(key)
+        return entry[0] if entry and entry[1] else default
+
+    def _reload(self, key):
+        '''Reload a key in the background. Called with the lock held'''
+        if key not in self.loading:
+            self.loading[key] = threading.Event()
+            threading.Thread(target=self._load, args=(key,), daemon=True).start()
+
+    def _load(self, key):
+        try:
+            entry = (self.loader(key), True, self.clock() + self.ttl)
+        except Exception as e:
+            LOG.warning("Could not load %s: %s", key, e)
+            entry = (None, False, self.clock() + self.negative_ttl)
+        with self.lock:
+            previous = self.entries.get(key)
+            if not entry[1] and previous and previous[1]:
+                # Keep the previous value until the next try
+                entry = (previous[0], True, entry[2])
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            self.loading.pop(key).set()
+
+    def prewarm(self, keys):
+        '''Load keys in the background'''
+        keys = list(keys)
+        if keys:
+            threading.Thread(target=lambda: [self.get(key) for key in keys], daemon=True).start()
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
@@ -0,0 +1,81 @@
+'''
+Adaptive Cards of the Teams alerts.
+Cards are built as dicts and serialized with json, so any text (quotes, backslashes,
+newlines in the alert messages) always gives a valid card.
+'''
+
+import json
+import uuid
+from functools import lru_cache
+
+from snooze_bot_core.dates import format_dates
+
+SCHEMA = 'http://adaptivecards.io/schemas/adaptive-card.json'
+CONTENT_TYPE = 'application/vnd.microsoft.card.adaptive'
+TEAMS_APP_ID = '5ef9989f-aeae-45d5-a672-10615a4819c9'
+# Parts of the card which never change, shared by every card
+MSTEAMS = {'width': 'full'}
+ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(timestamp, date_format):
+    return format_dates(timestamp, date_format, local=True)
+
+def format_timestamp(timestamp, date_format):
+    '''Format the dates of a timestamp, in the local timezone. Results are cached'''
+    return _format_timestamp(str(timestamp), date_format)
+
+def text_block(text, **options):
+    block = {'type': 'TextBlock', 'text': text, 'wrap': True}
+    block.update(options)
+    return block
+
+def fact(title, value):
+    return {'title': title, 'value': value}
+
+def record_link(website, record):
+    '''Markdown link to the record in the web interface'''
+    return '[{}]({}/web/?#/record?tab=All&s=hash%3D{})'.format(record.get('host', 'Unknown'), website, record.get('hash'))
+
+def alert_card(header, timestamp, from_message, facts, footer=''):
+    '''Adaptive Card with a header, a set of facts and a footer'''
+    return {
+        '$schema': SCHEMA,
+        'type': 'AdaptiveCard',
+        'version': '1.4',
+        'msteams': MSTEAMS,
+        'body': [{
+            'type': 'ColumnSet',
+            'columns': [{
+                'type': 'Column',
+                'items': [
+                    text_block(header, weight='Bolder'),
+                    text_block(timestamp, spacing='None', isSubtle=True),
+                    text_block(from_message, spacing='None'),
+                ],
+                'width': 'stretch',
+            }],
+        }, {
+            'type': 'FactSet',
+            'facts': facts,
+        }, text_block(footer)],
+    }
+
+def card_message(card, marker=''):
+    '''Graph chat message embedding an Adaptive Card'''
+    uid = uuid.uuid4().hex
+    return {
+        'body': {
+            'contentType': 'html',
+            'content': '<attachment id="{}"></attachment>{}'.format(uid, marker),
+        },
+        'attachments': [{
+            'id': uid,
+            'contentType': CONTENT_TYPE,
+            'contentUrl': None,
+            'content': ENCODER.encode(card),
+            'name': 'Testing name',
+            'thumbnailUrl': None,
+            'teamsAppId': TEAMS_APP_ID,
+        }],
+    }
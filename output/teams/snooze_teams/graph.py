@@ -0,0 +1,107 @@
+'''
+Microsoft Graph client shared by the posting of the alerts, the poller, the subscriptions
+and the metadata lookups.
+Requests run on an asyncio event loop in a background thread, over a pool of HTTP/2 connections
+(HTTP/1.1 if `h2` is not installed), at most `concurrency` at a time. The threads of the plugin
+(webhook requests, poller) call it with the blocking methods (`get`, `post`, `patch`, `delete`),
+or `submit` a request and get a future.
+'''
+
+import asyncio
+import importlib.util
+import logging
+import threading
+
+import httpx
+
+LOG = logging.getLogger("snooze.teamschat.graph")
+
+def o365_authorization(con):
+    '''
+    Return a function giving the Authorization header of the O365 connection `con`,
+    refreshing its token when called with `refresh=True`
+    '''
+    lock = threading.Lock()
+    def authorization(refresh=False):
+        with lock:
+            if con.session is None:
+                con.session = con.get_session(load_token=True)
+            if refresh:
+                LOG.debug("Refreshing the Graph token")
+                con.refresh_token()
+            return con.session.headers.get('Authorization')
+    return authorization
+
+class GraphClient:
+    '''
+    Graph client. `authorization(refresh)` returns the Authorization header of the requests.
+    It is called again with `refresh=True` when Graph rejects the token (401).
+    '''
+    def __init__(self, authorization, concurrency=16, max_connections=None, http2=True, timeout=30, transport=None):
+        self.authorization = authorization
+        self.header = None
+        if http2 and importlib.util.find_spec('h2') is None:
+            LOG.warning("Package h2 not installed, using HTTP/1.1 for Graph")
+            http2 = False
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='graph', daemon=True)
+        self.thread.start()
+        max_connections = max_connections or concurrency
+        async def setup():
+            self.semaphore = asyncio.Semaphore(concurrency)
+            self.token_lock = asyncio.Lock()
+            self.client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                timeout=timeout,
+                transport=transport,
+            )
+        self.run(setup())
+
+    def run(self, coroutine):
+        '''Run a coroutine on the event loop of the client, and wait for its result'''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def get_authorization(self, failed=None):
+        '''Return the Authorization header, refreshed if it is the one which `failed`'''
+        async with self.token_lock:
+            if self.header is None or self.header == failed:
+                refresh = self.header is not None
+                self.header = await self.loop.run_in_executor(None, self.authorization, refresh)
+            return self.header
+
+    async def request(self, method, url, data=None):
+        '''
+        Send a request (`data` is sent as JSON), and return the response.
+        Raise httpx.HTTPStatusError for the 4XX and 5XX responses
+        '''
+        async with self.semaphore:
+            header = await self.get_authorization()
+            response = await self.client.request(method, url, json=data, headers={'Authorization': header})
+            if response.status_code == 401:
+                header = await self.get_authorization(failed=header)
+                response = await self.client.request(method, url, json=data, headers={'Authorization': header})
+        LOG.debug("%s %s: %s (%s)", method, url, response.status_code, response.http_version)
+        response.raise_for_status()
+        return response
+
+    def submit(self, method, url, data=None):
+        '''Send a request in the background, and return a concurrent.futures.Future of its response'''
+        return asyncio.run_coroutine_threadsafe(self.request(method, url, data), self.loop)
+
+    def get(self, url):
+        return self.submit('GET', url).result()
+
+    def post(self, url, data=None):
+        return self.submit('POST', url, data).result()
+
+    def patch(self, url, data=None):
+        return self.submit('PATCH', url, data).result()
+
+    def delete(self, url):
+        return self.submit('DELETE', url).result()
+
+    def close(self):
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
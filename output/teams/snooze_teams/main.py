@@ -1,22 +1,27 @@
-import json
 import yaml
 import os
 import re
 import logging
-import uuid
 import time
 import html
 import threading
 import falcon
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dateutil import parser
 from pathlib import Path
-from string import Template
 from types import SimpleNamespace
-from urllib.parse import urlparse, parse_qs, unquote
-from snooze_client import Snooze
-from snooze_teams.bot_parser import parser as bot_parser
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from snooze_bot_core.dates import format_dates
+from snooze_bot_core.plugin import SnoozeBotPlugin
+from snooze_bot_core.throttle import RateLimiter, retry_after
 from snooze_teams.bot_emoji import parse_emoji
+from snooze_teams.cache import MetadataCache
+from snooze_teams.notifications import NotificationRoute, SubscriptionManager
+from snooze_teams.graph import GraphClient, o365_authorization
+from snooze_teams.cards import alert_card, card_message, fact, format_timestamp, record_link
+from snooze_teams.state import PollState, RecentIds
 
 from waitress.adjustments import Adjustments
 from waitress.server import TcpWSGIServer
@@ -44,344 +49,6 @@ class SnoozeBot():
         else:
             self.config = {}
 
-class SnoozeBotPlugin():
-
-    date_regex = re.compile(r"[0-9]{1,4}-[0-9]{1,2}-[0-9]{1,2}T[0-9]{1,2}:[0-9]{1,2}:[0-9]{1,2}[\+\d]*")
-    duration_regex = re.compile(r"((\d+) *(mins|min|m|hours|hour|h|weeks|week|w|days|day|d|months|month|years|year|y)|forever){0,1} *(.*)", re.IGNORECASE)
-
-    def __init__(self, config):
-        self.config = config
-        self.address = self.config.get('listening_address', '0.0.0.0')
-        self.port = self.config.get('listening_port', 5202)
-        self.date_format = self.config.get('date_format', '%a, %b %d, %Y at %I:%M %p')
-        self.client = Snooze()
-        self.bot_name = self.config.get('bot_name', 'Bot')
-        self.snooze_url = self.config.get('snooze_url', 'http://localhost:5201')
-        if self.snooze_url.endswith('/'):
-            self.snooze_url = self.snooze_url[:-1]
-        self.message_limit = self.config.get('message_limit', 10)
-        self.snooze_limit = self.config.get('snooze_limit', self.message_limit)
-    
-    def process_alert(self, request, medias):
-        if not isinstance(medias, list):
-            medias = [medias]
-        response = self.process_records(request, medias)
-        LOG.debug("Response: {}".format(response))
-        return response
-
-    def send_message(self, message, channel_id="", thread={}, attachment={}, request={}, layout_type='post'):
-        return
-
-    def process_records(self, req, medias):
-        multi = len(medias) > 1
-        channels = {}
-        header = False
-        footer = False
-        return_value = {}
-        website = self.snooze_url
-        action_name = req.params['snooze_action_name']
-        for req_media in medias[:self.message_limit]:
-            self.process_rec(channels, req_media, action_name, multi, website)
-        for req_media in medias[self.message_limit:]:
-            self.process_rec(channels, req_media, action_name, multi, website, False)
-        for channel, content in channels.items():
-            if multi:
-                header = True
-                if len(content) > self.message_limit:
-                    footer = True
-            # Parse channel_id: if it contains /messages/{id}, extract parent thread for replies
-            actual_channel = channel
-            channel_parent_thread = {}
-            match = re.match(r'^(.+)/messages/(.+)$', channel)
-            if match:
-                actual_channel = match.group(1)
-                channel_parent_thread = {'channel_id': actual_channel, 'thread_id': match.group(2)}
-            if hasattr(self, 'register_poll_resource'):
-                self.register_poll_resource(actual_channel)
-            # Detect channel layout type (post or chat)
-            layout_type = self.get_channel_layout(actual_channel) if hasattr(self, 'get_channel_layout') else 'post'
-            attachment = [{'text': 'Acknowledge', 'action': 'ack', 'style': 'success'}, {'text': 'Close', 'action': 'close', 'style': 'primary'}]
-            if not multi and content[0]['threads']:
-                for thread in content[0]['threads']:
-                    self.send_message(content[0]['msg'], channel_id=actual_channel, thread=thread, attachment=attachment, request=req, layout_type=layout_type)
-                return_value = {content[0]['record_hash']: {'threads': content[0]['threads'], 'multithreads': content[0]['multithreads']}}
-            else:
-                resp = self.send_message({'header': header, 'footer': footer, 'messages': content}, channel_id=actual_channel, thread=channel_parent_thread, attachment=attachment, request=req, layout_type=layout_type)
-                if resp:
-                    for message in content:
-                        if channel_parent_thread:
-                            t = channel_parent_thread.copy()
-                        else:
-                            t = {'channel_id': actual_channel, 'thread_id': resp.get('root_id', resp['id'])}
-                        if multi:
-                            message['multithreads'].append(t)
-                        else:
-                            message['threads'].append(t)
-                        return_value[message['record_hash']] = {'threads': message['threads'], 'multithreads': message['multithreads']}
-        if multi:
-            return return_value
-        else:
-            return list(return_value.values())[0]
-
-    def process_rec(self, channels,req_media, action_name, multi, website, process = True):
-        rec_channels = req_media['channels']
-        record = req_media['alert']
-        message = req_media.get('message')
-        message_group = req_media.get('message_group')
-        reply = req_media.get('reply')
-        notification_from = record.get('notification_from')
-
-        LOG.debug('Received record: {}'.format(record))
-        msg = {}
-        threads = next((action_result.get('content', {}).get('threads', []) for action_result in record.get('snooze_webhook_responses', []) if action_result.get('action_name') == action_name), [])
-        multithreads = next((action_result.get('content', {}).get('multithreads', []) for action_result in record.get('snooze_webhook_responses', []) if action_result.get('action_name') == action_name), [])
-        if process:
-            msg['record'] = record
-            if multi:
-                msg['multi'] = True
-            if threads:
-                msg['threads'] = True
-            if reply:
-                msg['reply'] = reply
-            if message:
-                msg['message'] = message
-            if message_group:
-                msg['message_group'] = message_group
-            if notification_from:
-                notif_name = notification_from.get('name', 'anonymous')
-                notif_message = notification_from.get('message')
-                msg['from'] = notif_name
-                if notif_message:
-                    msg['notif_msg'] = notif_message
-        for channel in rec_channels:
-            if channel not in channels:
-                channels[channel] = []
-            channels[channel].append({'msg': msg, 'record_hash': record.get('hash', ''), 'threads': threads, 'multithreads': multithreads})
-
-    def process_user_message(self, message):
-        LOG.debug("Received message: '{}'".format(vars(message)))
-        try:
-            display_name = message.user_name
-            thread = message.root_id
-            if 'command' in message.body:
-                original_message = message.command + ' ' + message.text.lstrip()
-            else:
-                original_message = message.text.lstrip()
-        except:
-            display_name = message.sender_name
-            original_message = message.text.lstrip()
-            thread = message.root_id or message.id
-        try:
-            command, text = re.split(r'[^a-zA-Z0-9\/]', original_message, 1)
-        except ValueError:
-            command = original_message
-            text = ''
-        command = command.casefold()
-        link = ''
-        snoozelink = ''
-        modification = []
-        snooze_help = """`{}`: Command: **@{}** snooze <duration> [condition]
-
-**duration** (forever or X mins|min|m|hours|hour|h|weeks|week|w|days|day|d|months|month|years|year|y): *Duration of this snooze entry*
-**condition** (text): *Condition for which this snooze entry will match*
-
-Example: *@{}* **snooze** 6h host = example_host""".format(display_name, self.bot_name, self.bot_name)
-        if command in ['help_snooze', '/help_snooze']:
-            return snooze_help
-        elif not command or command in ['help', '/help']:
-            if text == 'snooze':
-                return snooze_help
-            else:
-                return """`{}`: List of available commands:
-
-**ack, acknowledge, ok** [message]: *Acknowledge an alert*
-**esc, escalate, re-escalate, reescalate, re-esc, reesc** <modification> [message]: *Re-escalate an alert*
-**close, done** [message]: *Close an alert*
-**open, reopen, re-open** [message]: *Re-open an alert*
-**snooze** <duration> [condition]: *Snooze an alert (default 1h) (*`/help_snooze`*)*
-any other message: *Comment an alert*
-
-Example: *@{}* **esc** severity = critical *Please check*""".format(display_name, self.bot_name)
-        aggregates = self.client.record([
-            'OR',
-            ['IN', ['IN', thread, 'content.threads.root_id'], 'snooze_webhook_responses'],
-            ['IN', ['IN', thread, 'content.threads.thread_id'], 'snooze_webhook_responses'],
-            ['IN', ['IN', thread, 'content.multithreads.root_id'], 'snooze_webhook_responses'],
-            ['IN', ['IN', thread, 'content.multithreads.thread_id'], 'snooze_webhook_responses']
-        ])
-        if len(aggregates) == 0:
-            return ':x: `{}`:Cannot find the corresponding alert! (command: `{}`)'.format(display_name, original_message)
-        record = aggregates[0]
-        action_name = next(action_result.get('action_name') for action_result in record.get('snooze_webhook_responses', [])
-            if thread in list(map(
-                lambda x: x.get('root_id') or x.get('thread_id'),
-                action_result.get('content', {}).get('threads', []) + action_result.get('content', {}).get('multithreads', [])
-            ))) or 'SnoozeBot'
-        user = '{} via {}'.format(display_name, action_name)
-        if self.snooze_url:
-            link = '[[Link]]({}/web/?#/record?tab=All&s=hash%3D{})'.format(self.snooze_url, record['hash'])
-            snoozelink = '[[Link]]({}/web/?#/snooze?tab=All&s=hash%3D{})'.format(self.snooze_url, record['hash'])
-        if command in ['snooze', '/snooze']:
-            LOG.debug("Snooze {} alerts with parameters: '{}'".format(len(aggregates), text))
-            duration_match = SnoozeBotPlugin.duration_regex.search(text)
-            if duration_match:
-                try:
-                    now = datetime.now()
-                    time_constraints = {}
-                    conditions = []
-                    query = ''
-                    duration_time = duration_match.group(1)
-                    duration_number = duration_match.group(2)
-                    duration_period = duration_match.group(3)
-                    query_match = duration_match.group(4)
-                    if duration_time and duration_time == 'forever':
-                        later = None
-                        duration = 'Forever'
-                    elif duration_period:
-                        duration_period = duration_period.casefold()
-                        if duration_period.startswith('h'):
-                            later = now + timedelta(hours = int(duration_number))
-                            duration = duration_number + ' hour(s)'
-                        elif duration_period.startswith('d'):
-                            later = now + timedelta(days = int(duration_number))
-                            duration = duration_number + ' day(s)'
-                        elif duration_period.startswith('w'):
-                            later = now + timedelta(weeks = int(duration_number))
-                            duration = duration_number + ' week(s)'
-                        elif duration_period.startswith('month'):
-                            later = now + timedelta(days = int(duration_number)*30)
-                            duration = duration_number + ' month(s)'
-                        elif duration_period.startswith('m'):
-                            later = now + timedelta(minutes = int(duration_number))
-                            duration = duration_number + ' minute(s)'
-                        elif duration_period.startswith('y'):
-                            later = now + timedelta(days = int(duration_number)*365)
-                            duration = duration_number + ' year(s)'
-                        else:
-                            return ":x: `{}`: Invalid snooze filter duration syntax. Use `/help_snooze` to learn how to use this command".format(display_name)
-                    else:
-                        later = now + timedelta(hours = 1)
-                        duration = '1h'
-                    if query_match:
-                        query = query_match
-                        conditions = [None]
-                    else:
-                        conditions = []
-                        for record in aggregates:
-                            conditions.append(['=', 'hash', '{}'.format(record['hash'])])
-                    if later:
-                        time_constraints = {"datetime": [{"from": now.astimezone().strftime("%Y-%m-%dT%H:%M:%S%z"), "until": later.astimezone().strftime("%Y-%m-%dT%H:%M:%S%z")}]}
-                    if len(conditions) <= self.snooze_limit:
-                        payload = [{'name': '[{}] {} ({})'.format(duration, display_name, str(uuid.uuid4())[:5]), 'condition': condition, 'ql': query, 'time_constraints': time_constraints, 'comment': display_name} for condition in conditions]
-                        result = self.client.snooze_batch(payload)
-                        if result.get('rejected'):
-                            return ':x: `{}`: Could not Snooze alert(s)!'.format(display_name)
-                        LOG.debug('Done: {}'.format(result))
-                        ack_payload = [{'type': 'ack', 'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': 'Snoozed for {}'.format(duration)} for record in aggregates]
-                        self.client.comment_batch(ack_payload)
-                        count = ''
-                        if len(aggregates) > 1:
-                            link = '[[Link]]({}/web/?#/record?tab=Acknowledged)'.format(self.snooze_url)
-                            snoozelink = '[[Link]]({}/web/?#/snooze?tab=All)'.format(self.snooze_url)
-                            count = '**{}** '.format(len(aggregates))
-                        comment_text = ":white_check_mark: {}Alert(s) acknowledged successfully by `{}`! {}\n".format(count, display_name, link)
-                        warning_text = ''
-                        if len(result['data'].get('added', [])) > 0:
-                            res_cond = result['data']['added'][0].get('condition', [])
-                            if len(res_cond) > 0 and res_cond[0] == 'SEARCH':
-                                warning_text = "\n:warning: Snooze filter condition `{}` might not be expected. Please double check in the Web interface".format(res_cond)
-                        if later:
-                            return comment_text + ':white_check_mark: Snoozed for {}! Expires at **{}** {}'.format(duration, later.strftime(self.date_format), snoozelink) + warning_text
-                        else:
-                            return comment_text + ':white_check_mark: Snoozed forever! {}'.format(snoozelink) + warning_text
-                    else:
-                        return ':x: `{}`: Cannot Snooze more than {} alert(s) without using an explicit condition. Please try again or use [SnoozeWeb]({}/web/?#/snooze).'.format(display_name, self.snooze_limit, self.snooze_url)
-                except Exception as e:
-                    LOG.exception(e)
-                    return ':x: `{}`: Could not Snooze alert(s)!'.format(display_name)
-            else:
-                return "`{}`: Invalid Snooze filter syntax. Use `/help_snooze` to learn how to use this command".format(display_name)
-        elif command in ['ack', 'acknowledge', 'ok', '/ack']:
-            LOG.debug('ACK {} alerts'.format(len(aggregates)))
-            try:
-                payload = [{'type': 'ack', 'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': text} for record in aggregates]
-                self.client.comment_batch(payload)
-                msg_extra = ''
-                if text:
-                    msg_extra = ' with message `{}`'.format(text)
-                if len(aggregates) == 1:
-                    return ':white_check_mark: Alert acknowledged successfully by `{}`{}! {}'.format(display_name, msg_extra, link)
-                else:
-                    return ':white_check_mark: **{}** alerts acknowledged successfully by `{}`{}! [[Link]]({}/web/?#/record?tab=Acknowledged)'.format(len(aggregates), display_name, msg_extra, self.snooze_url)
-            except Exception as e:
-                LOG.exception(e)
-                return ':x: `{}`: Could not acknowledge alert(s)!'.format(display_name)
-        elif command in ['esc', 'escalate', 're-escalate', 'reescalate', 're-esc', 'reesc', '/esc']:
-            LOG.debug('ESC {} alerts'.format(len(aggregates)))
-            try:
-                modifications, comment = bot_parser(text)
-                payload = [{'type': 'esc', 'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': comment, 'modifications': modifications} for record in aggregates]
-                self.client.comment_batch(payload)
-                msg_extra = ''
-                if modifications:
-                    msg_extra += ' with modification `{}`'.format(modifications)
-                if comment:
-                    msg_extra += ' {} message `{}`'.format('and' if modifications else 'with', comment)
-                if len(aggregates) == 1:
-                    return ':white_check_mark: Alert re-escalated successfully by `{}`{}! {}'.format(display_name, msg_extra, link)
-                else:
-                    return ':white_check_mark: **{}** alerts re-escalated successfully by `{}`{}! [[Link]]({}/web/?#/record?tab=Re-escalated)'.format(len(aggregates), display_name, msg_extra, self.snooze_url)
-            except Exception as e:
-                LOG.exception(e)
-                return ':x: `{}`: Could not re-escalate alert(s)!'.format(display_name)
-        elif command in ['close', 'done', '/close']:
-            LOG.debug('CLOSE {} alerts'.format(len(aggregates)))
-            try:
-                payload = [{'type': 'close', 'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': text} for record in aggregates]
-                self.client.comment_batch(payload)
-                msg_extra = ''
-                if text:
-                    msg_extra = ' with message `{}`'.format(text)
-                if len(aggregates) == 1:
-                    return ':white_check_mark: Alert closed successfully by `{}`{}! {}'.format(display_name, msg_extra, link)
-                else:
-                    return ':white_check_mark: **{}** alerts closed successfully by `{}`{}! [[Link]]({}/web/?#/record?tab=Closed)'.format(len(aggregates), display_name, msg_extra, self.snooze_url)
-            except Exception as e:
-                LOG.exception(e)
-                return ':x: `{}`: Could not close alert(s)!'.format(display_name)
-        elif command in ['open', 'reopen', 're-open', '/open']:
-            LOG.debug('OPEN {} alerts'.format(len(aggregates)))
-            try:
-                payload = [{'type': 'open', 'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': text} for record in aggregates]
-                self.client.comment_batch(payload)
-                msg_extra = ''
-                if text:
-                    msg_extra = ' with message `{}`'.format(text)
-                if len(aggregates) == 1:
-                    return ':white_check_mark: Alert re-opened successfully by `{}`{}! {}'.format(display_name, msg_extra, link)
-                else:
-                    return ':white_check_mark: **{}** alerts re-opened successfully by `{}`{}! [SnoozeWeb]({}/web/?#/record?tab=Alerts&s=state=open)'.format(len(aggregates), display_name, msg_extra, self.snooze_url)
-            except Exception as e:
-                LOG.exception(e)
-                return ':x: `{}`: Could not re-open alert(s)!'.format(display_name)
-        else:
-            LOG.debug('COMMENT {} alerts'.format(len(aggregates)))
-            try:
-                msg_extra = ''
-                if command in ['/comment']:
-                    msg_extra = text
-                else:
-                    msg_extra = original_message
-                payload = [{'record_uid': record['uid'], 'name': user, 'method': 'teams', 'message': msg_extra} for record in aggregates]
-                self.client.comment_batch(payload)
-                if len(aggregates) == 1:
-                    return ':white_check_mark: Comment added successfully by `{}`: `{}`! {}'.format(display_name, msg_extra, link)
-                else:
-                    return ':white_check_mark: **{}** comments added successfully by `{}`: `{}`! [[Link]]({}/web/?#/record)'.format(len(aggregates), display_name, msg_extra, self.snooze_url)
-            except Exception as e:
-                LOG.exception(e)
-                return ':x: `{}`: Could not comment alert(s)!'.format(display_name)
-
 class AlertRoute():
 
     def __init__(self, plugin):
@@ -401,18 +68,37 @@ class AlertRoute():
 class TeamsPlugin(SnoozeBotPlugin):
 
     BOT_MARKER = '<!-- snooze-bot -->'
+    method = 'teams'
+    thread_fields = ['root_id', 'thread_id']
+    empty_message = {}
 
-    def __init__(self, config):
-        super().__init__(config)
-        self._channel_layout_cache = {}
+    def __init__(self, config, client=None):
+        super().__init__(config, client)
+        self.address = self.config.get('listening_address', '0.0.0.0')
+        self.port = self.config.get('listening_port', 5202)
+        self.channel_info = MetadataCache(self.load_channel_info, self.config.get('metadata_ttl', 3600),
+            self.config.get('metadata_negative_ttl', 60), self.config.get('metadata_cache_size', 1024))
         self.poll_interval_seconds = int(self.config.get('poll_interval_seconds', 10))
         self.poll_lookback_seconds = int(self.config.get('poll_lookback_seconds', 0))
+        self.poll_watch_roots = int(self.config.get('poll_watch_roots', 50))
+        self.poll_replies_max_interval = int(self.config.get('poll_replies_max_interval', 300))
+        self.poll_idle_max_interval = max(int(self.config.get('poll_idle_max_interval', 60)), self.poll_interval_seconds)
+        self.poll_workers = int(self.config.get('poll_workers', 4))
+        self.graph_limiter = RateLimiter(self.config.get('poll_requests_per_second', 5))
+        self.poll_state = PollState(self.config.get('poll_state', '/var/lib/snooze/teams_poll_state.sqlite'))
         resources = self.config.get('poll_resources', [])
         if isinstance(resources, str):
             resources = [resources]
         self._poll_resources = set()
         self._poll_resources_lock = threading.Lock()
         self._poller = None
+        # Graph transport (GraphClient), set once authenticated
+        self.graph = None
+        self.notification_url = self.config.get('notification_url', '')
+        self.subscriptions = None
+        if self.notification_url:
+            self.subscriptions = SubscriptionManager(self, self.notification_url,
+                self.config.get('subscription_lifetime', 3300), self.config.get('subscription_renew_before', 600))
         self.self_user_id = ''
         self.self_user_name = ''
         for resource in resources:
@@ -445,12 +131,49 @@ class TeamsPlugin(SnoozeBotPlugin):
     def on_alert(self, request, medias):
         response = self.process_alert(request, medias)
 
+    def resolve_channel(self, channel):
+        # If the channel contains /messages/{id}, post the alerts as replies of this message
+        actual_channel = channel
+        parent_thread = None
+        match = re.match(r'^(.+)/messages/(.+)$', channel)
+        if match:
+            actual_channel = match.group(1)
+            parent_thread = {'channel_id': actual_channel, 'thread_id': match.group(2)}
+        self.register_poll_resource(actual_channel)
+        return actual_channel, parent_thread
+
+    def make_thread(self, channel, response):
+        return {'channel_id': channel, 'thread_id': response.get('root_id', response['id'])}
+
+    def format_batch(self, content, multi, website):
+        return {'header': multi, 'footer': multi and len(content) > self.message_limit, 'messages': content}
+
+    def format_record(self, req_media, threads, multi, website):
+        record = req_media['alert']
+        msg = {'record': record}
+        if multi:
+            msg['multi'] = True
+        if threads:
+            msg['threads'] = True
+        for key in ['reply', 'message', 'message_group']:
+            if req_media.get(key):
+                msg[key] = req_media[key]
+        notification_from = record.get('notification_from')
+        if notification_from:
+            msg['from'] = notification_from.get('name', 'anonymous')
+            if notification_from.get('message'):
+                msg['notif_msg'] = notification_from['message']
+        return msg
+
     def register_poll_resource(self, channel_id):
         if not channel_id:
             return
         normalized = self.normalize_poll_resource(channel_id)
         with self._poll_resources_lock:
             self._poll_resources.add(normalized)
+        if self._poller:
+            # Users are likely to answer the alerts
+            self._poller.wake(normalized)
 
     def get_poll_resources(self):
         with self._poll_resources_lock:
@@ -519,17 +242,57 @@ class TeamsPlugin(SnoozeBotPlugin):
             return 'https://graph.microsoft.com/beta/{}'.format(channel_id)
         return 'https://graph.microsoft.com/beta/{}@thread.tacv2'.format(channel_id)
 
+    def graph_get(self, url):
+        '''
+        GET a Graph URL within the request budget of the poller (`poll_requests_per_second`).
+        When Graph throttles a request (429, 503), every request waits for its Retry-After
+        '''
+        self.graph_limiter.acquire()
+        try:
+            return self.graph.get(url)
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            if getattr(response, 'status_code', None) in (429, 503):
+                delay = retry_after(response.headers, self.poll_interval_seconds)
+                LOG.warning("Graph throttled the requests (%s), pausing them for %ss", response.status_code, delay)
+                self.graph_limiter.pause(delay)
+            raise
+
     def fetch_messages(self, resource):
         url = self.build_messages_url(resource)
-        resp = self.driver.con.get(url)
+        resp = self.graph_get(url)
         data = resp.json()
         if isinstance(data, dict):
             return data.get('value', [])
         return []
 
+    def fetch_delta(self, resource, delta_link=None, since=None):
+        '''
+        Return the root messages of a resource changed since the previous delta query, and the delta link
+        of the next one. Without delta link, a new delta query returns the messages modified after `since`
+        '''
+        if delta_link:
+            url = delta_link
+        else:
+            url = '{}/delta'.format(self.build_messages_url(resource).rstrip('/'))
+            if since:
+                since = since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                url = '{}?$filter={}'.format(url, quote('lastModifiedDateTime gt {}'.format(since)))
+        messages = []
+        while url:
+            resp = self.graph_get(url)
+            data = resp.json()
+            if not isinstance(data, dict):
+                break
+            messages.extend(data.get('value', []))
+            if data.get('@odata.deltaLink'):
+                return messages, data['@odata.deltaLink']
+            url = data.get('@odata.nextLink')
+        return messages, None
+
     def fetch_replies(self, resource, message_id):
         url = '{}/{}/replies'.format(self.build_messages_url(resource).rstrip('/'), message_id)
-        resp = self.driver.con.get(url)
+        resp = self.graph_get(url)
         data = resp.json()
         if isinstance(data, dict):
             return data.get('value', [])
@@ -597,7 +360,7 @@ class TeamsPlugin(SnoozeBotPlugin):
         if not thread_id:
             return
         layout_type = self.get_channel_layout(channel_id)
-        self.send_message({'reply': response_text}, channel_id=channel_id, thread={'thread_id': thread_id}, layout_type=layout_type)
+        self.deliver({'reply': response_text}, channel_id=channel_id, thread={'thread_id': thread_id}, layout_type=layout_type)
 
     def start_polling(self):
         if self._poller:
@@ -610,65 +373,59 @@ class TeamsPlugin(SnoozeBotPlugin):
             self._poller.kill()
             self._poller = None
 
+    def load_channel_info(self, url):
+        data = self.graph.get(url).json()
+        LOG.info("Channel %s has layout type: %s", url, data.get('layoutType', 'post'))
+        return data
+
     def get_channel_layout(self, channel_id):
         """Auto-detect the channel layout type via the Graph API.
 
-        Queries GET /beta/{channel_id}@thread.tacv2 and reads the layoutType property.
-        Results are cached per channel_id.
+        Reads the layoutType property of GET /beta/{channel_id}@thread.tacv2.
+        Channel information is cached (see MetadataCache).
 
         Returns:
-            'post' (default) or 'chat'
+            'post' (default, also if the channel information could not be fetched) or 'chat'
         """
-        if channel_id in self._channel_layout_cache:
-            return self._channel_layout_cache[channel_id]
-        try:
-            url = self.build_channel_info_url(channel_id)
-            resp = self.driver.con.get(url)
-            data = resp.json()
-            layout = data.get('layoutType', 'post')
-            LOG.info("Channel %s has layout type: %s", channel_id, layout)
-            self._channel_layout_cache[channel_id] = layout
-            return layout
-        except Exception as e:
-            LOG.warning("Failed to detect channel layout for %s, defaulting to 'post': %s", channel_id, e)
-            self._channel_layout_cache[channel_id] = 'post'
-            return 'post'
+        info = self.channel_info.get(self.build_channel_info_url(channel_id)) or {}
+        return info.get('layoutType', 'post')
 
-    def send_message(self, message, channel_id="", thread={}, attachment={}, request={}, layout_type='post'):
+    def send_message(self, message, channel_id=None, thread=None, attachment=None, request=None, layout_type=None):
+        if layout_type is None:
+            # Detect channel layout type (post or chat)
+            layout_type = self.get_channel_layout(channel_id)
         if layout_type == 'chat':
             data = self.format_flat_message(message, thread)
         else:
             data = self.format_message(message, thread)
         LOG.debug('Posting on {}'.format(channel_id))
-        props = {}
         thread_id = ''
         if thread:
             thread_id = thread['thread_id']
         url = self.build_post_messages_url(channel_id, thread_id)
-        for n in range(3):
-            try:
-                resp = self.driver.con.post(url, data=data)
-                return resp.json()
-            except Exception as e:
-                LOG.exception(e)
-                time.sleep(1)
-                continue
-        return None
+        return self.graph.post(url, data=data).json()
 
     def serve(self):
         self.app = falcon.App()
         self.app.add_route('/alert', AlertRoute(self))
+        if self.subscriptions:
+            self.app.add_route('/notifications', NotificationRoute(self))
         wsgi_options = Adjustments(host=self.address, port=self.port)
         httpd = TcpWSGIServer(self.app, adj=wsgi_options)
         LOG.info("Serving on port {}...".format(str(self.port)))
+        # The first alerts to the known channels do not wait for their information
+        self.channel_info.prewarm(self.build_channel_info_url(resource) for resource in self.get_poll_resources())
         self.start_polling()
+        if self.subscriptions:
+            self.subscriptions.start()
         try:
             httpd.run()
         finally:
+            if self.subscriptions:
+                self.subscriptions.kill()
             self.stop_polling()
 
     def format_message(self, message, thread):
-        uid = uuid.uuid4().hex
         website = self.snooze_url
         one_message = message
         if len(message.get('messages', [])) == 1:
@@ -683,101 +440,54 @@ class TeamsPlugin(SnoozeBotPlugin):
             if from_message:
                 simple_message += from_message + '<br>'
             if message.get('reply'):
-                reply_text = SnoozeBotPlugin.date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format), message.get('reply'))
+                reply_text = format_dates(message.get('reply'), self.date_format, local=True)
                 simple_message += self._reply_to_html(reply_text)
             else:
                 record = message['record']
-                timestamp = SnoozeBotPlugin.date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format), record.get('timestamp', str(datetime.now().astimezone())))
+                timestamp = format_timestamp(record.get('timestamp', datetime.now().astimezone()), self.date_format)
                 msg = parse_emoji("::warning:: <b>New escalation</b> on {} ::warning::".format(timestamp))
                 if len(record.get('message', '')) > 0:
                     msg += '<br>{}'.format(record.get('message'))
                 simple_message += msg
             return {'body': {'content': simple_message, "contentType": "html"}}
+        messages = message['messages']
         if message.get('header'):
-            header = parse_emoji('::warning:: Received {} alerts ::warning::'.format(len(message['messages'])))
+            header = parse_emoji('::warning:: Received {} alerts ::warning::'.format(len(messages)))
         else:
             header = parse_emoji('::warning:: Received alert ::warning::')
-        footer_msg = ''
+        footer = ''
         if message.get('footer'):
-            footer_msg = 'Check all alerts in [Snoozeweb]({}/web)'.format(website)
-        elif len(message['messages']) == 1:
-            footer_msg = message['messages'][0]['msg']['record'].get('message', 'No message')
-        footer = Template(""",{
-                        "type": "TextBlock",
-                        "text": "$footer_msg",
-                        "wrap": true
-                    }""").substitute({'footer_msg': footer_msg})
-        timestamp = SnoozeBotPlugin.date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format), message['messages'][0]['msg']['record'].get('timestamp', datetime.now().astimezone()))
-        if len(message['messages']) == 1:
-            record = message['messages'][0]['msg']['record']
-            facts_list = [('Host', '[{}]({}/web/?#/record?tab=All&s=hash%3D{})'.format(record.get('host', 'Unknown'), website, record.get('hash'))), ('Source', record.get('source', 'Unknown')), ('Process', record.get('process', 'Unknown')), ('Severity', record.get('severity', 'Unknown'))]
-            facts = ','.join([Template('{"title": "$key", "value": "$value"}').substitute({'key': key, 'value': value}) for key, value in facts_list])
+            footer = 'Check all alerts in [Snoozeweb]({}/web)'.format(website)
+        elif len(messages) == 1:
+            footer = messages[0]['msg']['record'].get('message', 'No message')
+        timestamp = format_timestamp(messages[0]['msg']['record'].get('timestamp', datetime.now().astimezone()), self.date_format)
+        if len(messages) == 1:
+            record = messages[0]['msg']['record']
+            facts = [
+                fact('Host', record_link(website, record)),
+                fact('Source', record.get('source', 'Unknown')),
+                fact('Process', record.get('process', 'Unknown')),
+                fact('Severity', record.get('severity', 'Unknown')),
+            ]
         else:
-            messages = []
-            for message in message['messages']:
-                if message['msg'].get('record'):
-                    msg = {}
-                    msg['key'] = '[{}]({}/web/?#/record?tab=All&s=hash%3D{})'.format(message['msg']['record'].get('host', 'Unknown'), website, message['msg']['record'].get('hash'))
-                    if message['msg'].get('threads'):
-                        msg['key'] += ' (e)'
-                    msg['value'] = '[{source}] **{process}** {message}'.format(source=message['msg']['record'].get('source', 'Unknown'), process=message['msg']['record'].get('process', 'Unknown'), message=message['msg']['record'].get('message', ''))
-                    if message['msg'].get('from'):
-                        from_msg = 'From **{}**'.format(message['msg'].get('from'))
-                        if message['msg'].get('from_msg'):
-                            from_msg += ': {}'.format(message['msg'].get('from_msg'))
-                        msg['value'] += ' ({})'.format(from_msg)
-                    messages.append(Template('{"title": "$key", "value": "$value"}').substitute(msg))
-#            facts = ','.join(json.dumps(messages))
-            facts = ','.join(messages)
-        card = {
-            'body': {
-                'contentType': 'html',
-                'content': '<attachment id="{}"></attachment>{}'.format(uid, TeamsPlugin.BOT_MARKER)
-            },
-            'attachments': [{
-                'id': uid,
-                'contentType': 'application/vnd.microsoft.card.adaptive',
-                'contentUrl': None,
-                'content': Template('''{
-                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                    "type": "AdaptiveCard",
-                    "version": "1.4",
-                    "msteams": {
-                        "width": "full"
-                    },
-                    "body": [{
-                        "type": "ColumnSet",
-                        "columns": [{
-                            "type": "Column",
-                            "items": [{
-                                "type": "TextBlock",
-                                "weight": "Bolder",
-                                "text": "$header",
-                                "wrap": true
-                            },{
-                                "type": "TextBlock",
-                                "spacing": "None",
-                                "text": "$timestamp",
-                                "isSubtle": true,
-                                "wrap": true
-                            },{
-                                "type": "TextBlock",
-                                "spacing": "None",
-                                "text": "$from",
-                                "wrap": true
-                            }],
-                            "width": "stretch"
-                        }]},{
-                            "type": "FactSet",
-                            "facts": [$facts]
-                        }$footer]
-                }''').substitute({'schema': '$schema', 'header': header, 'footer': footer, 'timestamp': timestamp, 'facts': facts, 'from': from_message}),
-                'name': "Testing name",
-                'thumbnailUrl': None,
-                'teamsAppId': '5ef9989f-aeae-45d5-a672-10615a4819c9'
-            }]
-        }
-        LOG.info(card)
+            facts = []
+            for item in messages:
+                msg = item['msg']
+                record = msg.get('record')
+                if not record:
+                    continue
+                title = record_link(website, record)
+                if msg.get('threads'):
+                    title += ' (e)'
+                value = '[{}] **{}** {}'.format(record.get('source', 'Unknown'), record.get('process', 'Unknown'), record.get('message', ''))
+                if msg.get('from'):
+                    from_msg = 'From **{}**'.format(msg.get('from'))
+                    if msg.get('from_msg'):
+                        from_msg += ': {}'.format(msg.get('from_msg'))
+                    value += ' ({})'.format(from_msg)
+                facts.append(fact(title, value))
+        card = card_message(alert_card(header, timestamp, from_message, facts, footer), TeamsPlugin.BOT_MARKER)
+        LOG.debug(card)
         return card
 
     def format_flat_message(self, message, thread):
@@ -802,11 +512,11 @@ class TeamsPlugin(SnoozeBotPlugin):
             if from_message:
                 simple_message += from_message + '<br>'
             if message.get('reply'):
-                reply_text = SnoozeBotPlugin.date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format), message.get('reply'))
+                reply_text = format_dates(message.get('reply'), self.date_format, local=True)
                 simple_message += self._reply_to_html(reply_text)
             else:
                 record = message['record']
-                timestamp = SnoozeBotPlugin.date_regex.sub(lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format), record.get('timestamp', str(datetime.now().astimezone())))
+                timestamp = format_timestamp(record.get('timestamp', datetime.now().astimezone()), self.date_format)
                 msg = parse_emoji("::warning:: <b>New escalation</b> on {} ::warning::".format(timestamp))
                 if len(record.get('message', '')) > 0:
                     msg += '<br>{}'.format(record.get('message'))
@@ -833,10 +543,7 @@ class TeamsPlugin(SnoozeBotPlugin):
                 severity = html.escape(record.get('severity', 'Unknown'))
                 alert_message = html.escape(record.get('message', ''))
                 record_hash = record.get('hash', '')
-                timestamp = SnoozeBotPlugin.date_regex.sub(
-                    lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format),
-                    record.get('timestamp', str(datetime.now().astimezone()))
-                )
+                timestamp = format_timestamp(record.get('timestamp', datetime.now().astimezone()), self.date_format)
                 timestamp = html.escape(timestamp)
 
                 link = '<a href="{}/web/?#/record?tab=All&s=hash%3D{}">{}</a>'.format(website, record_hash, host)
@@ -872,10 +579,7 @@ class TeamsPlugin(SnoozeBotPlugin):
             severity = record.get('severity', 'Unknown')
             alert_message = record.get('message', '')
             record_hash = record.get('hash', '')
-            timestamp = SnoozeBotPlugin.date_regex.sub(
-                lambda m: parser.parse(m.group()).astimezone().strftime(self.date_format),
-                record.get('timestamp', str(datetime.now().astimezone()))
-            )
+            timestamp = format_timestamp(record.get('timestamp', datetime.now().astimezone()), self.date_format)
 
             link = '<a href="{}/web/?#/record?tab=All&s=hash%3D{}">{}</a>'.format(website, record_hash, host)
             escalation = ' (e)' if msg.get('threads') else ''
@@ -909,37 +613,63 @@ class TeamsPoller(threading.Thread):
         self._checkpoints = {}
         self._lookback = timedelta(seconds=self.plugin.poll_lookback_seconds)
         self._recent_ids_limit = 2000
-        self._global_recent_ids = []
-        self._global_recent_id_set = set()
+        self._global_recent_ids = RecentIds(self._recent_ids_limit)
+        self._watched = {}
+        self._no_delta = set()
+        # Resources are polled concurrently, each one at its own interval.
+        # The checkpoint and the watched roots of a resource are only read and changed under its lock,
+        # as the resource can be polled and notified at the same time
+        self._resource_locks = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._schedule = {}
+        self._polling = set()
 
     def _get_checkpoint(self, resource):
-        if resource in self._checkpoints:
+        '''
+        Checkpoint of a resource: messages created before `since` are already processed. It is saved
+        at the end of each cycle, with the messages processed during the cycle, so that a restart resumes
+        where the previous run stopped. The lookback only applies to the resources never polled before
+        '''
+        with self._lock:
+            if resource not in self._checkpoints:
+                self._checkpoints[resource] = self._load_checkpoint(resource)
             return self._checkpoints[resource]
+
+    def _load_checkpoint(self, resource):
+        since, seen = self.plugin.poll_state.get_checkpoint(resource)
+        if since is None:
+            since = datetime.now().astimezone() - self._lookback
+            restored = False
+        else:
+            since = datetime.fromtimestamp(since, timezone.utc)
+            restored = True
         checkpoint = {
-            'since': datetime.now().astimezone() - self._lookback,
-            'recent_ids': [],
-            'recent_id_set': set(),
+            'since': since,
+            'latest': since,
+            'restored': restored,
+            'recent_ids': RecentIds(self._recent_ids_limit, seen),
         }
-        self._checkpoints[resource] = checkpoint
         return checkpoint
 
-    def _remember_id(self, checkpoint, message_id):
-        if message_id in checkpoint['recent_id_set']:
-            return
-        checkpoint['recent_ids'].append(message_id)
-        checkpoint['recent_id_set'].add(message_id)
-        if len(checkpoint['recent_ids']) > self._recent_ids_limit:
-            old = checkpoint['recent_ids'].pop(0)
-            checkpoint['recent_id_set'].discard(old)
-
-    def _remember_global_id(self, message_id):
-        if message_id in self._global_recent_id_set:
-            return
-        self._global_recent_ids.append(message_id)
-        self._global_recent_id_set.add(message_id)
-        if len(self._global_recent_ids) > self._recent_ids_limit:
-            old = self._global_recent_ids.pop(0)
-            self._global_recent_id_set.discard(old)
+    def _resource_lock(self, resource):
+        with self._lock:
+            return self._resource_locks.setdefault(resource, threading.Lock())
+
+    def _save_checkpoint(self, resource, checkpoint, watched, now):
+        checkpoint['since'] = checkpoint['latest']
+        wall = time.time() - now
+        roots = [(root_id, entry['modified'], entry['interval'], entry['next'] + wall, entry['since'].timestamp())
+            for root_id, entry in watched.items()]
+        self.plugin.poll_state.set_checkpoint(resource, checkpoint['since'].timestamp(), roots)
+
+    def _restore_roots(self, resource, checkpoint, now):
+        wall = time.time() - now
+        watched = OrderedDict()
+        for root_id, modified, interval, next_poll, since in self.plugin.poll_state.get_roots(resource):
+            since = datetime.fromtimestamp(since, timezone.utc) if since is not None else checkpoint['since']
+            watched[root_id] = {'modified': modified, 'next': next_poll - wall, 'interval': interval, 'since': since}
+        return watched
 
     def _parse_graph_datetime(self, text):
         if not text:
@@ -949,67 +679,194 @@ class TeamsPoller(threading.Thread):
         except Exception:
             return None
 
+    def _changed_roots(self, resource, checkpoint):
+        '''Return the root messages of a resource changed since the previous cycle'''
+        if resource in self._no_delta:
+            return self.plugin.fetch_messages(resource)
+        delta_link = self.plugin.poll_state.get_delta(resource)
+        try:
+            roots, delta_link = self.plugin.fetch_delta(resource, delta_link, checkpoint['since'])
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if delta_link:
+                # Only an invalid or expired delta link is dropped: it is kept on throttling or transient errors
+                if status not in (400, 404, 410):
+                    raise
+                LOG.info("Delta link of %s rejected, starting a new delta query: %s", resource, e)
+                self.plugin.poll_state.set_delta(resource, None)
+                return self._changed_roots(resource, checkpoint)
+            if status not in (400, 403, 404, 501):
+                raise
+            LOG.info("Delta queries not supported for %s, polling its latest messages: %s", resource, e)
+            self._no_delta.add(resource)
+            return self.plugin.fetch_messages(resource)
+        self.plugin.poll_state.set_delta(resource, delta_link)
+        return roots
+
+    def _watch_root(self, watched, graph_message, checkpoint, now):
+        '''
+        Fetch the replies of a new or modified root at the next cycle.
+        Each root has its own checkpoint (`since`) for its replies: they can be fetched long after
+        newer roots moved the checkpoint of the resource
+        '''
+        root_id = graph_message.get('id')
+        if not root_id:
+            return
+        if graph_message.get('@removed'):
+            watched.pop(root_id, None)
+            return
+        modified = graph_message.get('lastModifiedDateTime')
+        entry = watched.get(root_id)
+        if entry is None or entry['modified'] != modified:
+            since = entry['since'] if entry else checkpoint['since']
+            watched[root_id] = {'modified': modified, 'next': now, 'interval': self.plugin.poll_interval_seconds, 'since': since}
+            watched.move_to_end(root_id)
+
     def _poll_resource(self, resource):
+        '''Process the new messages of a resource. Return True if there were any'''
         checkpoint = self._get_checkpoint(resource)
-        roots = self.plugin.fetch_messages(resource)
-        roots = sorted(roots, key=lambda m: m.get('createdDateTime', ''))
+        lock = self._resource_lock(resource)
+        now = time.monotonic()
+        roots = []
+        with lock:
+            first = resource not in self._watched
+            if first:
+                self._watched[resource] = self._restore_roots(resource, checkpoint, now)
+            watched = self._watched[resource]
+        if first and not checkpoint['restored']:
+            # Watch the latest roots at the first poll, where users may still reply to alerts posted before
+            roots = self.plugin.fetch_messages(resource)
+        roots = sorted(roots + self._changed_roots(resource, checkpoint), key=lambda m: m.get('createdDateTime', ''))
+        active = False
         for graph_message in roots:
-            self._process_graph_message(resource, graph_message, checkpoint)
-            root_id = graph_message.get('id')
-            if not root_id:
-                continue
+            if not graph_message.get('@removed'):
+                active = self._process_graph_message(resource, graph_message, checkpoint) or active
+            with lock:
+                self._watch_root(watched, graph_message, checkpoint, now)
+        with lock:
+            while len(watched) > self.plugin.poll_watch_roots:
+                watched.popitem(last=False)
+            due = [(root_id, entry) for root_id, entry in watched.items() if entry['next'] <= now]
+        # Replies do not always modify their root: the replies of the watched roots are also fetched
+        # periodically, less and less often while nobody replies
+        for root_id, entry in due:
             try:
                 replies = self.plugin.fetch_replies(resource, root_id)
             except Exception as e:
                 LOG.debug('Unable to fetch replies for %s in %s: %s', root_id, resource, e)
-                continue
+                replies = []
             replies = sorted(replies, key=lambda m: m.get('createdDateTime', ''))
-            for reply in replies:
-                self._process_graph_message(resource, reply, checkpoint)
-
-    def _process_graph_message(self, resource, graph_message, checkpoint):
+            replied = any([self._process_graph_message(resource, reply, checkpoint, entry) for reply in replies])
+            with lock:
+                if replied:
+                    entry['interval'] = self.plugin.poll_interval_seconds
+                    active = True
+                else:
+                    entry['interval'] = min(entry['interval'] * 2, self.plugin.poll_replies_max_interval)
+                entry['next'] = now + entry['interval']
+        with lock:
+            self._save_checkpoint(resource, checkpoint, watched, now)
+        return active
+
+    def _process_graph_message(self, resource, graph_message, checkpoint, root=None):
+        '''
+        Process a message of a resource. Return True if the message is new.
+        The replies of a watched root (`root`) are checked against the checkpoint of the root,
+        instead of the checkpoint of the resource
+        '''
         message_id = graph_message.get('id')
         if not message_id:
-            return
-        if message_id in self._global_recent_id_set:
-            return
-        if message_id in checkpoint['recent_id_set']:
-            return
+            return False
         created = self._parse_graph_datetime(graph_message.get('createdDateTime'))
-        if created and created <= checkpoint['since']:
-            self._remember_id(checkpoint, message_id)
-            self._remember_global_id(message_id)
-            return
-        self._remember_id(checkpoint, message_id)
-        self._remember_global_id(message_id)
-        checkpoint['since'] = max(checkpoint['since'], created) if created else checkpoint['since']
+        # Checked and remembered at once, so that a message polled and notified at the same time is processed once
+        with self._resource_lock(resource):
+            if message_id in checkpoint['recent_ids']:
+                return False
+            with self._lock:
+                if not self._global_recent_ids.add(message_id):
+                    return False
+            checkpoint['recent_ids'].add(message_id)
+            since = root['since'] if root else checkpoint['since']
+            if created and created <= since:
+                return False
+            if created and root:
+                root['since'] = max(root['since'], created)
+            elif created:
+                checkpoint['latest'] = max(checkpoint['latest'], created)
+            self.plugin.poll_state.add_seen(resource, message_id, created.timestamp() if created else None)
         if self.plugin.is_self_message(graph_message):
-            return
+            return True
         msg = self.plugin.normalize_incoming_message(graph_message)
         if not getattr(msg, 'text', '').strip():
-            return
+            return True
         try:
             response_text = self.plugin.process_user_message(msg)
             self.plugin.reply_to_polled_message(response_text, resource, graph_message)
         except Exception as e:
             LOG.exception("Failed to process polled message %s on %s: %s", message_id, resource, e)
+        return True
 
-    def run(self):
-        LOG.info("Starting Teams polling worker (interval=%ss)", self.plugin.poll_interval_seconds)
-        while not self._stop_event.is_set():
-            resources = self.plugin.get_poll_resources()
+    def wake(self, resource):
+        '''Poll a resource as soon as possible, at the shortest interval'''
+        with self._lock:
+            self._schedule[resource] = {'next': 0, 'interval': self.plugin.poll_interval_seconds}
+        self._wakeup.set()
+
+    def process_notification(self, resource, graph_message):
+        '''Process a message received by change notification instead of polling'''
+        checkpoint = self._get_checkpoint(resource)
+        with self._resource_lock(resource):
+            root = self._watched.get(resource, {}).get(graph_message.get('replyToId'))
+        self._process_graph_message(resource, graph_message, checkpoint, root)
+
+    def _poll_scheduled(self, resource):
+        try:
+            active = self._poll_resource(resource)
+        except Exception as e:
+            LOG.warning("Polling failed for %s: %s", resource, e)
+            active = False
+        with self._lock:
+            schedule = self._schedule.setdefault(resource, {'interval': self.plugin.poll_interval_seconds})
+            # Unless woken up while polling, active resources are polled at the shortest interval and idle ones back off
+            if schedule.get('next') != 0:
+                if active:
+                    schedule['interval'] = self.plugin.poll_interval_seconds
+                else:
+                    schedule['interval'] = min(max(schedule['interval'] * 2, 1), self.plugin.poll_idle_max_interval)
+                schedule['next'] = time.monotonic() + schedule['interval']
+            self._polling.discard(resource)
+        self._wakeup.set()
+
+    def _submit_due(self, executor):
+        '''Submit the resources due for polling, and return the seconds until the next one is due'''
+        now = time.monotonic()
+        wait = self.plugin.poll_idle_max_interval
+        resources = self.plugin.get_poll_resources()
+        subscriptions = self.plugin.subscriptions
+        with self._lock:
             for resource in resources:
-                if self._stop_event.is_set():
-                    break
-                try:
-                    self._poll_resource(resource)
-                except Exception as e:
-                    LOG.warning("Polling failed for %s: %s", resource, e)
-            self._stop_event.wait(self.plugin.poll_interval_seconds)
+                if resource in self._polling or (subscriptions and subscriptions.active(resource)):
+                    continue
+                schedule = self._schedule.setdefault(resource, {'next': now, 'interval': self.plugin.poll_interval_seconds})
+                if schedule['next'] > now:
+                    wait = min(wait, schedule['next'] - now)
+                    continue
+                self._polling.add(resource)
+                executor.submit(self._poll_scheduled, resource)
+        return wait
+
+    def run(self):
+        LOG.info("Starting Teams polling worker (interval=%ss, workers=%s)", self.plugin.poll_interval_seconds, self.plugin.poll_workers)
+        with ThreadPoolExecutor(max_workers=self.plugin.poll_workers, thread_name_prefix='teams-poll') as executor:
+            while not self._stop_event.is_set():
+                wait = self._submit_due(executor)
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
         LOG.info("Teams polling worker stopped")
 
     def kill(self):
         self._stop_event.set()
+        self._wakeup.set()
         self.join(timeout=5)
 
 class TeamsBot():
@@ -1058,6 +915,14 @@ class TeamsBot():
                 LOG.warning('Token is missing scopes (%s). Triggering re-authentication.', ', '.join(sorted(missing_scopes)))
             account.authenticate(scopes=scopes, redirect_uri='https://localhost')
         self.snoozebot.plugin.driver = account.teams()
+        config = self.snoozebot.config
+        self.snoozebot.plugin.graph = GraphClient(
+            o365_authorization(account.con),
+            concurrency=config.get('graph_concurrency', 16),
+            max_connections=config.get('graph_max_connections'),
+            http2=config.get('graph_http2', True),
+            timeout=config.get('graph_timeout', 30),
+        )
         try:
             me = account.con.get('https://graph.microsoft.com/v1.0/me').json()
             self.snoozebot.plugin.self_user_id = me.get('id', '')
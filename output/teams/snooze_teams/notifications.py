@@ -0,0 +1,209 @@
+'''
+Microsoft Graph change notifications of the channel messages.
+The bot subscribes to the messages of the polled resources, and Graph posts the new messages
+to the `/notifications` route of the daemon (`notification_url` must be its public HTTPS URL).
+Subscriptions expire after at most an hour and are renewed before. A resource is polled
+only while it has no working subscription.
+'''
+
+import logging
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import falcon
+
+LOG = logging.getLogger("snooze.teamschat.notifications")
+
+GRAPH_URL = 'https://graph.microsoft.com/beta'
+SUBSCRIBABLE = re.compile(r'^/(teams/[^/]+/channels/[^/]+|chats/[^/]+)/messages$')
+
+def subscription_resource(resource):
+    '''Return the Graph resource to subscribe to for a polled resource, or None if not supported'''
+    if resource.startswith(GRAPH_URL) and SUBSCRIBABLE.match(resource[len(GRAPH_URL):]):
+        return resource[len(GRAPH_URL):]
+    return None
+
+def graph_date(date):
+    return date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class NotificationRoute():
+    '''Validation of the notification URL, and change notifications'''
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def on_post(self, req, resp):
+        token = req.get_param('validationToken')
+        if token is not None:
+            # Graph checks the URL when creating a subscription: the token must be returned as is
+            resp.status = falcon.HTTP_200
+            resp.content_type = falcon.MEDIA_TEXT
+            resp.text = token
+            return
+        media = req.get_media(default_when_empty={})
+        notifications = media.get('value', []) if isinstance(media, dict) else []
+        self.plugin.subscriptions.receive(notifications)
+        # Graph expects an answer within 3 seconds: the messages are processed in the background
+        resp.status = falcon.HTTP_202
+
+class SubscriptionManager(threading.Thread):
+    '''Subscribe to the messages of the polled resources, and renew the subscriptions before they expire'''
+
+    def __init__(self, plugin, notification_url, lifetime=3300, renew_before=600):
+        super(SubscriptionManager, self).__init__(daemon=True)
+        self.plugin = plugin
+        self.notification_url = notification_url
+        self.lifetime = timedelta(seconds=lifetime)
+        self.renew_before = timedelta(seconds=renew_before)
+        # Notifications not sent with this secret are not from our subscriptions
+        self.client_state = secrets.token_urlsafe(32)
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.resources = {}
+        self.retry_at = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='teams-notifications')
+        self._stop_event = threading.Event()
+
+    def active(self, resource):
+        '''Return True if the new messages of a resource are notified'''
+        with self.lock:
+            subscription = self.subscriptions.get(resource)
+        return bool(subscription) and subscription['expiration'] > datetime.now(timezone.utc)
+
+    def subscribe(self, resource):
+        path = subscription_resource(resource)
+        expiration = datetime.now(timezone.utc) + self.lifetime
+        data = {
+            'changeType': 'created',
+            'notificationUrl': self.notification_url,
+            'lifecycleNotificationUrl': self.notification_url,
+            'resource': path,
+            'expirationDateTime': graph_date(expiration),
+            'clientState': self.client_state,
+        }
+        try:
+            subscription = self.plugin.graph.post('{}/subscriptions'.format(GRAPH_URL), data=data).json()
+        except Exception as e:
+            LOG.warning("Could not subscribe to the messages of %s, polling them: %s", resource, e)
+            self.drop(resource, retry=True)
+            return False
+        LOG.info("Subscribed to the messages of %s until %s", resource, graph_date(expiration))
+        with self.lock:
+            self.subscriptions[resource] = {'id': subscription['id'], 'expiration': expiration}
+            self.resources[subscription['id']] = resource
+        return True
+
+    def renew(self, resource):
+        with self.lock:
+            subscription = self.subscriptions.get(resource)
+        if not subscription:
+            return self.subscribe(resource)
+        expiration = datetime.now(timezone.utc) + self.lifetime
+        url = '{}/subscriptions/{}'.format(GRAPH_URL, subscription['id'])
+        try:
+            self.plugin.graph.patch(url, data={'expirationDateTime': graph_date(expiration)})
+        except Exception as e:
+            LOG.info("Could not renew the subscription of %s, subscribing again: %s", resource, e)
+            self.drop(resource)
+            return self.subscribe(resource)
+        with self.lock:
+            subscription['expiration'] = expiration
+        return True
+
+    def drop(self, resource, retry=False):
+        '''Forget the subscription of a resource, and poll it instead'''
+        with self.lock:
+            subscription = self.subscriptions.pop(resource, None)
+            if subscription:
+                self.resources.pop(subscription['id'], None)
+            if retry:
+                self.retry_at[resource] = datetime.now(timezone.utc) + self.renew_before
+        if self.plugin._poller:
+            self.plugin._poller.wake(resource)
+
+    def refresh(self):
+        '''Subscribe to the new resources, and renew the subscriptions about to expire'''
+        now = datetime.now(timezone.utc)
+        for resource in self.plugin.get_poll_resources():
+            if not subscription_resource(resource):
+                continue
+            with self.lock:
+                subscription = self.subscriptions.get(resource)
+                retry_at = self.retry_at.get(resource)
+            if subscription is None:
+                if retry_at is None or retry_at <= now:
+                    self.subscribe(resource)
+            elif subscription['expiration'] - now <= self.renew_before:
+                self.renew(resource)
+
+    def cleanup(self):
+        '''Delete the subscriptions left by a previous run: their notifications would be rejected'''
+        try:
+            subscriptions = self.plugin.graph.get('{}/subscriptions'.format(GRAPH_URL)).json().get('value', [])
+        except Exception as e:
+            LOG.debug("Could not list the subscriptions: %s", e)
+            return
+        for subscription in subscriptions:
+            if subscription.get('notificationUrl') == self.notification_url and subscription.get('id') not in self.resources:
+                self.unsubscribe(subscription['id'])
+
+    def unsubscribe(self, subscription_id):
+        try:
+            self.plugin.graph.delete('{}/subscriptions/{}'.format(GRAPH_URL, subscription_id))
+        except Exception as e:
+            LOG.debug("Could not delete the subscription %s: %s", subscription_id, e)
+
+    def receive(self, notifications):
+        '''Check the notifications, and process them in the background'''
+        for notification in notifications:
+            with self.lock:
+                resource = self.resources.get(notification.get('subscriptionId'))
+            if resource is None or not secrets.compare_digest(str(notification.get('clientState', '')), self.client_state):
+                LOG.warning("Ignoring a notification of unknown subscription %s", notification.get('subscriptionId'))
+                continue
+            event = notification.get('lifecycleEvent')
+            if event:
+                self.executor.submit(self.lifecycle, resource, event)
+            else:
+                self.executor.submit(self.deliver, resource, notification)
+
+    def lifecycle(self, resource, event):
+        LOG.info("Subscription of %s: %s", resource, event)
+        if event == 'reauthorizationRequired':
+            self.renew(resource)
+        elif event == 'subscriptionRemoved':
+            self.drop(resource)
+        elif self.plugin._poller:
+            # Missed notifications: the poller catches up from its checkpoint
+            self.plugin._poller.wake(resource)
+
+    def deliver(self, resource, notification):
+        url = '{}/{}'.format(GRAPH_URL, notification.get('resource', '').lstrip('/'))
+        try:
+            graph_message = self.plugin.graph_get(url).json()
+        except Exception as e:
+            LOG.warning("Could not fetch the notified message %s: %s", url, e)
+            if self.plugin._poller:
+                self.plugin._poller.wake(resource)
+            return
+        if self.plugin._poller:
+            self.plugin._poller.process_notification(resource, graph_message)
+
+    def run(self):
+        LOG.info("Receiving the Teams messages on %s", self.notification_url)
+        self.cleanup()
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(min(60, self.renew_before.total_seconds() / 2))
+        with self.lock:
+            subscription_ids = list(self.resources)
+        for subscription_id in subscription_ids:
+            self.unsubscribe(subscription_id)
+
+    def kill(self):
+        self._stop_event.set()
+        self.join(timeout=10)
+        self.executor.shutdown(wait=False)
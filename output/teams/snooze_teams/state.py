@@ -0,0 +1,105 @@
+'''State of the Teams poller, persisted in a SQLite database to survive restarts'''
+
+import logging
+import sqlite3
+import threading
+from collections import deque
+from pathlib import Path
+
+LOG = logging.getLogger("snooze.teamschat.state")
+
+class RecentIds:
+    '''The last `size` identifiers seen, in a ring buffer'''
+    def __init__(self, size=2000, ids=()):
+        self.size = size
+        self.order = deque()
+        self.ids = set()
+        for item in ids:
+            self.add(item)
+
+    def add(self, item):
+        '''Add an identifier, forgetting the oldest one if full. Return False if it was already there'''
+        if item in self.ids:
+            return False
+        if len(self.order) >= self.size:
+            self.ids.discard(self.order.popleft())
+        self.order.append(item)
+        self.ids.add(item)
+        return True
+
+    def __contains__(self, item):
+        return item in self.ids
+
+    def __len__(self):
+        return len(self.order)
+
+class PollState:
+    '''
+    Per polled resource: the delta link of the next changes, the checkpoint (date of the
+    last message processed), the messages processed since the checkpoint and the watched roots
+    '''
+    def __init__(self, path=':memory:'):
+        self.lock = threading.Lock()
+        if path != ':memory:':
+            try:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                self.db = sqlite3.connect(str(path), check_same_thread=False)
+            except (OSError, sqlite3.Error) as err:
+                LOG.warning("Could not open the poller state %s, keeping it in memory: %s", path, err)
+                path = ':memory:'
+        if path == ':memory:':
+            self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS delta (resource TEXT PRIMARY KEY, link TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS checkpoints (resource TEXT PRIMARY KEY, since REAL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS seen (resource TEXT, id TEXT, created REAL, PRIMARY KEY (resource, id))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS roots (resource TEXT, position INTEGER, id TEXT, modified TEXT, interval REAL, next REAL, since REAL)")
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(roots)")]
+            if 'since' not in columns:
+                self.db.execute("ALTER TABLE roots ADD COLUMN since REAL")
+
+    def get_delta(self, resource):
+        '''Return the delta link to get the next changes of a resource, or None'''
+        with self.lock:
+            row = self.db.execute("SELECT link FROM delta WHERE resource = ?", (resource,)).fetchone()
+        return row[0] if row else None
+
+    def set_delta(self, resource, link):
+        with self.lock, self.db:
+            if link:
+                self.db.execute("INSERT OR REPLACE INTO delta VALUES (?, ?)", (resource, link))
+            else:
+                self.db.execute("DELETE FROM delta WHERE resource = ?", (resource,))
+
+    def get_checkpoint(self, resource):
+        '''
+        Return the checkpoint of a resource (timestamp, or None if the resource was never polled),
+        and the identifiers of the messages processed after it
+        '''
+        with self.lock:
+            row = self.db.execute("SELECT since FROM checkpoints WHERE resource = ?", (resource,)).fetchone()
+            seen = self.db.execute("SELECT id FROM seen WHERE resource = ? ORDER BY created", (resource,)).fetchall()
+        return (row[0] if row else None), [message_id for message_id, in seen]
+
+    def add_seen(self, resource, message_id, created=None):
+        '''Save a message processed after the checkpoint'''
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO seen VALUES (?, ?, ?)", (resource, message_id, created))
+
+    def set_checkpoint(self, resource, since, roots=()):
+        '''
+        Save the checkpoint of a resource (timestamp), and its watched roots
+        (list of (identifier, last modification, interval, next poll timestamp, checkpoint of the replies))
+        '''
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", (resource, since))
+            self.db.execute("DELETE FROM seen WHERE resource = ? AND (created IS NULL OR created <= ?)", (resource, since))
+            self.db.execute("DELETE FROM roots WHERE resource = ?", (resource,))
+            self.db.executemany("INSERT INTO roots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(resource, position) + tuple(root) for position, root in enumerate(roots)])
+
+    def get_roots(self, resource):
+        '''Return the watched roots of a resource, as saved by `set_checkpoint`'''
+        with self.lock:
+            rows = self.db.execute("SELECT id, modified, interval, next, since FROM roots WHERE resource = ? ORDER BY position", (resource,)).fetchall()
+        return rows
@@ -0,0 +1,91 @@
+import itertools
+import re
+
+import falcon
+import falcon.testing
+import pytest
+import requests
+
+from snooze_teams.notifications import GRAPH_URL, NotificationRoute
+
+class GraphStub:
+    '''
+    Local stand-in for the Graph API of the subscriptions and channel messages.
+    Like Graph, it validates the notification URL when a subscription is created, and posts
+    the notifications of the new messages to it.
+    '''
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.app = falcon.App()
+        self.app.add_route('/notifications', NotificationRoute(plugin))
+        self.client = falcon.testing.TestClient(self.app)
+        self.subscriptions = {}
+        self.messages = {}
+        self.calls = []
+        self.failures = set()
+        self.ids = itertools.count(1)
+
+    def fail(self, status=500):
+        response = requests.Response()
+        response.status_code = status
+        raise requests.HTTPError(response=response)
+
+    def get(self, url):
+        self.calls.append(('GET', url))
+        if 'GET' in self.failures:
+            self.fail()
+        if url == GRAPH_URL + '/subscriptions':
+            return Response({'value': list(self.subscriptions.values())})
+        return Response(self.messages[url])
+
+    def post(self, url, data=None):
+        self.calls.append(('POST', url))
+        if 'POST' in self.failures:
+            self.fail()
+        token = 'token{}'.format(next(self.ids))
+        result = self.client.simulate_post('/notifications', params={'validationToken': token})
+        if result.status != falcon.HTTP_200 or result.text != token:
+            self.fail(400)
+        subscription = dict(data, id='sub{}'.format(next(self.ids)))
+        self.subscriptions[subscription['id']] = subscription
+        return Response(subscription)
+
+    def patch(self, url, data=None):
+        self.calls.append(('PATCH', url))
+        subscription_id = url.rsplit('/', 1)[-1]
+        if 'PATCH' in self.failures or subscription_id not in self.subscriptions:
+            self.fail(404)
+        self.subscriptions[subscription_id].update(data)
+        return Response(self.subscriptions[subscription_id])
+
+    def delete(self, url):
+        self.calls.append(('DELETE', url))
+        self.subscriptions.pop(url.rsplit('/', 1)[-1], None)
+        return Response({})
+
+    def notify(self, message, resource, client_state=None, **extra):
+        '''Post a new message to the subscribers of a resource, and return the HTTP status'''
+        match = re.match(r'^/teams/([^/]+)/channels/([^/]+)/messages$', resource)
+        path = "teams('{}')/channels('{}')/messages('{}')".format(match.group(1), match.group(2), message['id'])
+        self.messages['{}/{}'.format(GRAPH_URL, path)] = message
+        notifications = [dict({
+            'subscriptionId': subscription['id'],
+            'clientState': client_state or subscription['clientState'],
+            'changeType': 'created',
+            'resource': path,
+        }, **extra) for subscription in self.subscriptions.values() if subscription['resource'] == resource]
+        result = self.client.simulate_post('/notifications', json={'value': notifications})
+        # Wait for the notifications to be processed
+        self.plugin.subscriptions.executor.submit(lambda: None).result()
+        return result.status
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+@pytest.fixture
+def graph_stub():
+    return GraphStub
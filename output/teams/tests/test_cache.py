@@ -0,0 +1,106 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from snooze_teams.cache import MetadataCache
+from snooze_teams.main import TeamsPlugin
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class Loader:
+    def __init__(self, fail=False, delay=0):
+        self.calls = []
+        self.fail = fail
+        self.delay = delay
+
+    def __call__(self, key):
+        self.calls.append(key)
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError('Graph is down')
+        return '{}{}'.format(key, len(self.calls))
+
+def wait_loaded(cache):
+    while cache.loading:
+        time.sleep(0.001)
+
+def test_ttl():
+    clock, loader = FakeClock(), Loader()
+    cache = MetadataCache(loader, ttl=10, clock=clock)
+    assert cache.get('a') == 'a1'
+    assert cache.get('a') == 'a1'
+    assert loader.calls == ['a']
+    # Expired: the previous value is returned while reloading
+    clock.now += 11
+    assert cache.get('a') == 'a1'
+    wait_loaded(cache)
+    assert cache.get('a') == 'a2'
+
+def test_negative_ttl():
+    clock, loader = FakeClock(), Loader(fail=True)
+    cache = MetadataCache(loader, ttl=10, negative_ttl=2, clock=clock)
+    assert cache.get('a', 'default') == 'default'
+    assert cache.get('a') is None
+    assert loader.calls == ['a']
+    clock.now += 3
+    loader.fail = False
+    assert cache.get('a') == 'a2'
+
+def test_failed_reload_keeps_value():
+    clock, loader = FakeClock(), Loader()
+    cache = MetadataCache(loader, ttl=10, negative_ttl=2, clock=clock)
+    cache.get('a')
+    clock.now += 11
+    loader.fail = True
+    cache.get('a')
+    wait_loaded(cache)
+    assert cache.get('a') == 'a1'
+    assert len(loader.calls) == 2
+
+def test_single_flight():
+    loader = Loader(delay=0.05)
+    cache = MetadataCache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('a'))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['a1'] * 10
+    assert loader.calls == ['a']
+
+def test_size():
+    loader = Loader()
+    cache = MetadataCache(loader, size=2)
+    cache.get('a')
+    cache.get('b')
+    cache.get('a')
+    cache.get('c')
+    assert list(cache.entries) == ['a', 'c']
+
+def test_prewarm():
+    loader = Loader()
+    cache = MetadataCache(loader)
+    cache.prewarm(['a', 'b'])
+    for _ in range(100):
+        if len(cache) == 2 and not cache.loading:
+            break
+        time.sleep(0.01)
+    assert sorted(loader.calls) == ['a', 'b']
+
+def test_channel_layout():
+    plugin = TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:'}, client=object())
+    calls = []
+    def get(url):
+        calls.append(url)
+        return SimpleNamespace(json=lambda: {'layoutType': 'chat'})
+    plugin.graph = SimpleNamespace(get=get)
+    assert plugin.get_channel_layout('teams/t1/channels/19:c1') == 'chat'
+    # Same channel, as a poll resource
+    assert plugin.get_channel_layout(plugin.normalize_poll_resource('teams/t1/channels/19:c1')) == 'chat'
+    assert calls == ['https://graph.microsoft.com/beta/teams/t1/channels/19:c1@thread.tacv2']
@@ -0,0 +1,46 @@
+import json
+
+from snooze_teams.cards import alert_card, card_message, format_timestamp
+from snooze_teams.main import TeamsPlugin
+
+def plugin():
+    return TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:', 'snooze_url': 'http://snooze', 'date_format': '%Y-%m-%d'}, client=object())
+
+def record(name, message='Disk full'):
+    return {'host': name, 'hash': 'h' + name, 'source': 'syslog', 'process': 'kernel', 'severity': 'err',
+        'message': message, 'timestamp': '2024-01-02T03:04:05+0000'}
+
+def batch(records, header=False, footer=False):
+    return {'header': header, 'footer': footer, 'messages': [{'msg': {'record': r}} for r in records]}
+
+def card_of(message):
+    attachment = message['attachments'][0]
+    assert attachment['id'] in message['body']['content']
+    return json.loads(attachment['content'])
+
+def test_single_alert():
+    card = card_of(plugin().format_message(batch([record('web1')]), {}))
+    header = card['body'][0]['columns'][0]['items']
+    assert header[1]['text'].startswith('2024-01')
+    assert card['body'][1]['facts'][0] == {'title': 'Host', 'value': '[web1](http://snooze/web/?#/record?tab=All&s=hash%3Dhweb1)'}
+    assert card['body'][2]['text'] == 'Disk full'
+
+def test_quotes_in_messages():
+    message = 'He said "stop" \\ {now}\nand left'
+    card = card_of(plugin().format_message(batch([record('a', message), record('b', message)], header=True), {}))
+    assert card['body'][1]['facts'][0]['value'] == '[syslog] **kernel** ' + message
+    assert card['body'][0]['columns'][0]['items'][0]['text'].endswith('Received 2 alerts ⚠️')
+
+def test_footer():
+    card = card_of(plugin().format_message(batch([record('a'), record('b')], header=True, footer=True), {}))
+    assert card['body'][2]['text'] == 'Check all alerts in [Snoozeweb](http://snooze/web)'
+
+def test_card_message_valid_json():
+    card = alert_card('header', 'now', '', [])
+    first, second = card_message(card), card_message(card)
+    assert json.loads(first['attachments'][0]['content']) == card
+    assert first['attachments'][0]['id'] != second['attachments'][0]['id']
+
+def test_format_timestamp():
+    assert format_timestamp('2024-06-02T03:04:05+0000', '%Y') == '2024'
+    assert format_timestamp('not a date', '%Y') == 'not a date'
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+from snooze_teams.graph import GraphClient
+from snooze_teams.main import TeamsPlugin
+
+class Graph:
+    '''Graph answering the requests with a valid token, and counting the concurrent requests'''
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.token = 'Bearer token1'
+        self.requests = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        if request.headers.get('Authorization') != self.token:
+            return httpx.Response(401, json={'error': {'code': 'InvalidAuthenticationToken'}})
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        if request.url.path.endswith('/throttled'):
+            return httpx.Response(429, headers={'Retry-After': '7'})
+        if request.method == 'POST':
+            return httpx.Response(201, json={'id': '1', 'posted': json.loads(request.content)})
+        return httpx.Response(200, json={'value': []})
+
+class Authorization:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, refresh=False):
+        self.calls.append(refresh)
+        return 'Bearer token{}'.format(len(self.calls))
+
+def client(graph, authorization=None, **options):
+    return GraphClient(authorization or Authorization(), transport=httpx.MockTransport(graph), **options)
+
+def test_requests():
+    graph = Graph()
+    graph_client = client(graph)
+    assert graph_client.get('https://graph.microsoft.com/beta/teams').json() == {'value': []}
+    assert graph_client.post('https://graph.microsoft.com/beta/teams/t1/messages', data={'body': 'a"b'}).json()['posted'] == {'body': 'a"b'}
+    assert len(graph.requests) == 2
+    graph_client.close()
+
+def test_errors():
+    graph_client = client(Graph())
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        graph_client.get('https://graph.microsoft.com/beta/throttled')
+    assert error.value.response.status_code == 429
+    assert error.value.response.headers['Retry-After'] == '7'
+    graph_client.close()
+
+def test_token_refresh():
+    graph, authorization = Graph(), Authorization()
+    graph_client = client(graph, authorization)
+    graph_client.get('https://graph.microsoft.com/beta/teams')
+    # The token expired: it is refreshed once by the concurrent requests
+    graph.token = 'Bearer token2'
+    futures = [graph_client.submit('GET', 'https://graph.microsoft.com/beta/teams') for _ in range(5)]
+    assert [future.result().status_code for future in futures] == [200] * 5
+    assert authorization.calls == [False, True]
+    graph_client.close()
+
+def test_concurrency():
+    graph = Graph(delay=0.02)
+    graph_client = client(graph, concurrency=3)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(graph_client.get('https://graph.microsoft.com/beta/teams')))
+        for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 10
+    assert graph.max_running == 3
+    graph_client.close()
+
+def test_delivery():
+    graph = Graph()
+    throttled = []
+    async def handler(request):
+        if request.method == 'POST' and not throttled:
+            throttled.append(request)
+            return httpx.Response(429, headers={'Retry-After': '0'})
+        return await graph(request)
+    plugin = TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:', 'delivery_backoff': 0}, client=object())
+    plugin.graph = client(handler)
+    # Throttled once, then posted in the background
+    future = plugin.deliver({'reply': 'Done'}, channel_id='teams/t1/channels/19:c1', thread={'thread_id': '1'}, layout_type='post')
+    assert future.result(5)['id'] == '1'
+    assert len(throttled) == 1
+    assert graph.requests[-1].url.path.endswith('/19:c1@thread.tacv2/messages/1/replies')
+    plugin.graph.close()
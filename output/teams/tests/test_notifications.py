@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+import falcon
+
+from snooze_teams.main import TeamsPlugin, TeamsPoller
+from snooze_teams.notifications import subscription_resource
+
+RESOURCE = 'teams/t1/channels/19:c1'
+PATH = '/teams/t1/channels/19:c1@thread.tacv2/messages'
+
+class Executor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, resource):
+        self.submitted.append(resource)
+
+def setup(graph_stub):
+    plugin = TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:', 'poll_requests_per_second': 0,
+        'notification_url': 'https://bot.example.com/notifications', 'poll_resources': [RESOURCE]}, client=object())
+    graph = graph_stub(plugin)
+    plugin.graph = graph
+    plugin._poller = TeamsPoller(plugin)
+    processed = []
+    plugin.process_user_message = lambda msg: processed.append(msg.text) or ''
+    plugin.reply_to_polled_message = lambda *args: None
+    return plugin, graph, processed
+
+def message(message_id, text='ack'):
+    return {'id': message_id, 'createdDateTime': '2999-01-01T00:00:00Z', 'body': {'content': text},
+        'from': {'user': {'displayName': 'john'}}}
+
+def polled(plugin):
+    executor = Executor()
+    plugin._poller._schedule.clear()
+    plugin._poller._submit_due(executor)
+    return executor.submitted
+
+def test_subscription_resource():
+    plugin = TeamsPlugin({'thread_index': ':memory:', 'poll_state': ':memory:'}, client=object())
+    assert subscription_resource(plugin.normalize_poll_resource(RESOURCE)) == PATH
+    assert subscription_resource('https://graph.microsoft.com/beta/chats/19:abc/messages') == '/chats/19:abc/messages'
+    assert subscription_resource('https://graph.microsoft.com/beta/teams/t1/channels/19:c1/messages/1/replies') is None
+
+def test_notifications(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    resource = plugin.normalize_poll_resource(RESOURCE)
+    assert polled(plugin) == [resource]
+    plugin.subscriptions.refresh()
+    assert plugin.subscriptions.active(resource)
+    assert list(graph.subscriptions.values())[0]['resource'] == PATH
+    # Notified resources are not polled
+    assert polled(plugin) == []
+    assert graph.notify(message('1'), PATH) == falcon.HTTP_202
+    assert processed == ['ack']
+    # Same message notified twice
+    graph.notify(message('1'), PATH)
+    assert processed == ['ack']
+
+def test_invalid_notifications(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    plugin.subscriptions.refresh()
+    assert graph.notify(message('1'), PATH, client_state='forged') == falcon.HTTP_202
+    graph.subscriptions['unknown'] = dict(list(graph.subscriptions.values())[0], id='unknown')
+    graph.subscriptions.pop(next(iter(plugin.subscriptions.resources)))
+    graph.notify(message('2'), PATH)
+    assert processed == []
+    assert graph.client.simulate_post('/notifications', body='not json', headers={'Content-Type': 'application/json'}).status == falcon.HTTP_400
+
+def test_renew(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    resource = plugin.normalize_poll_resource(RESOURCE)
+    plugin.subscriptions.refresh()
+    subscription = plugin.subscriptions.subscriptions[resource]
+    subscription['expiration'] = datetime.now(timezone.utc) + timedelta(seconds=60)
+    plugin.subscriptions.refresh()
+    assert graph.calls[-1] == ('PATCH', 'https://graph.microsoft.com/beta/subscriptions/' + subscription['id'])
+    assert subscription['expiration'] > datetime.now(timezone.utc) + timedelta(minutes=50)
+    # The subscription was deleted by Graph: subscribe again
+    graph.subscriptions.clear()
+    subscription['expiration'] = datetime.now(timezone.utc)
+    plugin.subscriptions.refresh()
+    assert plugin.subscriptions.active(resource)
+    assert plugin.subscriptions.subscriptions[resource]['id'] != subscription['id']
+
+def test_fallback_to_polling(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    resource = plugin.normalize_poll_resource(RESOURCE)
+    graph.failures.add('POST')
+    plugin.subscriptions.refresh()
+    assert not plugin.subscriptions.active(resource)
+    assert polled(plugin) == [resource]
+    # Not retried before a while
+    plugin.subscriptions.refresh()
+    assert [call for call in graph.calls if call[0] == 'POST'] == [('POST', 'https://graph.microsoft.com/beta/subscriptions')]
+
+def test_subscription_removed(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    resource = plugin.normalize_poll_resource(RESOURCE)
+    plugin.subscriptions.refresh()
+    graph.notify(message('1'), PATH, lifecycleEvent='subscriptionRemoved')
+    assert processed == []
+    assert not plugin.subscriptions.active(resource)
+    assert polled(plugin) == [resource]
+
+def test_cleanup(graph_stub):
+    plugin, graph, processed = setup(graph_stub)
+    graph.subscriptions['old'] = {'id': 'old', 'notificationUrl': 'https://bot.example.com/notifications'}
+    graph.subscriptions['other'] = {'id': 'other', 'notificationUrl': 'https://other.example.com/notifications'}
+    plugin.subscriptions.cleanup()
+    assert list(graph.subscriptions) == ['other']
@@ -0,0 +1,278 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import requests
+
+from snooze_teams.main import TeamsPlugin, TeamsPoller
+from snooze_teams.state import RecentIds
+
+RESOURCE = 'teams/t1/channels/19:c1'
+MESSAGES = 'https://graph.microsoft.com/beta/teams/t1/channels/19:c1@thread.tacv2/messages'
+
+class FakeGraph:
+    '''Channel messages of Graph: `pages` maps the URLs to their JSON response'''
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def get(self, url):
+        self.calls.append(url)
+        page = self.pages.get(url.split('?')[0])
+        if isinstance(page, int):
+            response = requests.Response()
+            response.status_code = page
+            raise requests.HTTPError(response=response)
+        return SimpleNamespace(json=lambda: page if page is not None else {'value': []})
+
+def message(message_id, created='2020-01-01T00:00:00Z', modified=None):
+    return {'id': message_id, 'createdDateTime': created, 'lastModifiedDateTime': modified or created,
+        'body': {'content': 'ack'}, 'from': {'user': {'displayName': 'john'}}}
+
+def poller(pages, **config):
+    plugin = TeamsPlugin(dict({'thread_index': ':memory:', 'poll_state': ':memory:', 'poll_requests_per_second': 0}, **config), client=object())
+    plugin.graph = FakeGraph(pages)
+    return TeamsPoller(plugin)
+
+def replies_calls(graph):
+    return [url for url in graph.calls if url.endswith('/replies')]
+
+def test_replies_of_changed_roots():
+    roots = [message('1'), message('2')]
+    pages = {
+        MESSAGES: {'value': roots},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+        'https://delta/1': {'value': [message('2', modified='2020-01-02T00:00:00Z')], '@odata.deltaLink': 'https://delta/2'},
+    }
+    poll = poller(pages)
+    graph = poll.plugin.graph
+    poll._poll_resource(poll.plugin.normalize_poll_resource(RESOURCE))
+    # Startup: the latest roots are watched
+    assert sorted(replies_calls(graph)) == [MESSAGES + '/1/replies', MESSAGES + '/2/replies']
+    assert graph.calls[1].startswith(MESSAGES + '/delta?$filter=lastModifiedDateTime%20gt%20')
+    graph.calls.clear()
+    poll._poll_resource(poll.plugin.normalize_poll_resource(RESOURCE))
+    # Only the modified root, with the saved delta link
+    assert graph.calls == ['https://delta/1', MESSAGES + '/2/replies']
+    assert poll.plugin.poll_state.get_delta(poll.plugin.normalize_poll_resource(RESOURCE)) == 'https://delta/2'
+
+def test_quiet_roots_back_off():
+    pages = {
+        MESSAGES: {'value': [message('1')]},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+        'https://delta/1': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+    }
+    poll = poller(pages, poll_interval_seconds=0, poll_replies_max_interval=3600)
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll._poll_resource(resource)
+    poll._poll_resource(resource)
+    entry = poll._watched[resource]['1']
+    assert entry['interval'] == 0
+    entry['interval'] = 10
+    poll._poll_resource(resource)
+    entry['next'] = 0
+    poll._poll_resource(resource)
+    assert entry['interval'] == 40
+    graph = poll.plugin.graph
+    graph.calls.clear()
+    poll._poll_resource(resource)
+    assert replies_calls(graph) == []
+
+def test_expired_delta_link():
+    pages = {
+        MESSAGES: {'value': []},
+        MESSAGES + '/delta': {'value': [message('3')], '@odata.deltaLink': 'https://delta/2'},
+        'https://delta/1': 410,
+    }
+    poll = poller(pages)
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll.plugin.poll_state.set_delta(resource, 'https://delta/1')
+    poll._poll_resource(resource)
+    assert poll.plugin.poll_state.get_delta(resource) == 'https://delta/2'
+    assert '3' in poll._watched[resource]
+
+def test_delta_not_supported():
+    pages = {
+        MESSAGES: {'value': [message('1')]},
+        MESSAGES + '/delta': 400,
+    }
+    poll = poller(pages)
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll._poll_resource(resource)
+    poll._poll_resource(resource)
+    graph = poll.plugin.graph
+    assert len([url for url in graph.calls if '/delta' in url]) == 1
+    assert resource in poll._no_delta
+    # The root did not change: its replies are not fetched again yet
+    assert replies_calls(graph) == [MESSAGES + '/1/replies']
+
+def test_throttled():
+    pages = {MESSAGES: 429}
+    poll = poller(pages)
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll._poll_scheduled(resource)
+    # Every Graph request waits for the Retry-After (the poll interval by default)
+    assert poll.plugin.graph_limiter.paused_until > time.monotonic() + 5
+    assert poll._schedule[resource]['interval'] == 20
+
+def test_adaptive_intervals():
+    pages = {
+        MESSAGES: {'value': []},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+        'https://delta/1': {'value': [message('1', created='2999-01-01T00:00:00Z')], '@odata.deltaLink': 'https://delta/2'},
+        'https://delta/2': {'value': [], '@odata.deltaLink': 'https://delta/2'},
+    }
+    poll = poller(pages, poll_idle_max_interval=30)
+    poll.plugin.process_user_message = lambda msg: ''
+    poll.plugin.reply_to_polled_message = lambda *args: None
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    intervals = []
+    for _ in range(4):
+        poll._poll_scheduled(resource)
+        intervals.append(poll._schedule[resource]['interval'])
+    assert intervals == [20, 10, 20, 30]
+    poll.wake(resource)
+    assert poll._schedule[resource] == {'next': 0, 'interval': 10}
+
+def test_concurrent_resources():
+    slow = threading.Event()
+    other = 'teams/t2/channels/19:c2'
+    poll = poller({}, poll_resources=[RESOURCE, other])
+    polled = []
+    def poll_resource(resource):
+        if resource == poll.plugin.normalize_poll_resource(RESOURCE):
+            slow.wait(5)
+        polled.append(resource)
+        return False
+    poll._poll_resource = poll_resource
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        poll._submit_due(executor)
+        # The slow resource is not polled twice, and does not delay the other one
+        poll._submit_due(executor)
+        for _ in range(50):
+            if polled:
+                break
+            time.sleep(0.01)
+        assert polled == [poll.plugin.normalize_poll_resource(other)]
+        slow.set()
+
+def test_recent_ids():
+    recent = RecentIds(3, ['a', 'b'])
+    assert recent.add('c')
+    assert not recent.add('a')
+    assert recent.add('d')
+    assert 'a' not in recent
+    assert list(recent.order) == ['b', 'c', 'd']
+
+def test_restart(tmp_path):
+    pages = {
+        MESSAGES: {'value': [message('1')]},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+        'https://delta/1': {'value': [message('2', created='2999-01-01T00:00:00Z')], '@odata.deltaLink': 'https://delta/2'},
+        'https://delta/2': {'value': [], '@odata.deltaLink': 'https://delta/2'},
+    }
+    processed = []
+    def start():
+        poll = poller(pages, poll_state=str(tmp_path / 'state.sqlite'))
+        poll.plugin.process_user_message = lambda msg: processed.append(msg) or ''
+        poll.plugin.reply_to_polled_message = lambda *args: None
+        return poll
+    poll = start()
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll._poll_resource(resource)
+    poll._poll_resource(resource)
+    assert len(processed) == 1
+    # The command is not processed again, and the latest messages are not fetched again
+    poll = start()
+    graph = poll.plugin.graph
+    assert poll._get_checkpoint(resource)['since'].year == 2999
+    poll._poll_resource(resource)
+    assert len(processed) == 1
+    assert graph.calls == ['https://delta/2']
+    assert list(poll._watched[resource]) == ['1', '2']
+
+def test_crash_during_cycle():
+    poll = poller({})
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll.plugin.process_user_message = lambda msg: ''
+    poll.plugin.reply_to_polled_message = lambda *args: None
+    checkpoint = poll._get_checkpoint(resource)
+    assert poll._process_graph_message(resource, message('3', created='2999-01-01T00:00:00Z'), checkpoint)
+    # Processed but the cycle did not end: the message is saved, not the checkpoint
+    poll = TeamsPoller(poll.plugin)
+    checkpoint = poll._get_checkpoint(resource)
+    assert not checkpoint['restored']
+    assert not poll._process_graph_message(resource, message('3', created='2999-01-01T00:00:00Z'), checkpoint)
+
+def test_reply_to_older_root():
+    def posted(message_id, created):
+        return dict(message(message_id, created=created), body={'content': message_id})
+    pages = {
+        MESSAGES: {'value': []},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/1'},
+        'https://delta/1': {'value': [posted('A', '2999-01-01T00:00:00Z')], '@odata.deltaLink': 'https://delta/2'},
+        'https://delta/2': {'value': [posted('B', '2999-01-03T00:00:00Z')], '@odata.deltaLink': 'https://delta/3'},
+        'https://delta/3': {'value': [], '@odata.deltaLink': 'https://delta/3'},
+    }
+    poll = poller(pages)
+    processed = []
+    poll.plugin.process_user_message = lambda msg: processed.append(msg.text) or ''
+    poll.plugin.reply_to_polled_message = lambda *args: None
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll._poll_resource(resource)
+    poll._poll_resource(resource)
+    # The replies of A are backed off while a newer root B is posted
+    poll._watched[resource]['A']['next'] = time.monotonic() + 3600
+    poll._poll_resource(resource)
+    pages[MESSAGES + '/A/replies'] = {'value': [posted('X', '2999-01-02T00:00:00Z')]}
+    poll._watched[resource]['A']['next'] = 0
+    poll._poll_resource(resource)
+    assert processed == ['A', 'B', 'X']
+    # Not processed again, even after a restart
+    poll._watched[resource]['A']['next'] = 0
+    poll._poll_resource(resource)
+    restarted = TeamsPoller(poll.plugin)
+    restarted._poll_resource(resource)
+    restarted._watched[resource]['A']['next'] = 0
+    restarted._poll_resource(resource)
+    assert processed == ['A', 'B', 'X']
+
+def test_throttled_delta_link_kept():
+    pages = {
+        MESSAGES: {'value': []},
+        MESSAGES + '/delta': {'value': [], '@odata.deltaLink': 'https://delta/2'},
+        'https://delta/1': 429,
+    }
+    poll = poller(pages)
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    poll.plugin.poll_state.set_delta(resource, 'https://delta/1')
+    try:
+        poll._changed_roots(resource, poll._get_checkpoint(resource))
+    except requests.HTTPError as error:
+        assert error.response.status_code == 429
+    else:
+        raise AssertionError("The throttling error was not raised")
+    assert poll.plugin.poll_state.get_delta(resource) == 'https://delta/1'
+    assert not [url for url in poll.plugin.graph.calls if '/delta?' in url]
+
+def test_polled_and_notified_at_once():
+    poll = poller({})
+    resource = poll.plugin.normalize_poll_resource(RESOURCE)
+    processed = []
+    poll.plugin.process_user_message = lambda msg: processed.append(msg.text) or ''
+    poll.plugin.reply_to_polled_message = lambda *args: None
+    barrier = threading.Barrier(8)
+    def receive(index):
+        barrier.wait(5)
+        graph_message = message('1', created='2999-01-01T00:00:00Z')
+        if index % 2:
+            poll.process_notification(resource, graph_message)
+        else:
+            poll._process_graph_message(resource, graph_message, poll._get_checkpoint(resource))
+    threads = [threading.Thread(target=receive, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert processed == ['ack']